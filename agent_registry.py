@@ -0,0 +1,206 @@
+# Реестр агентов из таблицы agent_types с горячей перезагрузкой
+# DB-driven agent registry with precompiled prompts and routing, swapped atomically
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from knowledge_events import on_knowledge_change
+from knowledge_snapshot import split_keywords
+from routing import RoutingEngine
+
+logger = logging.getLogger(__name__)
+
+PROMPT_LANGUAGES = ('ru', 'kz', 'en')
+
+
+class AgentDefinition(NamedTuple):
+    """Immutable configuration of one agent; equal definitions reuse the built agent"""
+    type_code: str
+    name: Optional[str] = None
+    description: Optional[str] = None
+    prompts: Tuple[Tuple[str, str], ...] = ()  # (language, prompt), only non-empty ones
+    keywords: Tuple[str, ...] = ()  # Empty: the agent class keeps its own keywords
+    priority: int = 1
+
+
+class RegistryState:
+    """One immutable generation of agents and the routing automaton built over them"""
+
+    def __init__(self, definitions: Tuple[AgentDefinition, ...], agents: Tuple[Any, ...],
+                 routing: RoutingEngine, version: int, watermark: Tuple[Any, int]):
+        self.definitions = definitions
+        self.agents = agents
+        self.by_type = {agent.agent_type: agent for agent in agents}
+        self.routing = routing
+        self.version = version
+        self.watermark = watermark
+        self.loaded_at = time.time()
+
+
+class AgentRegistry:
+    """Builds agents from active AgentType rows and rebuilds them when rows change.
+
+    A rebuild constructs only agents whose definition changed and recompiles
+    the routing automaton only when routing specs changed; everything else is
+    carried over. Readers keep the previous state until the new one is swapped
+    in, and only one thread rebuilds while the others keep serving."""
+
+    def __init__(self, factory: Callable[[AgentDefinition], Any],
+                 defaults: Callable[[], List[AgentDefinition]],
+                 refresh_interval: float = 30):
+        self.factory = factory
+        self.defaults = defaults
+        self.refresh_interval = refresh_interval
+        self._state: Optional[RegistryState] = None
+        self._version = 0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'reloads': 0, 'agents_built': 0, 'agents_reused': 0,
+                      'routing_builds': 0, 'errors': 0}
+        on_knowledge_change(self._on_change)
+
+    def _on_change(self, tables: Set[str]):
+        if 'agent_types' in tables:
+            self.invalidate()
+
+    def invalidate(self):
+        self._version += 1
+
+    def after_fork(self):
+        """Keep the inherited agents, drop the lock and recheck the table soon"""
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+
+    def _fresh(self, state: Optional[RegistryState], now: float) -> bool:
+        return (state is not None and state.version == self._version
+                and now - self._checked_at < self.refresh_interval)
+
+    def stale(self) -> bool:
+        """True when the next state() call would query the database"""
+        return not self._fresh(self._state, time.monotonic())
+
+    def state(self) -> RegistryState:
+        state = self._state
+        now = time.monotonic()
+        if self._fresh(state, now):
+            return state
+
+        # Only the first load waits; later rebuilds never block readers
+        if not self._lock.acquire(blocking=state is None):
+            return state
+        try:
+            state = self._state
+            version = self._version
+            if state is not None and state.version == version:
+                if now - self._checked_at < self.refresh_interval:
+                    return state
+                self._checked_at = now
+                watermark = self._run_in_app_context(self._watermark)
+                if watermark == state.watermark:
+                    return state
+            self._state = self._build(version)
+            self._checked_at = now
+            return self._state
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Error refreshing agent registry: {str(e)}")
+            if self._state is None:
+                self._state = self._assemble(tuple(self.defaults()), version, (None, 0))
+            self._checked_at = now
+            return self._state
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _run_in_app_context(func):
+        from flask import has_app_context
+        if has_app_context():
+            return func()
+        from app import app
+        with app.app_context():
+            return func()
+
+    def _watermark(self) -> Tuple[Any, int]:
+        from models import AgentType, db
+
+        latest, total = db.session.query(
+            db.func.max(AgentType.updated_at),
+            db.func.count(AgentType.id)
+        ).one()
+        return latest, total
+
+    def _load_definitions(self) -> Tuple[Tuple[AgentDefinition, ...], Tuple[Any, int]]:
+        from models import AgentType
+
+        watermark = self._watermark()
+        rows = AgentType.query.with_entities(
+            AgentType.type_code,
+            AgentType.name_ru,
+            AgentType.description_ru,
+            AgentType.system_prompt_ru,
+            AgentType.system_prompt_kz,
+            AgentType.system_prompt_en,
+            AgentType.keywords,
+            AgentType.priority
+        ).filter(AgentType.is_active == True).order_by(
+            AgentType.priority.asc(), AgentType.id.asc()
+        ).all()
+
+        definitions = tuple(AgentDefinition(
+            type_code=row.type_code,
+            name=row.name_ru,
+            description=row.description_ru,
+            prompts=tuple((language, prompt.strip()) for language, prompt in zip(
+                PROMPT_LANGUAGES, (row.system_prompt_ru, row.system_prompt_kz, row.system_prompt_en))
+                if prompt and prompt.strip()),
+            keywords=split_keywords(row.keywords),
+            priority=row.priority if row.priority is not None else 1
+        ) for row in rows)
+        return definitions, watermark
+
+    def _build(self, version: int) -> RegistryState:
+        definitions, watermark = self._run_in_app_context(self._load_definitions)
+        if not definitions:
+            # Empty table (not seeded yet): the built-in agents
+            definitions = tuple(self.defaults())
+        state = self._assemble(definitions, version, watermark)
+        self.stats['reloads'] += 1
+        logger.info(f"Agent registry v{version} loaded: {', '.join(state.by_type)}")
+        return state
+
+    def _assemble(self, definitions: Tuple[AgentDefinition, ...], version: int,
+                  watermark: Tuple[Any, int]) -> RegistryState:
+        previous = self._state
+        reusable = {}
+        if previous is not None:
+            reusable = {definition: previous.by_type[definition.type_code]
+                        for definition in previous.definitions}
+
+        agents = []
+        for definition in definitions:
+            agent = reusable.get(definition)
+            if agent is None:
+                agent = self.factory(definition)
+                self.stats['agents_built'] += 1
+            else:
+                self.stats['agents_reused'] += 1
+            agents.append(agent)
+
+        specs = [agent.routing_spec() for agent in agents]
+        if previous is not None and specs == previous.routing.specs:
+            routing = previous.routing
+        else:
+            routing = RoutingEngine(specs)
+            self.stats['routing_builds'] += 1
+        return RegistryState(definitions, tuple(agents), routing, version, watermark)
+
+    def get_stats(self) -> Dict[str, Any]:
+        state = self._state
+        return dict(
+            self.stats,
+            version=self._version,
+            agents=list(state.by_type) if state else [],
+            routing_keywords=state.routing.pattern_count if state else 0
+        )
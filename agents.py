@@ -1,8 +1,20 @@
+import asyncio
 import logging
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List
-
-from mistral_client import MistralClient
+from typing import Dict, Any, List, Optional, Tuple
+
+from mistral_client import MistralClient, AsyncMistralClient
+from agent_registry import PROMPT_LANGUAGES, AgentDefinition, AgentRegistry
+from bulkhead import Bulkhead, BulkheadRejected, SlotStream
+from config import AgentConfig, IntentConfig
+from conversation_memory import ConversationContext
+from intent_classifier import get_intent_classifier
+from fanout import afan_out, fan_out, select_candidates
+from resilience import CallAbandoned, raise_if_abandoned
+from retrieval import get_retriever
+from routing import RoutingEngine
+from semantic_cache import get_semantic_cache
+from token_budget import TokenBudget
 
 logger = logging.getLogger(__name__)
 
@@ -14,40 +26,124 @@ class AgentType:
     UNIROOM = "uniroom"
 
 class BaseAgent(ABC):
+    # Routing keywords (list or {keyword: weight}), matched as substrings
+    keywords: List[str] = []
+    base_confidence = 0.2  # Confidence when no keyword matches
+    match_confidence = 1.0
+
     def __init__(self, agent_type: str, name: str, description: str):
         self.agent_type = agent_type
         self.name = name
         self.description = description
-        # Each agent has its own MistralClient instance
+        # Each agent has its own MistralClient; all of them share one
+        # pooled HTTP transport
         self.mistral = MistralClient()
+        self._async_mistral = None
+        # Prompt size and answer length limits for this agent
+        self.token_budget = TokenBudget.for_agent(agent_type)
+        self._routing = None
+        self._prompts = {language: self.default_system_prompt(language).strip()
+                         for language in PROMPT_LANGUAGES}
+        # Own concurrency limit and queue, so one busy agent cannot starve the others
+        self.priority = AgentConfig.DEFAULT_AGENT_PRIORITY
+        self.bulkhead = Bulkhead.for_agent(agent_type, self.priority)
+
+    @property
+    def async_mistral(self) -> AsyncMistralClient:
+        # Created on first use so the sync path does not require httpx
+        if self._async_mistral is None:
+            self._async_mistral = AsyncMistralClient()
+        return self._async_mistral
+
+    def routing_spec(self) -> Dict[str, Any]:
+        return {
+            'agent_type': self.agent_type,
+            'keywords': self.keywords,
+            'base_confidence': self.base_confidence,
+            'match_confidence': self.match_confidence
+        }
 
-    @abstractmethod
     def can_handle(self, message: str, language: str = "ru") -> float:
-        pass
+        """Confidence of this agent alone; AgentRouter scores all agents in one pass"""
+        if self._routing is None:
+            self._routing = RoutingEngine([self.routing_spec()])
+        return self._routing.score(message)['confidences'][self.agent_type]
 
     @abstractmethod
-    def get_system_prompt(self, language: str = "ru") -> str:
-        pass
+    def default_system_prompt(self, language: str = "ru") -> str:
+        """Built-in prompt, used when the agent_types row has none"""
 
-    def process_message(self, message: str, language: str = "ru") -> Dict[str, Any]:
+    def get_system_prompt(self, language: str = "ru") -> str:
+        return self._prompts.get(language) or self._prompts['ru']
+
+    def configure(self, definition: AgentDefinition) -> 'BaseAgent':
+        """Apply an agent_types row: names, prompts and keywords, compiled once"""
+        self.name = definition.name or self.name
+        self.description = definition.description or self.description
+        if definition.keywords:
+            self.keywords = list(definition.keywords)
+            self._routing = None
+        prompts = dict(definition.prompts)
+        self._prompts = {language: prompts.get(language) or self.default_system_prompt(language).strip()
+                         for language in PROMPT_LANGUAGES}
+        self.priority = definition.priority
+        self.bulkhead = Bulkhead.for_agent(self.agent_type, self.priority)
+        return self
+
+    def process_message(self, message: str, language: str = "ru",
+                        confidence: Optional[float] = None,
+                        history: Optional[ConversationContext] = None) -> Dict[str, Any]:
+        """confidence comes from the router; computed here only when called directly.
+        history holds earlier turns of the same conversation"""
         try:
+            raise_if_abandoned()
+            with self.bulkhead.slot():
+                raise_if_abandoned()  # Given up while queued for the slot
+                return self._process_message(message, language, confidence, history)
+        except BulkheadRejected as e:
+            logger.warning(f"Agent request rejected: {str(e)}")
+            return self._busy_result(language, confidence)
+        except CallAbandoned:
+            # A losing fan-out call; nobody reads this result
+            return self._busy_result(language, confidence)
+
+    def _process_message(self, message: str, language: str,
+                         confidence: Optional[float],
+                         history: Optional[ConversationContext]) -> Dict[str, Any]:
+        try:
+            if confidence is None:
+                confidence = self.can_handle(message, language)
+            # Reuse a liked answer to a near-identical question; a follow-up
+            # may mean something else, so only without history
+            if self._standalone(history):
+                semantic_hit = get_semantic_cache().lookup(self.agent_type, language, message)
+                if semantic_hit:
+                    return self._semantic_cache_result(semantic_hit, confidence)
+
             # Get agent-specific system prompt
             system_prompt = self.get_system_prompt(language)
             
             # Get agent-specific context from knowledge base
-            context = self.get_agent_context(message, language)
+            context = self.get_agent_context(message, language, history)
             
             # Use agent-specific system prompt for this message
-            response = self.mistral.get_response_with_system_prompt(
-                message, context, language, system_prompt
+            completion = self.mistral.complete(
+                message, context, language, system_prompt,
+                max_tokens=self.token_budget.max_tokens, history=history
             )
             return {
-                'response': response,
-                'confidence': self.can_handle(message, language),
+                'response': completion['response'],
+                'confidence': confidence,
                 'agent_type': self.agent_type,
                 'agent_name': self.name,
-                'context_used': bool(context)
+                'context_used': bool(context),
+                'cache_hit': completion['cache_hit'],
+                'fallback': completion['fallback'],
+                'prompt_tokens': completion.get('prompt_tokens'),
+                'completion_tokens': completion.get('completion_tokens')
             }
+        except CallAbandoned:
+            raise
         except Exception as e:
             logger.error(f"Error in {self.name} agent: {str(e)}")
             return {
@@ -55,53 +151,202 @@ class BaseAgent(ABC):
                 'confidence': 0.1,
                 'agent_type': self.agent_type,
                 'agent_name': self.name,
-                'context_used': False
+                'context_used': False,
+                'fallback': True
             }
     
-    def get_agent_context(self, message: str, language: str = "ru") -> str:
-        """Get agent-specific context from knowledge base"""
+    async def aprocess_message(self, message: str, language: str = "ru",
+                               confidence: Optional[float] = None,
+                               history: Optional[ConversationContext] = None) -> Dict[str, Any]:
+        """Asyncio variant of process_message; only the DB lookup uses a thread"""
         try:
-            from models import AgentKnowledgeBase
-            from app import db
-            
-            # Search for relevant knowledge entries for this agent
-            knowledge_entries = AgentKnowledgeBase.query.filter_by(
-                agent_type=self.agent_type,
-                is_active=True
-            ).order_by(AgentKnowledgeBase.priority.asc()).all()
-            
-            if not knowledge_entries:
+            async with self.bulkhead.aslot():
+                return await self._aprocess_message(message, language, confidence, history)
+        except BulkheadRejected as e:
+            logger.warning(f"Agent request rejected: {str(e)}")
+            return self._busy_result(language, confidence)
+
+    async def _aprocess_message(self, message: str, language: str,
+                                confidence: Optional[float],
+                                history: Optional[ConversationContext]) -> Dict[str, Any]:
+        try:
+            if confidence is None:
+                confidence = self.can_handle(message, language)
+            if self._standalone(history):
+                semantic_hit = await asyncio.to_thread(
+                    self._in_app_context, get_semantic_cache().lookup, self.agent_type, language, message
+                )
+                if semantic_hit:
+                    return self._semantic_cache_result(semantic_hit, confidence)
+
+            system_prompt = self.get_system_prompt(language)
+            context = await asyncio.to_thread(self._in_app_context, self.get_agent_context,
+                                              message, language, history)
+            completion = await self.async_mistral.complete(
+                message, context, language, system_prompt,
+                max_tokens=self.token_budget.max_tokens, history=history
+            )
+            return {
+                'response': completion['response'],
+                'confidence': confidence,
+                'agent_type': self.agent_type,
+                'agent_name': self.name,
+                'context_used': bool(context),
+                'cache_hit': completion['cache_hit'],
+                'fallback': completion['fallback'],
+                'prompt_tokens': completion.get('prompt_tokens'),
+                'completion_tokens': completion.get('completion_tokens')
+            }
+        except Exception as e:
+            logger.error(f"Error in {self.name} agent: {str(e)}")
+            return {
+                'response': f"Извините, возникла ошибка при обработке запроса по теме '{self.description}'.",
+                'confidence': 0.1,
+                'agent_type': self.agent_type,
+                'agent_name': self.name,
+                'context_used': False,
+                'fallback': True
+            }
+
+    def stream_message(self, message: str, language: str = "ru",
+                       confidence: Optional[float] = None,
+                       history: Optional[ConversationContext] = None) -> Dict[str, Any]:
+        """Same as process_message, but 'stream' yields response tokens.
+        The bulkhead slot is held until the stream is consumed or closed"""
+        try:
+            self.bulkhead.acquire()
+        except BulkheadRejected as e:
+            logger.warning(f"Agent request rejected: {str(e)}")
+            result = self._busy_result(language, confidence)
+            result['stream'] = iter([result.pop('response')])
+            return result
+        try:
+            result = self._stream_message(message, language, confidence, history)
+        except BaseException:
+            self.bulkhead.release()
+            raise
+        result['stream'] = SlotStream(result['stream'], self.bulkhead)
+        return result
+
+    def _stream_message(self, message: str, language: str,
+                        confidence: Optional[float],
+                        history: Optional[ConversationContext]) -> Dict[str, Any]:
+        try:
+            if confidence is None:
+                confidence = self.can_handle(message, language)
+            if self._standalone(history):
+                semantic_hit = get_semantic_cache().lookup(self.agent_type, language, message)
+                if semantic_hit:
+                    result = self._semantic_cache_result(semantic_hit, confidence)
+                    result['stream'] = iter([result.pop('response')])
+                    return result
+
+            system_prompt = self.get_system_prompt(language)
+            context = self.get_agent_context(message, language, history)
+            cached = self.mistral.get_cached_response(
+                message, context, language, system_prompt, history
+            )
+            usage = {}
+            if cached is not None:
+                stream = iter([cached])
+            else:
+                stream = self.mistral.stream_response_with_system_prompt(
+                    message, context, language, system_prompt,
+                    max_tokens=self.token_budget.max_tokens, usage=usage,
+                    history=history
+                )
+            return {
+                'stream': stream,
+                'confidence': confidence,
+                'agent_type': self.agent_type,
+                'agent_name': self.name,
+                'context_used': bool(context),
+                'cache_hit': cached is not None,
+                # Filled in once the stream has been consumed
+                'usage': usage
+            }
+        except Exception as e:
+            logger.error(f"Error in {self.name} agent stream: {str(e)}")
+            return {
+                'stream': iter([f"Извините, возникла ошибка при обработке запроса по теме '{self.description}'."]),
+                'confidence': 0.1,
+                'agent_type': self.agent_type,
+                'agent_name': self.name,
+                'context_used': False,
+                'fallback': True
+            }
+
+    def get_agent_context(self, message: str, language: str = "ru",
+                          history: Optional[ConversationContext] = None) -> str:
+        """Context for the message: agent knowledge, FAQ and knowledge base
+        passages fused into one ranking (retrieval.HybridRetriever)"""
+        try:
+            retrieval = get_retriever().retrieve(message, language, agent_type=self.agent_type)
+            if not retrieval.passages:
                 return ""
             
-            # Build context from relevant entries
-            context_parts = []
-            message_lower = message.lower()
-            
-            for entry in knowledge_entries:
-                # Check if keywords match the message
-                if entry.keywords:
-                    keywords = [k.strip().lower() for k in entry.keywords.split(',')]
-                    if any(keyword in message_lower for keyword in keywords):
-                        content = entry.content_ru if language == 'ru' else entry.content_kz
-                        context_parts.append(f"**{entry.title}**\n{content}")
-                        
-                        # Limit context to prevent too long prompts
-                        if len(context_parts) >= 3:
-                            break
-            
-            # If no keyword matches, include high-priority general entries
-            if not context_parts:
-                for entry in knowledge_entries[:2]:  # Top 2 priority entries
-                    content = entry.content_ru if language == 'ru' else entry.content_kz
-                    context_parts.append(f"**{entry.title}**\n{content}")
-            
-            return "\n\n".join(context_parts)
+            # Fit the entries into the agent's prompt budget
+            budget = self.token_budget.context_budget(self.get_system_prompt(language), message)
+            if history is not None:
+                # Earlier turns share the same prompt budget
+                budget = max(0, budget - history.tokens)
+            return self.token_budget.fit_context(message, retrieval.parts(), budget)
             
         except Exception as e:
             logger.error(f"Error getting agent context: {str(e)}")
             return ""
 
+    def _busy_result(self, language: str, confidence: Optional[float]) -> Dict[str, Any]:
+        if language == "kz":
+            response = "Қазір өтініштер өте көп. Бір минуттан кейін сұрағыңызды қайталаңыз."
+        else:
+            response = "Сейчас очень много обращений. Пожалуйста, повторите вопрос через минуту."
+        return {
+            'response': response,
+            'confidence': confidence if confidence is not None else 0.1,
+            'agent_type': self.agent_type,
+            'agent_name': self.name,
+            'context_used': False,
+            'cache_hit': False,
+            'fallback': True,
+            'shed': True
+        }
+
+    @staticmethod
+    def _standalone(history: Optional[ConversationContext]) -> bool:
+        return history is None or history.empty
+
+    def _in_app_context(self, func, *args):
+        """Call func inside a Flask app context (for worker threads)"""
+        from flask import has_app_context
+        if has_app_context():
+            return func(*args)
+        from app import app
+        with app.app_context():
+            return func(*args)
+
+    def _semantic_cache_result(self, semantic_hit: Dict[str, Any],
+                               confidence: float) -> Dict[str, Any]:
+        logger.info(
+            f"{self.name}: reusing liked answer {semantic_hit['query_id']} "
+            f"(similarity {semantic_hit['similarity']:.2f})"
+        )
+        return {
+            'response': semantic_hit['response'],
+            'confidence': confidence,
+            'agent_type': self.agent_type,
+            'agent_name': self.name,
+            'context_used': False,
+            'cache_hit': True,
+            'fallback': False,
+            'semantic_source_id': semantic_hit['query_id']
+        }
+
 class AIAbiturAgent(BaseAgent):
+    keywords = ["поступление", "абитуриент", "документы", "экзамен", "приём", "требования", "специальности", "факультет",
+                "талапкер", "түсу", "құжат", "емтихан", "мамандық"]
+    base_confidence = 0.3
+
     def __init__(self):
         super().__init__(
             AgentType.AI_ABITUR,
@@ -109,11 +354,7 @@ class AIAbiturAgent(BaseAgent):
             "Цифровой помощник для абитуриентов (поступающих в вуз)"
         )
 
-    def can_handle(self, message: str, language: str = "ru") -> float:
-        keywords = ["поступление", "абитуриент", "документы", "экзамен", "приём", "требования", "специальности", "факультет"]
-        return 1.0 if any(k in message.lower() for k in keywords) else 0.3
-
-    def get_system_prompt(self, language: str = "ru") -> str:
+    def default_system_prompt(self, language: str = "ru") -> str:
         if language == "kz":
             return """
 Сіз Қызылорда "Болашақ" университетінің талапкерлерге арналған цифрлық көмекшісіз. Сіз:
@@ -137,6 +378,10 @@ class AIAbiturAgent(BaseAgent):
 """
 
 class KadrAIAgent(BaseAgent):
+    keywords = ["кадры", "отпуск", "перевод", "приказ", "сотрудник", "преподаватель", "отдел кадров", "трудовой", "зарплата", "кадровые",
+                "кадр", "демалыс", "бұйрық", "қызметкер", "оқытушы", "жалақы", "еңбек"]
+    base_confidence = 0.3
+
     def __init__(self):
         super().__init__(
             AgentType.KADRAI,
@@ -144,11 +389,7 @@ class KadrAIAgent(BaseAgent):
             "Интеллектуальный помощник для поддержки сотрудников и преподавателей в вопросах внутренних кадровых процедур"
         )
 
-    def can_handle(self, message: str, language: str = "ru") -> float:
-        keywords = ["кадры", "отпуск", "перевод", "приказ", "сотрудник", "преподаватель", "отдел кадров", "трудовой", "зарплата", "кадровые"]
-        return 1.0 if any(k in message.lower() for k in keywords) else 0.3
-
-    def get_system_prompt(self, language: str = "ru") -> str:
+    def default_system_prompt(self, language: str = "ru") -> str:
         if language == "kz":
             return """
 Сіз Қызылорда "Болашақ" университетінің қызметкерлер мен оқытушыларға арналған зияткерлік көмекшісіз. Сіз:
@@ -170,6 +411,9 @@ class KadrAIAgent(BaseAgent):
 """
 
 class UniNavAgent(BaseAgent):
+    keywords = ["расписание", "учёб", "занятие", "заявление", "обращение", "деканат", "академический", "экзамен", "зачёт",
+                "кесте", "сабақ", "өтініш", "сынақ"]
+
     def __init__(self):
         super().__init__(
             AgentType.UNINAV,
@@ -177,11 +421,7 @@ class UniNavAgent(BaseAgent):
             "Интерактивный чат-ассистент, обеспечивающий полное сопровождение обучающегося по всем университетским процессам"
         )
 
-    def can_handle(self, message: str, language: str = "ru") -> float:
-        keywords = ["расписание", "учёб", "занятие", "заявление", "обращение", "деканат", "академический", "экзамен", "зачёт", "вопросы"]
-        return 1.0 if any(k in message.lower() for k in keywords) else 0.2
-
-    def get_system_prompt(self, language: str = "ru") -> str:
+    def default_system_prompt(self, language: str = "ru") -> str:
         if language == "kz":
             return """
 Сіз Қызылорда "Болашақ" университетінің студенттерге арналған интерактивті чат-көмекшісіз. Сіз:
@@ -203,6 +443,9 @@ class UniNavAgent(BaseAgent):
 """
 
 class CareerNavigatorAgent(BaseAgent):
+    keywords = ["работ", "трудоустройств", "ваканс", "резюме", "карьер", "выпускник", "стажировк", "работодател",
+                "жұмыс", "мансап", "түлек", "тәжірибе"]
+
     def __init__(self):
         super().__init__(
             AgentType.CAREER_NAVIGATOR,
@@ -210,11 +453,7 @@ class CareerNavigatorAgent(BaseAgent):
             "Интеллектуальный чат-бот для содействия трудоустройству студентов и выпускников"
         )
 
-    def can_handle(self, message: str, language: str = "ru") -> float:
-        keywords = ["работ", "трудоустройств", "ваканс", "резюме", "карьер", "выпускник", "стажировк", "работодател"]
-        return 1.0 if any(k in message.lower() for k in keywords) else 0.2
-
-    def get_system_prompt(self, language: str = "ru") -> str:
+    def default_system_prompt(self, language: str = "ru") -> str:
         if language == "kz":
             return """
 Сіз Қызылорда "Болашақ" университетінің студенттер мен түлектердің жұмысқа орналасуына көмектесетін зияткерлік чат-ботсыз. Сіз:
@@ -236,6 +475,9 @@ class CareerNavigatorAgent(BaseAgent):
 """
 
 class UniRoomAgent(BaseAgent):
+    keywords = ["общежитие", "заселение", "переселение", "бытов", "администрация", "комната", "жилищ", "проживан", "проблем",
+                "жатақхана", "орналас", "көшу", "тұрмыс", "бөлме"]
+
     def __init__(self):
         super().__init__(
             AgentType.UNIROOM,
@@ -243,11 +485,7 @@ class UniRoomAgent(BaseAgent):
             "Цифровой помощник для студентов, проживающих в общежитии"
         )
 
-    def can_handle(self, message: str, language: str = "ru") -> float:
-        keywords = ["общежитие", "заселение", "переселение", "бытов", "администрация", "комната", "жилищ", "проживан", "проблем"]
-        return 1.0 if any(k in message.lower() for k in keywords) else 0.2
-
-    def get_system_prompt(self, language: str = "ru") -> str:
+    def default_system_prompt(self, language: str = "ru") -> str:
         if language == "kz":
             return """
 Сіз Қызылорда "Болашақ" университетінде жатақханада тұратын студенттерге арналған цифрлық көмекшісіз. Сіз:
@@ -268,27 +506,141 @@ class UniRoomAgent(BaseAgent):
 Ваши ответы должны проявлять сочувствие и понимание. Используйте формат Markdown.
 """
 
+class ConfiguredAgent(BaseAgent):
+    """Agent defined only by its agent_types row"""
+
+    def __init__(self, agent_type: str, name: str, description: str):
+        super().__init__(agent_type, name, description or "")
+
+    def default_system_prompt(self, language: str = "ru") -> str:
+        return f"{self.name}. {self.description}\n\nИспользуйте формат Markdown."
+
+BUILTIN_AGENTS = {
+    AgentType.AI_ABITUR: AIAbiturAgent,
+    AgentType.KADRAI: KadrAIAgent,
+    AgentType.UNINAV: UniNavAgent,
+    AgentType.CAREER_NAVIGATOR: CareerNavigatorAgent,
+    AgentType.UNIROOM: UniRoomAgent
+}
+
+def builtin_definitions() -> List[AgentDefinition]:
+    """The built-in agents as they are without agent_types rows"""
+    return [AgentDefinition(type_code, priority=i) for i, type_code in enumerate(BUILTIN_AGENTS, 1)]
+
+def create_agent(definition: AgentDefinition) -> BaseAgent:
+    agent_class = BUILTIN_AGENTS.get(definition.type_code)
+    if agent_class is not None:
+        agent = agent_class()
+    else:
+        agent = ConfiguredAgent(definition.type_code, definition.name or definition.type_code,
+                                definition.description)
+    return agent.configure(definition)
+
 class AgentRouter:
     def __init__(self):
-        # Each agent now creates its own MistralClient instance
-        self.agents = [
-            AIAbiturAgent(),
-            KadrAIAgent(),
-            UniNavAgent(),
-            CareerNavigatorAgent(),
-            UniRoomAgent()
-        ]
-        logger.info(f"AgentRouter initialized with {len(self.agents)} agents")
-
-    def route_message(self, message: str, language: str = "ru") -> Dict[str, Any]:
-        best_conf = 0
-        best_agent = None
-        for agent in self.agents:
-            conf = agent.can_handle(message, language)
-            if conf > best_conf:
-                best_conf = conf
-                best_agent = agent
-        return best_agent.process_message(message, language) if best_agent else {}
+        # Agents come from agent_types; a change rebuilds only what changed
+        self.registry = AgentRegistry(create_agent, builtin_definitions,
+                                      refresh_interval=AgentConfig.AGENT_REGISTRY_REFRESH_INTERVAL)
+        state = self.registry.state()
+        logger.info(f"AgentRouter initialized with {len(state.agents)} agents "
+                    f"and {state.routing.pattern_count} routing keywords")
+
+    @property
+    def agents(self) -> List[BaseAgent]:
+        return list(self.registry.state().agents)
+
+    @property
+    def routing(self) -> RoutingEngine:
+        return self.registry.state().routing
+
+    def route(self, message: str, language: str = "ru",
+              history: Optional[ConversationContext] = None) -> Tuple[Optional[BaseAgent], Optional[Dict[str, Any]]]:
+        """Best agent and the routing decision (confidence, per-agent scores)"""
+        # One generation for the whole decision, even if a swap happens meanwhile
+        state = self.registry.state()
+        decision = state.routing.route(message)
+        if not decision:
+            return None, None
+
+        # A confident trained classifier overrides the keyword decision
+        classifier = get_intent_classifier()
+        if classifier is not None:
+            prediction = classifier.predict(message)
+            if (prediction['confidence'] >= IntentConfig.INTENT_MIN_CONFIDENCE
+                    and prediction['agent_type'] in state.by_type):
+                decision = dict(decision,
+                                agent_type=prediction['agent_type'],
+                                confidence=prediction['confidence'],
+                                source='classifier')
+
+        # A follow-up without any keyword ("а сроки?") stays with the previous agent
+        if (decision['source'] == 'keywords' and not decision['hits']
+                and history is not None and history.last_agent in state.by_type):
+            decision = dict(decision,
+                            agent_type=history.last_agent,
+                            confidence=state.by_type[history.last_agent].match_confidence,
+                            source='history')
+        return state.by_type[decision['agent_type']], decision
+
+    def select_agent(self, message: str, language: str = "ru") -> Optional[BaseAgent]:
+        return self.route(message, language)[0]
+
+    def fanout_candidates(self, decision: Dict[str, Any]) -> List[Tuple[BaseAgent, float]]:
+        """(agent, confidence) pairs close enough to the best one to ask in parallel"""
+        if decision.get('source') != 'keywords':
+            return []
+        by_type = self.registry.state().by_type
+        return [(by_type[item['agent_type']], item['confidence'])
+                for item in select_candidates(decision.get('ranking', []))
+                if item['agent_type'] in by_type]
+
+    def route_message(self, message: str, language: str = "ru",
+                      history: Optional[ConversationContext] = None) -> Dict[str, Any]:
+        agent, decision = self.route(message, language, history)
+        if not agent:
+            return self._unrouted_result(language)
+        candidates = self.fanout_candidates(decision)
+        if len(candidates) > 1:
+            return fan_out(candidates, message, language, history)
+        return agent.process_message(message, language, decision['confidence'], history)
+
+    async def arefresh(self):
+        """Reload the registry in a worker thread when it is due, so that the
+        synchronous state() calls that follow never query on the event loop"""
+        if self.registry.stale():
+            await asyncio.to_thread(self.registry.state)
+
+    async def aroute_message(self, message: str, language: str = "ru",
+                             history: Optional[ConversationContext] = None) -> Dict[str, Any]:
+        await self.arefresh()
+        agent, decision = self.route(message, language, history)
+        if not agent:
+            return self._unrouted_result(language)
+        candidates = self.fanout_candidates(decision)
+        if len(candidates) > 1:
+            return await afan_out(candidates, message, language, history)
+        return await agent.aprocess_message(message, language, decision['confidence'], history)
+
+    def route_message_stream(self, message: str, language: str = "ru",
+                             history: Optional[ConversationContext] = None) -> Dict[str, Any]:
+        # A stream cannot be swapped once started, so there is no fan-out here
+        agent, decision = self.route(message, language, history)
+        if not agent:
+            result = self._unrouted_result(language)
+            return dict(result, stream=iter([result['response']]))
+        return agent.stream_message(message, language, decision['confidence'], history)
+
+    @staticmethod
+    def _unrouted_result(language: str) -> Dict[str, Any]:
+        """No active agent to route to: the localized fallback answer"""
+        logger.warning("No agent available to handle the message, serving fallback")
+        mistral = MistralClient()
+        return dict(mistral._fallback_result(mistral._get_fallback_response(language)),
+                    confidence=0.0, context_used=False)
+
+    def get_agent(self, agent_type: str) -> Optional[BaseAgent]:
+        return self.registry.state().by_type.get(agent_type)
 
     def get_available_agents(self) -> List[Dict[str, str]]:
-        return [{'type': a.agent_type, 'name': a.name, 'description': a.description} for a in self.agents]
\ No newline at end of file
+        return [{'type': a.agent_type, 'name': a.name, 'description': a.description}
+                for a in self.registry.state().agents]
\ No newline at end of file
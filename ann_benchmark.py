@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сравнение IVF-индекса с точным поиском: recall@k и запросы в секунду
+Recall@k and QPS of the IVF-flat index against exact search
+
+Данные синтетические (кластеры на единичной сфере) или фрагменты базы знаний,
+векторизованные настроенным эмбеддером. Индексы сохраняются во временный
+каталог и открываются через mmap, как в рабочих процессах.
+
+Запуск / Run:
+    python ann_benchmark.py --rows 1000000 --nprobe 1,4,8,16,32
+    python ann_benchmark.py --source database --k 5
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from ann_index import IVFIndex
+from config import SearchConfig
+from vector_index import VectorIndex, load_embedder
+
+
+def synthetic_vectors(rows: int, dim: int, clusters: int, spread: float, seed: int):
+    """Unit vectors around random cluster centres"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    vectors = np.empty((rows, dim), dtype=np.float32)
+    for start in range(0, rows, 65536):
+        end = min(start + 65536, rows)
+        noise = rng.standard_normal((end - start, dim)).astype(np.float32) * (spread / np.sqrt(dim))
+        block = centres[rng.integers(0, clusters, end - start)] + noise
+        vectors[start:end] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    return vectors
+
+
+def database_vectors(queries: int, seed: int):
+    """Embedded knowledge base chunks; queries are the opening words of random chunks"""
+    from app import app
+    from models import KnowledgeBase
+
+    with app.app_context():
+        rows = KnowledgeBase.query.with_entities(KnowledgeBase.content_chunk).filter(
+            KnowledgeBase.is_active == True).all()
+    texts = [row.content_chunk or '' for row in rows]
+    if not texts:
+        raise SystemExit("The knowledge base is empty")
+    embedder = load_embedder(SearchConfig.VECTOR_EMBEDDER, SearchConfig.VECTOR_DIM)
+    vectors = np.concatenate([embedder.embed(texts[start:start + 4096])
+                              for start in range(0, len(texts), 4096)])
+    picked = np.random.default_rng(seed).integers(0, len(texts), queries)
+    return vectors, embedder.embed([' '.join(texts[i].split()[:12]) for i in picked])
+
+
+def run_queries(index, queries, k: int, **options) -> Tuple[List[List[Tuple[int, float]]], float]:
+    """One query per call, as on the chat path; returns results and QPS"""
+    started = time.perf_counter()
+    results = [index.search(query[None, :], k, SearchConfig.VECTOR_BLOCK_ROWS, **options)[0]
+               for query in queries]
+    return results, len(queries) / (time.perf_counter() - started)
+
+
+def recall(results: Sequence[List[Tuple[int, float]]], exact: Sequence[List[Tuple[int, float]]]) -> float:
+    found = sum(len({row for row, _ in got} & {row for row, _ in truth})
+                for got, truth in zip(results, exact))
+    return found / max(1, sum(len(truth) for truth in exact))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IVF-flat recall@k and QPS against exact search")
+    parser.add_argument('--source', choices=['synthetic', 'database'], default='synthetic')
+    parser.add_argument('--rows', type=int, default=200000, help="Synthetic vectors")
+    parser.add_argument('--dim', type=int, default=SearchConfig.VECTOR_DIM)
+    parser.add_argument('--clusters', type=int, default=2000, help="Synthetic topic clusters")
+    parser.add_argument('--spread', type=float, default=1.0, help="Synthetic noise around the cluster centres")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--lists', type=int, default=SearchConfig.VECTOR_IVF_LISTS, help="0: about sqrt(rows)")
+    parser.add_argument('--nprobe', default='1,2,4,8,16,32', help="Comma-separated values to compare")
+    parser.add_argument('--dtype', default=SearchConfig.VECTOR_DTYPE)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.source == 'database':
+        vectors, queries = database_vectors(args.queries, args.seed)
+    else:
+        vectors = synthetic_vectors(args.rows, args.dim, args.clusters, args.spread, args.seed)
+        queries = synthetic_vectors(args.queries, args.dim, args.clusters, args.spread, args.seed)
+    dim = vectors.shape[1]
+    ids = np.arange(1, len(vectors) + 1)
+    print(f"{len(vectors)} vectors x {dim} ({args.dtype}), {len(queries)} queries, k={args.k}")
+
+    directory = tempfile.mkdtemp(prefix='ann-benchmark-')
+    try:
+        started = time.perf_counter()
+        flat = VectorIndex(dim, args.dtype)
+        flat.add(ids, vectors)
+        flat.save(f'{directory}/flat')
+        flat = VectorIndex.load(f'{directory}/flat')
+        print(f"flat build  {time.perf_counter() - started:8.2f} s")
+
+        started = time.perf_counter()
+        ivf = IVFIndex(dim, args.dtype, lists=args.lists)
+        ivf.add(ids, vectors)
+        ivf.save(f'{directory}/ivf')
+        ivf = IVFIndex.load(f'{directory}/ivf')
+        stats = ivf.get_stats()
+        print(f"ivf build   {time.perf_counter() - started:8.2f} s  "
+              f"({stats['lists']} lists, largest {stats['largest_list']})")
+
+        exact, exact_qps = run_queries(flat, queries, args.k)
+        print(f"\n{'index':<12}{'recall@' + str(args.k):>10}{'QPS':>10}{'speedup':>10}")
+        print(f"{'exact':<12}{1.0:>10.3f}{exact_qps:>10.0f}{1.0:>10.1f}")
+        for nprobe in (int(value) for value in args.nprobe.split(',')):
+            results, qps = run_queries(ivf, queries, args.k, nprobe=nprobe)
+            print(f"{'nprobe=' + str(nprobe):<12}{recall(results, exact):>10.3f}{qps:>10.0f}{qps / exact_qps:>10.1f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+# Приближённый поиск ближайших соседей (IVF-flat) для больших баз знаний
+# Inverted-file (IVF-flat) approximate nearest-neighbour index over unit vectors
+
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional: vector search is then unavailable
+    np = None
+
+logger = logging.getLogger(__name__)
+
+INITIAL_TAIL_ROWS = 1024
+MIN_TRAIN_ROWS = 4096  # Smaller indexes stay one list, i.e. exact search
+TRAIN_ROWS_PER_LIST = 64  # k-means sample per centroid
+KMEANS_ITERATIONS = 10
+RETRAIN_GROWTH = 2.0  # Centroids are retrained when the row count doubles or halves
+
+
+def assign_lists(vectors, centroids, block_rows: int = 16384):
+    """Nearest centroid (largest cosine) of every unit vector"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_rows):
+        block = np.asarray(vectors[start:start + block_rows], dtype=np.float32)
+        labels[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(vectors, lists: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0):
+    """Unit centroids for unit vectors: k-means on cosine, empty clusters reseeded"""
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = vectors[rng.choice(len(vectors), lists, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign_lists(vectors, centroids)
+        counts = np.bincount(labels, minlength=lists)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        filled = counts > 0
+        sums = np.zeros_like(centroids)
+        sums[filled] = np.add.reduceat(vectors[np.argsort(labels, kind='stable')], starts[filled], axis=0)
+        if not filled.all():
+            sums[~filled] = vectors[rng.choice(len(vectors), int((~filled).sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = sums / norms
+    return centroids
+
+
+def _top_k(scores_parts: List[Any], ids_parts: List[Any], k: int) -> List[Tuple[int, float]]:
+    if not scores_parts:
+        return []
+    scores = np.concatenate(scores_parts)
+    ids = np.concatenate(ids_parts)
+    if len(scores) > k:
+        top = np.argpartition(-scores, k - 1)[:k]
+        scores, ids = scores[top], ids[top]
+    order = np.argsort(-scores, kind='stable')
+    return [(int(ids[row]), float(scores[row])) for row in order if np.isfinite(scores[row])]
+
+
+class IVFIndex:
+    """IVF-flat: vectors grouped by their nearest k-means centroid; a search
+    scores the nprobe closest lists only.
+
+    nprobe trades recall for latency (per index or per search; nprobe equal
+    to the number of lists is exact). The saved matrix is ordered by list and
+    memory-mapped; inserts go to an in-memory tail tagged with their list,
+    deletes are masked, and save() merges both into a new ordered matrix,
+    retraining the centroids once the row count has changed RETRAIN_GROWTH
+    times. Same interface as vector_index.VectorIndex."""
+
+    def __init__(self, dim: int, dtype: str = 'float32', embedder_name: str = '',
+                 lists: int = 0, nprobe: int = 8, centroids=None, offsets=None,
+                 base=None, base_ids=None, trained_rows: int = 0):
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.embedder_name = embedder_name
+        self.lists = lists  # 0: about sqrt(rows)
+        self.nprobe = nprobe
+        self.trained_rows = trained_rows
+        self.watermark: Optional[datetime] = None
+        self.generation: Optional[str] = None  # Of the saved files this index was loaded from
+        if base is None:
+            base, base_ids = np.zeros((0, dim), dtype=self.dtype), np.zeros(0, dtype=np.int64)
+        if centroids is None:
+            # Untrained: one list holding everything
+            centroids = np.zeros((1, dim), dtype=np.float32)
+            offsets = np.array([0, len(base_ids)], dtype=np.int64)
+        self._centroids = centroids
+        self._offsets = offsets
+        # Segments are replaced, never resized, under readers
+        self._base = (base, base_ids, np.ones(len(base_ids), dtype=bool), len(base_ids))
+        self._tail = (np.zeros((0, dim), dtype=self.dtype), np.zeros(0, dtype=np.int64),
+                      np.zeros(0, dtype=bool), np.zeros(0, dtype=np.int32), 0)
+        self._rows: Dict[int, Tuple[int, int]] = {int(row_id): (0, position)
+                                                  for position, row_id in enumerate(base_ids)}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def ids(self) -> Set[int]:
+        return self._rows.keys()
+
+    def remove(self, row_ids: Iterable[int]):
+        for row_id in row_ids:
+            location = self._rows.pop(row_id, None)
+            if location is not None:
+                segment = self._base if location[0] == 0 else self._tail
+                segment[2][location[1]] = False
+
+    def add(self, row_ids: Sequence[int], vectors):
+        """Insert or replace rows; vectors are unit float32 rows"""
+        if not len(row_ids):
+            return
+        self.remove(row_ids)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        lists = assign_lists(vectors, self._centroids)
+        matrix, ids, alive, tail_lists, size = self._tail
+        needed = size + len(row_ids)
+        if needed > len(ids):
+            capacity = max(INITIAL_TAIL_ROWS, len(ids) * 2, needed)
+            grown = np.zeros((capacity, self.dim), dtype=self.dtype)
+            grown_ids = np.zeros(capacity, dtype=np.int64)
+            grown_alive = np.zeros(capacity, dtype=bool)
+            grown_lists = np.zeros(capacity, dtype=np.int32)
+            grown[:size], grown_ids[:size] = matrix[:size], ids[:size]
+            grown_alive[:size], grown_lists[:size] = alive[:size], tail_lists[:size]
+            matrix, ids, alive, tail_lists = grown, grown_ids, grown_alive, grown_lists
+        matrix[size:needed] = vectors
+        ids[size:needed] = row_ids
+        alive[size:needed] = True
+        tail_lists[size:needed] = lists
+        self._tail = (matrix, ids, alive, tail_lists, needed)
+        for position, row_id in enumerate(row_ids, start=size):
+            self._rows[int(row_id)] = (1, position)
+
+    def search(self, queries, k: int = 5, block_rows: int = 16384,
+               nprobe: Optional[int] = None) -> List[List[Tuple[int, float]]]:
+        """Approximate top-k (row id, cosine) for each unit query vector of a (b, dim) batch"""
+        queries = np.asarray(queries, dtype=np.float32)
+        centroids, offsets = self._centroids, self._offsets
+        base, base_ids, base_alive, _ = self._base
+        tail, tail_ids, tail_alive, tail_lists, tail_size = self._tail
+        nprobe = max(1, min(nprobe or self.nprobe, len(centroids)))
+        probes = np.argpartition(-(queries @ centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+
+        results = []
+        for query, probe in zip(queries, probes):
+            scores_parts: List[Any] = []
+            ids_parts: List[Any] = []
+            for number in probe:
+                for start in range(offsets[number], offsets[number + 1], block_rows):
+                    end = min(start + block_rows, offsets[number + 1])
+                    scores = np.asarray(base[start:end], dtype=np.float32) @ query
+                    scores[~base_alive[start:end]] = -np.inf
+                    scores_parts.append(scores)
+                    ids_parts.append(base_ids[start:end])
+            if tail_size:
+                rows = np.flatnonzero(np.isin(tail_lists[:tail_size], probe) & tail_alive[:tail_size])
+                if len(rows):
+                    scores_parts.append(np.asarray(tail[rows], dtype=np.float32) @ query)
+                    ids_parts.append(tail_ids[rows])
+            results.append(_top_k(scores_parts, ids_parts, k))
+        return results
+
+    def _live(self):
+        """Live vectors (float32), ids and list numbers of both segments"""
+        base, base_ids, base_alive, base_size = self._base
+        tail, tail_ids, tail_alive, tail_lists, tail_size = self._tail
+        base_mask, tail_mask = base_alive[:base_size], tail_alive[:tail_size]
+        base_lists = np.repeat(np.arange(len(self._offsets) - 1, dtype=np.int32), np.diff(self._offsets))
+        vectors = np.concatenate((np.asarray(base[:base_size][base_mask], dtype=np.float32),
+                                  np.asarray(tail[:tail_size][tail_mask], dtype=np.float32)))
+        ids = np.concatenate((base_ids[:base_size][base_mask], tail_ids[:tail_size][tail_mask]))
+        lists = np.concatenate((base_lists[base_mask], tail_lists[:tail_size][tail_mask]))
+        return vectors, ids, lists
+
+    def _needs_training(self, rows: int) -> bool:
+        if rows < MIN_TRAIN_ROWS:
+            return self.trained_rows > 0  # Shrunk: back to one exact list
+        return (not self.trained_rows or rows >= self.trained_rows * RETRAIN_GROWTH
+                or rows * RETRAIN_GROWTH <= self.trained_rows)
+
+    def save(self, prefix: str):
+        """Write live rows ordered by list as {prefix}.vectors.npy / .ids.npy with
+        .centroids.npy and .offsets.npy, then the metadata"""
+        vectors, ids, lists = self._live()
+        centroids, trained_rows = self._centroids, self.trained_rows
+        if self._needs_training(len(ids)):
+            if len(ids) < MIN_TRAIN_ROWS:
+                centroids, trained_rows = np.zeros((1, self.dim), dtype=np.float32), 0
+            else:
+                count = self.lists or int(round(np.sqrt(len(ids))))
+                count = max(1, min(count, len(ids) // TRAIN_ROWS_PER_LIST))
+                sample = np.random.default_rng(len(ids)).choice(
+                    len(ids), min(len(ids), count * TRAIN_ROWS_PER_LIST), replace=False)
+                centroids = spherical_kmeans(vectors[np.sort(sample)], count)
+                trained_rows = len(ids)
+                logger.info(f"IVF centroids trained: {count} lists over {len(ids)} vectors")
+            lists = assign_lists(vectors, centroids)
+        order = np.argsort(lists, kind='stable')
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(lists, minlength=len(centroids))))).astype(np.int64)
+
+        for suffix, values in (('vectors', np.asarray(vectors[order], dtype=self.dtype)), ('ids', ids[order]),
+                               ('centroids', centroids), ('offsets', offsets)):
+            tmp_path = f'{prefix}.{suffix}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, values)
+            os.replace(tmp_path, f'{prefix}.{suffix}.npy')
+        # Written last: a reader checks the row and list counts against the arrays
+        tmp_path = f'{prefix}.meta.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'type': 'ivf', 'embedder': self.embedder_name, 'dim': self.dim,
+                       'dtype': self.dtype.name, 'rows': len(ids), 'lists': len(centroids),
+                       'trained_rows': trained_rows,
+                       'watermark': self.watermark.isoformat() if self.watermark else None,
+                       'generation': self.generation}, f)
+        os.replace(tmp_path, f'{prefix}.meta.json')
+
+    @classmethod
+    def load(cls, prefix: str, lists: int = 0, nprobe: int = 8) -> 'IVFIndex':
+        with open(f'{prefix}.meta.json', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('type') != 'ivf':
+            raise ValueError(f"{prefix}: not an IVF index")
+        vectors = np.load(f'{prefix}.vectors.npy', mmap_mode='r', allow_pickle=False)
+        ids = np.load(f'{prefix}.ids.npy', allow_pickle=False)
+        centroids = np.load(f'{prefix}.centroids.npy', allow_pickle=False)
+        offsets = np.load(f'{prefix}.offsets.npy', allow_pickle=False)
+        if (vectors.shape != (meta['rows'], meta['dim']) or len(ids) != meta['rows']
+                or centroids.shape != (meta['lists'], meta['dim'])
+                or len(offsets) != meta['lists'] + 1 or offsets[-1] != meta['rows']):
+            raise ValueError(f"{prefix}: arrays do not match the metadata")
+        index = cls(meta['dim'], meta['dtype'], meta['embedder'], lists, nprobe,
+                    centroids, offsets, vectors, ids, meta['trained_rows'])
+        index.watermark = datetime.fromisoformat(meta['watermark']) if meta['watermark'] else None
+        index.generation = meta.get('generation')
+        return index
+
+    def get_stats(self) -> Dict[str, Any]:
+        base, tail = self._base, self._tail
+        sizes = np.diff(self._offsets)
+        return {
+            'rows': len(self._rows),
+            'mapped_rows': base[3],
+            'tail_rows': tail[4],
+            'tail_capacity': len(tail[1]),
+            'lists': len(self._centroids),
+            'largest_list': int(sizes.max()) if len(sizes) else 0,
+            'nprobe': self.nprobe,
+            'trained_rows': self.trained_rows,
+            'dim': self.dim,
+            'dtype': self.dtype.name,
+            'bytes': int(base[0].nbytes + tail[0].nbytes)
+        }
@@ -25,6 +25,17 @@ class Base(DeclarativeBase):
 # Import db from models to avoid circular imports
 from models import db
 
+# Настройки CORS (разрешение кросс-доменных запросов), общие с asgi.py
+CORS_OPTIONS = {
+    'origins': [
+        "https://7a0463a0-cbab-40ed-8964-1461cf93cb8a-00-tv6bvx5wqo3s.pike.replit.dev",
+        "https://*.replit.dev",  # Разрешить все поддомены replit.dev
+        "http://localhost:*",  # Для локальной разработки
+        "https://localhost:*"  # Для локальной разработки с HTTPS
+    ],
+    'supports_credentials': True
+}
+
 
 def create_app():
     """Функция создания и настройки Flask приложения"""
@@ -61,16 +72,12 @@ def create_app():
     # Инициализация базы данных с приложением
     db.init_app(app)
 
+    # Подсчёт обращений к базе данных на каждый запрос
+    import db_round_trips
+    db_round_trips.init_app(app)
+
     # Настройка CORS (разрешение кросс-доменных запросов)
-    CORS(
-        app,
-        origins=[
-            "https://7a0463a0-cbab-40ed-8964-1461cf93cb8a-00-tv6bvx5wqo3s.pike.replit.dev",
-            "https://*.replit.dev",  # Разрешить все поддомены replit.dev
-            "http://localhost:*",  # Для локальной разработки
-            "https://localhost:*"  # Для локальной разработки с HTTPS
-        ],
-        supports_credentials=True)
+    CORS(app, **CORS_OPTIONS)
 
     # Настройка системы локализации
     from localization import localization, localize_filter
@@ -97,6 +104,18 @@ def create_app():
         # Создание всех таблиц в базе данных
         db.create_all()
 
+        # Добавление новых колонок в существующие таблицы
+        from database_utils import add_missing_columns
+        add_missing_columns(db)
+
+        # Полнотекстовые индексы FAQ и базы знаний
+        from search_backend import install_search_indexes
+        install_search_indexes(db)
+
+        # Сброс кэшей при изменении базы знаний
+        from knowledge_events import install_listeners
+        install_listeners()
+
         # Инициализация начальных данных с задержкой
         # Commented out for now to avoid circular imports
         # try:
@@ -0,0 +1,241 @@
+# ASGI-точка входа: асинхронный чат-эндпоинт, остальные маршруты обслуживает Flask
+# ASGI entry point for BolashakChat
+#
+# Запуск / Run:
+#   uvicorn asgi:application --host 0.0.0.0 --port 5000 --workers 2
+#
+# POST /api/chat обрабатывается в event loop: пока ждём ответ Mistral AI,
+# поток воркера не занят, поэтому один воркер держит сотни запросов.
+# Админка и прочие страницы работают через обычное Flask-приложение.
+#
+# IP клиента берётся из scope['client']. За обратным прокси uvicorn
+# подставляет его из X-Forwarded-For, только если прокси указан в
+# --forwarded-allow-ips (FORWARDED_ALLOW_IPS), по умолчанию 127.0.0.1.
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Dict, List, Tuple
+
+from asgiref.wsgi import WsgiToAsgi
+from flask_cors.core import get_cors_headers, get_cors_options
+from werkzeug.datastructures import Headers
+
+from app import CORS_OPTIONS, app
+from conversation_memory import get_conversation_memory
+from views import initialize_agent_router
+
+logger = logging.getLogger(__name__)
+
+# Flask-приложение, обёрнутое для ASGI-сервера
+flask_application = WsgiToAsgi(app)
+
+# Маршруты, которые обрабатываются асинхронно (только POST)
+ASYNC_CHAT_PATHS = {'/api/chat', '/chat'}
+
+# Те же CORS-заголовки, что Flask-CORS добавляет к ответам Flask
+_cors_options = get_cors_options(app, CORS_OPTIONS)
+
+
+async def _read_body(receive) -> bytes:
+    """Read the full HTTP request body"""
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+def _cors_headers(scope) -> List[Tuple[bytes, bytes]]:
+    """CORS response headers for the request, as Flask-CORS computes them"""
+    request_headers = Headers([(key.decode('latin-1'), value.decode('latin-1'))
+                               for key, value in scope.get('headers', [])])
+    headers = get_cors_headers(_cors_options, request_headers, scope['method'])
+    return [(key.lower().encode('latin-1'), str(value).encode('latin-1'))
+            for key, value in headers.items(multi=True)]
+
+
+async def _send_json(send, scope, data: Dict[str, Any], status: int = 200,
+                     headers: List[Tuple[bytes, bytes]] = ()):
+    payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json; charset=utf-8'),
+            (b'content-length', str(len(payload)).encode()),
+        ] + _cors_headers(scope) + list(headers),
+    })
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+def _get_header(scope, name: bytes) -> str:
+    for key, value in scope.get('headers', []):
+        if key.lower() == name:
+            return value.decode('latin-1')
+    return ''
+
+
+def _get_client_ip(scope) -> str:
+    # X-Forwarded-For of trusted proxies is already applied by uvicorn
+    client = scope.get('client')
+    return client[0] if client else ''
+
+
+def _chat_session_id(scope) -> Tuple[str, List[Tuple[bytes, bytes]]]:
+    """Conversation id from Flask's signed session cookie, as in views._chat_session_id.
+
+    Returns the id and the Set-Cookie headers to send when a new id was
+    assigned; an id in the request body is never trusted."""
+    interface = app.session_interface
+    request = app.request_class({'HTTP_COOKIE': _get_header(scope, b'cookie')})
+    session = interface.open_session(app, request)
+    if session is None:
+        session = interface.make_null_session(app)
+    session_id = session.get('session_id')
+    if session_id:
+        return session_id, []
+    session_id = session['session_id'] = uuid.uuid4().hex
+    response = app.response_class()
+    interface.save_session(app, session, response)
+    return session_id, [(b'set-cookie', value.encode('latin-1'))
+                        for value in response.headers.getlist('Set-Cookie')]
+
+
+def _save_user_query(fields: Dict[str, Any]):
+    """Persist a UserQuery row; runs in a worker thread"""
+    from models import UserQuery, db
+
+    with app.app_context():
+        user_query = UserQuery(**fields)
+        try:
+            db.session.add(user_query)
+            db.session.flush()
+            query_id = user_query.id  # Read before the commit expires it
+            db.session.commit()
+            return query_id
+        except Exception as db_error:
+            logger.warning(f"Database error (continuing without saving): {str(db_error)}")
+            db.session.rollback()
+            return None
+
+
+async def chat(scope, receive, send):
+    """Async version of views.chat with the same request/response format"""
+    language = 'ru'
+    try:
+        try:
+            data = json.loads(await _read_body(receive) or b'null')
+        except ValueError:
+            data = None
+        if not data or 'message' not in data:
+            await _send_json(send, scope, {'success': False, 'error': 'Сообщение не найдено'}, 400)
+            return
+
+        user_message = data['message'].strip()
+        language = data.get('language', 'ru')
+        agent_type = data.get('agent')
+
+        if not user_message:
+            await _send_json(send, scope, {'success': False, 'error': 'Пустое сообщение'}, 400)
+            return
+
+        start_time = time.time()
+        session_id, cookie_headers = _chat_session_id(scope)
+        memory = get_conversation_memory()
+        history = memory.context(session_id)
+        router = initialize_agent_router()
+        await router.arefresh()
+
+        agent = router.get_agent(agent_type) if agent_type and agent_type != 'auto' else None
+        if agent:
+            result = await agent.aprocess_message(user_message, language, confidence=1.0, history=history)
+        else:
+            result = await router.aroute_message(user_message, language, history)
+
+        response_time = time.time() - start_time
+        if not result.get('fallback'):
+            memory.record(session_id, user_message, result['response'], result.get('agent_type'))
+
+        query_id = await asyncio.to_thread(_save_user_query, {
+            'user_message': user_message,
+            'bot_response': result['response'],
+            'language': language,
+            'response_time': response_time,
+            'agent_type': result.get('agent_type'),
+            'agent_name': result.get('agent_name'),
+            'agent_confidence': result.get('confidence', 0.0),
+            'context_used': result.get('context_used', False),
+            'cache_hit': result.get('cache_hit', False),
+            'fallback': bool(result.get('fallback')),
+            'semantic_source_id': result.get('semantic_source_id'),
+            'prompt_tokens': result.get('prompt_tokens'),
+            'completion_tokens': result.get('completion_tokens'),
+            'session_id': session_id,
+            'ip_address': _get_client_ip(scope),
+            'user_agent': _get_header(scope, b'user-agent')
+        })
+
+        logger.info(
+            f"Async chat response generated in {response_time:.2f}s "
+            f"by {result.get('agent_name', 'Unknown')} agent "
+            f"(confidence: {result.get('confidence', 0):.2f}) "
+            f"for language: {language}"
+        )
+
+        await _send_json(send, scope, {
+            'success': True,
+            'response': result['response'],
+            'response_time': response_time,
+            'agent_name': result.get('agent_name'),
+            'agent_type': result.get('agent_type'),
+            'confidence': result.get('confidence', 0.0),
+            'cache_hit': result.get('cache_hit', False),
+            'session_id': session_id,
+            'query_id': query_id
+        }, headers=cookie_headers)
+
+    except asyncio.CancelledError:
+        if asyncio.current_task().cancelling():
+            raise  # This request itself was cancelled: client gone or server shutting down
+        # A shared call cancelled on behalf of another request
+        logger.error("Async chat call was cancelled by another request")
+        await _send_error(send, scope, language)
+    except Exception as e:
+        logger.error(f"Error in async chat endpoint: {str(e)}")
+        await _send_error(send, scope, language)
+
+
+async def _send_error(send, scope, language: str):
+    error_message = "Извините, произошла ошибка. Попробуйте еще раз." if language == 'ru' else "Кешіріңіз, қате орын алды. Қайталап көріңіз."
+    await _send_json(send, scope, {'success': False, 'error': error_message}, 500)
+
+
+async def lifespan(receive, send):
+    """Close pooled provider connections on shutdown"""
+    from mistral_client import get_async_transport
+
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await get_async_transport().aclose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI application: async chat endpoint, Flask for everything else"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if (scope['type'] == 'http' and scope['method'] == 'POST'
+            and scope['path'] in ASYNC_CHAT_PATHS):
+        await chat(scope, receive, send)
+        return
+    await flask_application(scope, receive, send)
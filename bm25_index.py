@@ -0,0 +1,534 @@
+# BM25-индекс базы знаний в памяти процесса
+# In-process BM25 index over knowledge chunks, FAQ questions and agent knowledge
+
+import json
+import logging
+import math
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import datetime
+from heapq import nlargest
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from config import SearchConfig
+from index_journal import IndexJournal, new_generation
+from knowledge_events import on_knowledge_change
+from text_normalizer import stems
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional: scoring falls back to plain Python
+    np = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'BM25IDX1'
+MAX_TF = 255  # Term frequencies are stored in one byte; BM25 saturates long before
+COMPACT_MIN_DEAD = 1000
+NUMPY_MIN_POSTINGS = 5000  # Below this the Python loop is faster than array setup
+
+DocKey = Tuple[str, int, str]  # (source, row id, language)
+Fields = List[Tuple[str, Optional[str]]]  # (language, text) documents of one row
+
+
+class BM25Index:
+    """Inverted index with BM25 ranking.
+
+    Each term has two parallel arrays: document numbers (array('I')) and
+    term frequencies (array('B')), appended in document order. Removing a
+    document leaves a tombstone until compaction. Every row of a source table
+    becomes one document per language field.
+
+    Searches run without a lock next to a single writer: writes only append
+    or clear a liveness flag, and compaction builds a new index instead of
+    renumbering this one."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._terms: Dict[str, int] = {}
+        self._post_docs: List[array] = []
+        self._post_tfs: List[array] = []
+        self._keys: List[DocKey] = []
+        self._groups: List[Tuple[str, str, Optional[str]]] = []  # (source, language, tag)
+        self._group_codes: Dict[Tuple[str, str, Optional[str]], int] = {}
+        self._doc_group = array('H')
+        self._doc_length = array('I')
+        self._alive = bytearray()
+        self._docs: Dict[DocKey, int] = {}
+        self._rows: Dict[str, Set[int]] = {}  # Indexed row ids per source, including rows without text
+        self._total_length = 0
+        self.watermarks: Dict[str, Optional[datetime]] = {}  # Newest updated_at seen per source
+        self.generation: Optional[str] = None  # Of the saved file this index was loaded from or saved as
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @property
+    def dead(self) -> int:
+        return len(self._keys) - len(self._docs)
+
+    def rows(self, source: str) -> Set[int]:
+        return self._rows.get(source, set())
+
+    def _group(self, source: str, language: str, tag: Optional[str]) -> int:
+        group = (source, language, tag)
+        code = self._group_codes.get(group)
+        if code is None:
+            code = self._group_codes[group] = len(self._groups)
+            self._groups.append(group)
+        return code
+
+    def _add(self, key: DocKey, text: Optional[str], tag: Optional[str]):
+        counts = Counter(stems(text or ''))
+        if not counts:
+            return
+        doc = len(self._keys)
+        length = sum(counts.values())
+        self._keys.append(key)
+        self._doc_group.append(self._group(key[0], key[2], tag))
+        self._doc_length.append(length)
+        self._alive.append(1)
+        self._docs[key] = doc
+        self._total_length += length
+        for term, tf in counts.items():
+            index = self._terms.get(term)
+            if index is None:
+                index = self._terms[term] = len(self._post_docs)
+                self._post_docs.append(array('I'))
+                self._post_tfs.append(array('B'))
+            self._post_docs[index].append(doc)
+            self._post_tfs[index].append(min(tf, MAX_TF))
+
+    def _remove(self, key: DocKey):
+        doc = self._docs.pop(key, None)
+        if doc is not None:
+            self._alive[doc] = 0
+            self._total_length -= self._doc_length[doc]
+
+    def put_row(self, source: str, row_id: int, fields: Fields, tag: Optional[str] = None):
+        """Index (or reindex) every language field of one row"""
+        self.drop_row(source, row_id)
+        for language, text in fields:
+            self._add((source, row_id, language), text, tag)
+        self._rows.setdefault(source, set()).add(row_id)
+
+    def drop_row(self, source: str, row_id: int):
+        rows = self._rows.get(source)
+        if not rows or row_id not in rows:
+            return
+        rows.discard(row_id)
+        for group_source, language, _ in self._groups:
+            if group_source == source:
+                self._remove((source, row_id, language))
+
+    def needs_compaction(self) -> bool:
+        return self.dead >= max(COMPACT_MIN_DEAD, len(self._keys) // 4)
+
+    def compacted(self) -> 'BM25Index':
+        """Copy without tombstones, documents renumbered"""
+        if not self.dead:
+            return self
+        remap = array('i', [-1]) * len(self._keys)
+        keys, groups, lengths = [], array('H'), array('I')
+        for doc, key in enumerate(self._keys):
+            if self._alive[doc]:
+                remap[doc] = len(keys)
+                keys.append(key)
+                groups.append(self._doc_group[doc])
+                lengths.append(self._doc_length[doc])
+
+        terms: Dict[str, int] = {}
+        post_docs: List[array] = []
+        post_tfs: List[array] = []
+        for term, index in self._terms.items():
+            docs, tfs = array('I'), array('B')
+            for doc, tf in zip(self._post_docs[index], self._post_tfs[index]):
+                if remap[doc] >= 0:
+                    docs.append(remap[doc])
+                    tfs.append(tf)
+            if docs:
+                terms[term] = len(post_docs)
+                post_docs.append(docs)
+                post_tfs.append(tfs)
+
+        index = BM25Index(self.k1, self.b)
+        index._terms, index._post_docs, index._post_tfs = terms, post_docs, post_tfs
+        index._keys, index._doc_group, index._doc_length = keys, groups, lengths
+        index._groups = list(self._groups)
+        index._group_codes = dict(self._group_codes)
+        index._alive = bytearray(b'\x01') * len(keys)
+        index._docs = {key: doc for doc, key in enumerate(keys)}
+        index._rows = {source: set(rows) for source, rows in self._rows.items()}
+        index._total_length = self._total_length
+        index.watermarks = dict(self.watermarks)
+        index.generation = self.generation
+        return index
+
+    def search(self, terms: Sequence[str], k: int = 5, sources: Optional[Iterable[str]] = None,
+               languages: Optional[Iterable[str]] = None,
+               tag: Optional[str] = None) -> List[Tuple[DocKey, float]]:
+        """Top-k (key, score) for stemmed query terms (text_normalizer.search_terms)"""
+        total = len(self._docs)
+        if not total or not terms:
+            return []
+        sources = set(sources) if sources is not None else None
+        languages = set(languages) if languages is not None else None
+        allowed = [(sources is None or source in sources) and
+                   (languages is None or language in languages) and
+                   (tag is None or group_tag == tag)
+                   for source, language, group_tag in self._groups]
+        if not any(allowed):
+            return []
+
+        k1 = self.k1
+        norm_base = k1 * (1 - self.b)
+        norm_length = k1 * self.b / (self._total_length / total)
+        weighted = []
+        for term in terms:
+            index = self._terms.get(term)
+            if index is None:
+                continue
+            docs = self._post_docs[index]
+            # Tombstones still count towards df until the next compaction
+            df = min(len(docs), total)
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5)) * (k1 + 1)
+            weighted.append((idf, docs, self._post_tfs[index]))
+
+        if np is not None and sum(len(docs) for _, docs, _ in weighted) >= NUMPY_MIN_POSTINGS:
+            return self._top_numpy(weighted, allowed, k, norm_base, norm_length)
+
+        keys, alive, doc_group, doc_length = self._keys, self._alive, self._doc_group, self._doc_length
+        scores: Dict[int, float] = {}
+        for idf, docs, tfs in weighted:
+            for doc, tf in zip(docs, tfs):
+                if alive[doc] and allowed[doc_group[doc]]:
+                    scores[doc] = scores.get(doc, 0.0) + idf * tf / (
+                        tf + norm_base + norm_length * doc_length[doc])
+        return [(keys[doc], score) for doc, score in nlargest(k, scores.items(), key=itemgetter(1))]
+
+    def _top_numpy(self, weighted, allowed: List[bool], k: int, norm_base: float,
+                   norm_length: float) -> List[Tuple[DocKey, float]]:
+        """Vectorized scoring for common terms with long postings"""
+        keys = self._keys
+        count = len(keys)
+        # Slices are copies: a buffer exported by the live arrays would block appends
+        length = np.frombuffer(self._doc_length[:count], dtype=np.uint32)
+        visible = np.frombuffer(bytes(self._alive[:count]), dtype=np.uint8).astype(bool)
+        visible &= np.array(allowed, dtype=bool)[np.frombuffer(self._doc_group[:count], dtype=np.uint16)]
+        denominator = norm_base + norm_length * length
+        scores = np.zeros(count)
+        for idf, docs, tfs in weighted:
+            size = min(len(docs), len(tfs))
+            docs = np.frombuffer(docs[:size], dtype=np.uint32)
+            tfs = np.frombuffer(tfs[:size], dtype=np.uint8).astype(np.float64)
+            # Skip documents appended after this search started
+            keep = docs < count
+            docs, tfs = docs[keep], tfs[keep]
+            scores[docs] += idf * tfs / (tfs + denominator[docs])
+        scores[~visible] = 0.0
+        hits = np.flatnonzero(scores)
+        if len(hits) > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind='stable')]
+        return [(keys[doc], float(scores[doc])) for doc in hits]
+
+    def save(self, path: str):
+        """Write the index without tombstones, atomically: a JSON header, then raw arrays"""
+        index = self.compacted()
+        offsets = array('Q', [0])
+        post_docs, post_tfs = array('I'), array('B')
+        for docs, tfs in zip(index._post_docs, index._post_tfs):
+            post_docs.extend(docs)
+            post_tfs.extend(tfs)
+            offsets.append(len(post_docs))
+        header = json.dumps({
+            'k1': index.k1,
+            'b': index.b,
+            'byteorder': sys.byteorder,
+            'terms': sorted(index._terms, key=index._terms.get),
+            'keys': index._keys,
+            'groups': index._groups,
+            'rows': {source: sorted(rows) for source, rows in index._rows.items()},
+            'watermarks': {source: value.isoformat() if value else None
+                           for source, value in index.watermarks.items()},
+            'generation': index.generation
+        }, ensure_ascii=False).encode('utf-8')
+
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<Q', len(header)))
+            f.write(header)
+            for values in (index._doc_group, index._doc_length, offsets, post_docs, post_tfs):
+                f.write(struct.pack('<Q', len(values)))
+                values.tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'BM25Index':
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a BM25 index")
+            (size,) = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(size).decode('utf-8'))
+            arrays = []
+            for typecode in ('H', 'I', 'Q', 'I', 'B'):
+                (count,) = struct.unpack('<Q', f.read(8))
+                values = array(typecode)
+                values.fromfile(f, count)
+                if header['byteorder'] != sys.byteorder:
+                    values.byteswap()
+                arrays.append(values)
+
+        doc_group, doc_length, offsets, post_docs, post_tfs = arrays
+        index = cls(header['k1'], header['b'])
+        index._terms = {term: i for i, term in enumerate(header['terms'])}
+        index._post_docs = [post_docs[offsets[i]:offsets[i + 1]] for i in range(len(header['terms']))]
+        index._post_tfs = [post_tfs[offsets[i]:offsets[i + 1]] for i in range(len(header['terms']))]
+        index._keys = [tuple(key) for key in header['keys']]
+        index._groups = [tuple(group) for group in header['groups']]
+        index._group_codes = {group: code for code, group in enumerate(index._groups)}
+        index._doc_group, index._doc_length = doc_group, doc_length
+        index._alive = bytearray(b'\x01') * len(index._keys)
+        index._docs = {key: doc for doc, key in enumerate(index._keys)}
+        index._rows = {source: set(rows) for source, rows in header['rows'].items()}
+        index._total_length = sum(doc_length)
+        index.watermarks = {source: datetime.fromisoformat(value) if value else None
+                            for source, value in header['watermarks'].items()}
+        index.generation = header.get('generation')
+        return index
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'documents': len(self._docs),
+            'dead': self.dead,
+            'terms': len(self._terms),
+            'postings': sum(len(docs) for docs in self._post_docs),
+            'rows': {source: len(rows) for source, rows in self._rows.items()}
+        }
+
+
+def _kb_fields(row) -> Fields:
+    return [('any', row.content_chunk)]
+
+
+def _faq_fields(row) -> Fields:
+    return [('ru', row.question_ru), ('kz', row.question_kz)]
+
+
+def _agent_fields(row) -> Fields:
+    return [('ru', f"{row.title} {row.content_ru}"),
+            ('kz', f"{row.title} {row.content_kz or ''}"),
+            ('en', row.content_en)]
+
+
+# source -> (model name, text columns, row fields, tag column)
+SOURCES: Dict[str, Tuple[str, Tuple[str, ...], Callable[[Any], Fields], Optional[str]]] = {
+    'kb': ('KnowledgeBase', ('content_chunk',), _kb_fields, None),
+    'faq': ('FAQ', ('question_ru', 'question_kz'), _faq_fields, None),
+    'agent': ('AgentKnowledgeBase', ('agent_type', 'title', 'content_ru', 'content_kz', 'content_en'),
+              _agent_fields, 'agent_type'),
+}
+
+
+class BM25Store:
+    """Owns this process's index and keeps it in step with the database.
+
+    The first access loads the saved index file (or builds and saves it);
+    afterwards rows with a newer updated_at are reindexed and deleted rows are
+    found by an id diff whenever the active row count disagrees, so neither
+    startup nor updates rebuild the whole index.
+
+    Changes after a save are appended to a journal next to the file and
+    replayed on load; the file is rewritten only once checkpoint_rows row
+    changes have been journaled."""
+
+    def __init__(self, path: Optional[str] = None, refresh_interval: float = 30,
+                 k1: float = 1.2, b: float = 0.75, checkpoint_rows: int = 2000):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.k1 = k1
+        self.b = b
+        self.checkpoint_rows = checkpoint_rows
+        self.journal = IndexJournal(f'{path}.journal') if path else None
+        self._index: Optional[BM25Index] = None
+        self._version = 0
+        self._synced_version = -1
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'builds': 0, 'loads': 0, 'syncs': 0, 'rows_synced': 0, 'saves': 0,
+                      'journal_replayed': 0}
+
+    def invalidate(self):
+        self._version += 1
+
+    def index(self) -> BM25Index:
+        """Current index; must be called inside an app context"""
+        index = self._index
+        now = time.monotonic()
+        if (index is not None and self._synced_version == self._version
+                and now - self._checked_at < self.refresh_interval):
+            return index
+
+        # Only the first load waits; later syncs never block readers
+        if not self._lock.acquire(blocking=index is None):
+            return index
+        try:
+            version = self._version
+            if self._index is None:
+                self._index = self._open()
+            elif self._sync(self._index):
+                self._compact()
+                self._checkpoint()
+            self._synced_version = version
+            self._checked_at = now
+            return self._index
+        finally:
+            self._lock.release()
+
+    def _open(self) -> BM25Index:
+        if self.path and os.path.exists(self.path):
+            try:
+                index = BM25Index.load(self.path)
+                self.stats['loads'] += 1
+                self._replay(index)
+                self._sync(index)
+                if self.journal.rows >= self.checkpoint_rows:
+                    self._save(index)
+                logger.info(f"BM25 index loaded from {self.path}: {len(index)} documents")
+                return index
+            except Exception as e:
+                logger.error(f"Error loading BM25 index from {self.path}, rebuilding: {str(e)}")
+        index = BM25Index(self.k1, self.b)
+        self._sync(index)
+        self.stats['builds'] += 1
+        self._save(index)
+        logger.info(f"BM25 index built: {len(index)} documents")
+        return index
+
+    def _compact(self):
+        # Readers keep the index they started with
+        if self._index.needs_compaction():
+            self._index = self._index.compacted()
+
+    def _checkpoint(self):
+        """Rewrite the file once the journal has grown past checkpoint_rows"""
+        if self.journal is not None and self.journal.rows >= self.checkpoint_rows:
+            self._save(self._index)
+
+    def _save(self, index: BM25Index):
+        """Write the whole index as a new generation and truncate the journal"""
+        if not self.path:
+            return
+        previous, index.generation = index.generation, new_generation()
+        try:
+            index.save(self.path)
+            self.stats['saves'] += 1
+        except OSError as e:
+            index.generation = previous
+            logger.error(f"Error saving BM25 index to {self.path}: {str(e)}")
+            return
+        self.journal.reset()
+
+    def _journal(self, index: BM25Index, source: Optional[str] = None, removed: Sequence[int] = (),
+                 added: Sequence[Tuple[int, Fields, Optional[str]]] = (), watermarks: bool = False):
+        if self.journal is None or not (removed or added or watermarks):
+            return
+        record: Dict[str, Any] = {'source': source, 'removed': list(removed), 'added': list(added)}
+        if watermarks:
+            record['watermarks'] = {name: value.isoformat() if value else None
+                                    for name, value in index.watermarks.items()}
+        self.journal.append(index.generation, record, len(removed) + len(added))
+
+    def _replay(self, index: BM25Index):
+        """Apply the journaled changes made after the file was saved"""
+        replayed = 0
+        for record in self.journal.replay(index.generation):
+            source = record['source']
+            for row_id in record['removed']:
+                index.drop_row(source, row_id)
+            for row_id, fields, tag in record['added']:
+                index.put_row(source, row_id, fields, tag)
+            if 'watermarks' in record:
+                index.watermarks = {name: datetime.fromisoformat(value) if value else None
+                                    for name, value in record['watermarks'].items()}
+            replayed += record['rows']
+        self.stats['journal_replayed'] += replayed
+
+    def _sync(self, index: BM25Index) -> int:
+        """Apply database changes since the index watermarks; returns rows touched"""
+        import models
+        from database_utils import sync_changed_rows
+
+        touched = 0
+        for source, (model_name, columns, fields, tag_column) in SOURCES.items():
+            def put(rows):
+                added = [(row.id, fields(row), getattr(row, tag_column) if tag_column else None)
+                         for row in rows]
+                for row_id, row_fields, tag in added:
+                    index.put_row(source, row_id, row_fields, tag)
+                self._journal(index, source, added=added)
+
+            def drop(row_ids):
+                for row_id in row_ids:
+                    index.drop_row(source, row_id)
+                self._journal(index, source, removed=row_ids)
+
+            index.watermarks[source], count = sync_changed_rows(
+                getattr(models, model_name), columns, index.watermarks.get(source),
+                lambda: index.rows(source), put, drop)
+            touched += count
+        if touched:
+            self._journal(index, watermarks=True)
+
+        self.stats['syncs'] += 1
+        self.stats['rows_synced'] += touched
+        return touched
+
+    def apply(self, source: str, removed: Iterable[int] = (),
+              added: Iterable[Tuple[int, Fields]] = (), tag: Optional[str] = None):
+        """Incremental update from a writer in this process, journaled at once"""
+        if self._index is None:
+            return  # Not in use in this process
+        with self._lock:
+            index = self._index
+            removed = list(removed)
+            added = [(row_id, fields, tag) for row_id, fields in added]
+            for row_id in removed:
+                index.drop_row(source, row_id)
+            for row_id, fields, _ in added:
+                index.put_row(source, row_id, fields, tag)
+            self._journal(index, source, removed, added)
+            self._compact()
+            self._checkpoint()
+
+    def get_stats(self) -> Dict[str, Any]:
+        index = self._index
+        return dict(self.stats, loaded=index is not None,
+                    journal_rows=self.journal.rows if self.journal else 0,
+                    **(index.get_stats() if index else {}))
+
+
+_bm25_store = BM25Store(path=SearchConfig.BM25_INDEX_PATH,
+                       refresh_interval=SearchConfig.SEARCH_INDEX_REFRESH_INTERVAL,
+                       k1=SearchConfig.BM25_K1, b=SearchConfig.BM25_B,
+                       checkpoint_rows=SearchConfig.SEARCH_INDEX_CHECKPOINT_ROWS)
+
+
+def get_bm25_store() -> BM25Store:
+    return _bm25_store
+
+
+def _invalidate_on_knowledge_change(tables: Set[str]):
+    if tables & {'faqs', 'knowledge_base', 'agent_knowledge_base'}:
+        _bm25_store.invalidate()
+
+
+on_knowledge_change(_invalidate_on_knowledge_change)
@@ -0,0 +1,265 @@
+# Изоляция агентов: собственный лимит параллельности и очередь для каждого
+# Per-agent bulkheads with priority-based load shedding
+
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from config import BulkheadConfig
+from resilience import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+
+class BulkheadRejected(Exception):
+    """The agent is saturated: queue full, load shed or wait timed out"""
+
+
+class BulkheadGroup:
+    """Shared load signal: requests running or waiting (each holds a worker) across all agents"""
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._busy = 0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        with self._lock:
+            self._busy += 1
+
+    def leave(self):
+        with self._lock:
+            self._busy -= 1
+
+    def utilization(self) -> float:
+        return self._busy / self.capacity
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'busy': self._busy, 'capacity': self.capacity,
+                'utilization': round(self.utilization(), 3)}
+
+
+class Bulkhead:
+    """Concurrency limit with a bounded wait queue for one agent.
+
+    Once the group utilization reaches shed_utilization, requests that
+    cannot start at once are rejected instead of queued; lower-priority
+    agents get a lower threshold and so shed first."""
+
+    def __init__(self, name: str, max_concurrency: int = 8, max_queue: int = 16,
+                 queue_timeout: float = 5, shed_utilization: float = 1.0,
+                 group: Optional[BulkheadGroup] = None, enabled: bool = True):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.shed_utilization = shed_utilization
+        self.group = group
+        self.enabled = enabled
+        self._in_flight = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._wait_times = LatencyTracker(size=500)
+        self.stats = {'admitted': 0, 'rejected_queue_full': 0, 'shed': 0,
+                      'timed_out': 0, 'max_queue_depth': 0}
+
+    @classmethod
+    def for_agent(cls, agent_type: str, priority: int) -> 'Bulkhead':
+        """The agent type's bulkhead with limits from BulkheadConfig and the
+        shedding threshold from the agent priority (1 = highest).
+
+        One instance per agent type for the life of the process: agents
+        rebuilt by the registry take over the slots of the ones they replace."""
+        shed_utilization = max(BulkheadConfig.SHED_MIN_UTILIZATION,
+                               1.0 - (max(priority, 1) - 1) * BulkheadConfig.SHED_STEP)
+        with _bulkheads_lock:
+            bulkhead = _bulkheads.get(agent_type)
+            if bulkhead is None:
+                bulkhead = _bulkheads[agent_type] = cls(
+                    agent_type, group=_group, enabled=BulkheadConfig.ENABLED)
+        bulkhead.configure(
+            max_concurrency=BulkheadConfig.AGENT_MAX_CONCURRENCY.get(
+                agent_type, BulkheadConfig.MAX_CONCURRENCY),
+            max_queue=BulkheadConfig.AGENT_MAX_QUEUE.get(agent_type, BulkheadConfig.MAX_QUEUE),
+            queue_timeout=BulkheadConfig.QUEUE_TIMEOUT,
+            shed_utilization=shed_utilization)
+        return bulkhead
+
+    def configure(self, max_concurrency: int, max_queue: int, queue_timeout: float,
+                  shed_utilization: float):
+        """Change the limits in place; requests in flight keep their slots.
+        A lower limit only holds back new admissions until enough finish"""
+        with self._cond:
+            self.max_concurrency = max(1, max_concurrency)
+            self.max_queue = max_queue
+            self.queue_timeout = queue_timeout
+            self.shed_utilization = shed_utilization
+            # A higher limit may admit waiting requests at once
+            self._cond.notify_all()
+
+    def _arrive(self) -> bool:
+        """Called under the lock: True if admitted at once, False to wait; raises if rejected"""
+        if self._in_flight < self.max_concurrency and not self._waiting:
+            self._admit(0.0)
+            self._group_enter()
+            return True
+        if self.group is not None and self.group.utilization() >= self.shed_utilization:
+            self.stats['shed'] += 1
+            raise BulkheadRejected(f"{self.name}: shedding load")
+        if self._waiting >= self.max_queue:
+            self.stats['rejected_queue_full'] += 1
+            raise BulkheadRejected(f"{self.name}: queue is full")
+        self._waiting += 1
+        self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], self._waiting)
+        self._group_enter()
+        return False
+
+    def _group_enter(self):
+        if self.group is not None:
+            self.group.enter()
+
+    def _group_leave(self):
+        if self.group is not None:
+            self.group.leave()
+
+    def _admit(self, waited: float):
+        self._in_flight += 1
+        self.stats['admitted'] += 1
+        self._wait_times.record(waited)
+
+    def acquire(self):
+        if not self.enabled:
+            return
+        started = time.monotonic()
+        with self._cond:
+            if self._arrive():
+                return
+            deadline = started + self.queue_timeout
+            try:
+                while self._in_flight >= self.max_concurrency:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats['timed_out'] += 1
+                        self._group_leave()
+                        raise BulkheadRejected(f"{self.name}: timed out waiting for a slot")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._admit(time.monotonic() - started)
+
+    async def acquire_async(self):
+        if not self.enabled:
+            return
+        started = time.monotonic()
+        with self._cond:
+            if self._arrive():
+                return
+        deadline = started + self.queue_timeout
+        admitted = False
+        try:
+            while not admitted:
+                with self._cond:
+                    if self._in_flight < self.max_concurrency:
+                        self._admit(time.monotonic() - started)
+                        admitted = True
+                        break
+                    if time.monotonic() >= deadline:
+                        self.stats['timed_out'] += 1
+                        raise BulkheadRejected(f"{self.name}: timed out waiting for a slot")
+                # Poll: the loop must not block on the threading condition
+                await asyncio.sleep(0.01)
+        finally:
+            with self._cond:
+                self._waiting -= 1
+            if not admitted:
+                # Timed out or cancelled
+                self._group_leave()
+
+    def release(self):
+        if not self.enabled:
+            return
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+        self._group_leave()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self):
+        await self.acquire_async()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            p50 = self._wait_times.percentile(50)
+            p95 = self._wait_times.percentile(95)
+            return dict(
+                self.stats,
+                enabled=self.enabled,
+                in_flight=self._in_flight,
+                queued=self._waiting,
+                max_concurrency=self.max_concurrency,
+                max_queue=self.max_queue,
+                saturation=round(self._in_flight / self.max_concurrency, 3),
+                shed_utilization=round(self.shed_utilization, 3),
+                wait_p50=round(p50, 3) if p50 is not None else None,
+                wait_p95=round(p95, 3) if p95 is not None else None
+            )
+
+
+class SlotStream:
+    """Iterator that frees a bulkhead slot once the stream is exhausted,
+    closed or dropped, including when it was never started"""
+
+    def __init__(self, stream: Iterator[str], bulkhead: Bulkhead):
+        self._stream = iter(stream)
+        self._bulkhead = bulkhead
+        self._released = False
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        try:
+            return next(self._stream)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        try:
+            close = getattr(self._stream, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self._bulkhead.release()
+
+    def __del__(self):
+        self.close()
+
+
+_group = BulkheadGroup(BulkheadConfig.TOTAL_CONCURRENCY)
+_bulkheads: Dict[str, Bulkhead] = {}
+_bulkheads_lock = threading.Lock()
+
+
+def get_bulkhead_group() -> BulkheadGroup:
+    return _group
@@ -0,0 +1,106 @@
+# Кэш ответов LLM по отпечатку промпта
+# LLM completion cache keyed by prompt fingerprint
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+from config import CacheConfig
+from knowledge_events import on_knowledge_change
+
+logger = logging.getLogger(__name__)
+
+_whitespace_re = re.compile(r'\s+')
+
+
+def normalize_message(message: str) -> str:
+    """Normalize a user message so trivial variations share a cache entry"""
+    text = _whitespace_re.sub(' ', message.lower()).strip()
+    return text.rstrip(' ?!.,;:')
+
+
+def make_cache_key(model: str, system_prompt: str, context: str,
+                   message: str, language: str, history: str = "") -> str:
+    """Hash of everything that determines the completion (history: its fingerprint)"""
+    fingerprint = hashlib.sha256()
+    for part in (model, system_prompt, context, normalize_message(message), language, history):
+        fingerprint.update(part.encode('utf-8'))
+        fingerprint.update(b'\x00')
+    return fingerprint.hexdigest()
+
+
+class CompletionCache:
+    """Thread-safe LRU cache with TTL for provider completions"""
+
+    def __init__(self, max_size: int = 1000, ttl: float = 3600, enabled: bool = True):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = enabled
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: str):
+        if not self.enabled or not value:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations
+        }
+
+
+_completion_cache = CompletionCache(max_size=CacheConfig.COMPLETION_CACHE_SIZE,
+                                    ttl=CacheConfig.COMPLETION_CACHE_TTL,
+                                    enabled=CacheConfig.COMPLETION_CACHE_ENABLED)
+
+
+def get_completion_cache() -> CompletionCache:
+    """Get the process-wide completion cache"""
+    return _completion_cache
+
+
+def _invalidate_on_knowledge_change(tables: Set[str]):
+    logger.info(f"Knowledge changed in {', '.join(sorted(tables))}, clearing completion cache")
+    _completion_cache.clear()
+
+
+on_knowledge_change(_invalidate_on_knowledge_change)
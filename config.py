@@ -107,6 +107,8 @@ class AgentConfig:
     # Agent knowledge base settings
     AGENT_KNOWLEDGE_ENABLED = os.environ.get('AGENT_KNOWLEDGE_ENABLED', 'true').lower() == 'true'
     DEFAULT_AGENT_PRIORITY = int(os.environ.get('DEFAULT_AGENT_PRIORITY', '1'))
+    KNOWLEDGE_REFRESH_INTERVAL = float(os.environ.get('KNOWLEDGE_REFRESH_INTERVAL', '30'))  # Seconds between checks for changes made by other workers
+    AGENT_REGISTRY_REFRESH_INTERVAL = float(os.environ.get('AGENT_REGISTRY_REFRESH_INTERVAL', '30'))  # Same, for agent_types
     
     # Agent response settings
     MAX_RESPONSE_LENGTH = int(os.environ.get('MAX_RESPONSE_LENGTH', '2000'))
@@ -121,6 +123,190 @@ class AgentConfig:
         'communication': 'Агент по вопросам общения'
     }
 
+class FanoutConfig:
+    """Ask several agents at once when routing is ambiguous"""
+    
+    ENABLED = os.environ.get('AGENT_FANOUT_ENABLED', 'false').lower() == 'true'  # Multiplies LLM calls for ambiguous messages
+    TOP_K = int(os.environ.get('AGENT_FANOUT_TOP_K', '2'))
+    MARGIN = float(os.environ.get('AGENT_FANOUT_MARGIN', '0.1'))  # Confidence gap to the best agent
+    DEADLINE = float(os.environ.get('AGENT_FANOUT_DEADLINE', '20'))  # Seconds for the whole fan-out
+    STRATEGY = os.environ.get('AGENT_FANOUT_STRATEGY', 'score')  # 'score' (best of all) or 'fastest' (first acceptable)
+    MAX_WORKERS = int(os.environ.get('AGENT_FANOUT_MAX_WORKERS', '16'))
+
+class BulkheadConfig:
+    """Per-agent concurrency isolation"""
+    
+    ENABLED = os.environ.get('AGENT_BULKHEADS_ENABLED', 'true').lower() == 'true'
+    MAX_CONCURRENCY = int(os.environ.get('AGENT_MAX_CONCURRENCY', '8'))  # Per agent
+    MAX_QUEUE = int(os.environ.get('AGENT_MAX_QUEUE', '16'))  # Per agent
+    QUEUE_TIMEOUT = float(os.environ.get('AGENT_QUEUE_TIMEOUT', '5'))
+    TOTAL_CONCURRENCY = int(os.environ.get('AGENT_TOTAL_CONCURRENCY', '32'))  # Worker threads shared by all agents
+    # Load shedding: priority 1 queues until the group is full, each next
+    # priority level starts rejecting SHED_STEP earlier
+    SHED_STEP = float(os.environ.get('AGENT_SHED_STEP', '0.1'))
+    SHED_MIN_UTILIZATION = float(os.environ.get('AGENT_SHED_MIN_UTILIZATION', '0.6'))
+    
+    # Per-agent overrides
+    AGENT_MAX_CONCURRENCY = {
+        'kadrai': 12,  # Staff requests get predictable latency
+        'uniroom': 6  # Bursts during move-in week
+    }
+    AGENT_MAX_QUEUE = {
+        'kadrai': 24,
+        'uniroom': 8
+    }
+
+class IntentConfig:
+    """Statistical agent routing (optional, needs NumPy and a trained model)"""
+    
+    INTENT_CLASSIFIER_ENABLED = os.environ.get('INTENT_CLASSIFIER_ENABLED', 'true').lower() == 'true'
+    INTENT_MODEL_PATH = os.environ.get('INTENT_MODEL_PATH', 'intent_model.npz')
+    INTENT_MIN_CONFIDENCE = float(os.environ.get('INTENT_MIN_CONFIDENCE', '0.6'))  # Below this the keyword router decides
+    INTENT_MODEL_CHECK_INTERVAL = float(os.environ.get('INTENT_MODEL_CHECK_INTERVAL', '60'))  # Seconds between model file checks
+
+class TokenBudgetConfig:
+    """Prompt size limits for LLM calls"""
+    
+    # Total prompt budget: system prompt + knowledge context + user question
+    PROMPT_TOKEN_BUDGET = int(os.environ.get('PROMPT_TOKEN_BUDGET', '2000'))
+    COMPLETION_MAX_TOKENS = int(os.environ.get('COMPLETION_MAX_TOKENS', '500'))
+    MAX_CONTEXT_ENTRIES = int(os.environ.get('MAX_CONTEXT_ENTRIES', '3'))
+    MIN_PART_TOKENS = int(os.environ.get('MIN_PART_TOKENS', '64'))  # Smaller leftovers are not worth a trimmed entry
+    
+    # Per-agent overrides
+    AGENT_PROMPT_BUDGETS = {
+        'ai_abitur': 2000,
+        'kadrai': 1800,
+        'uninav': 3000,  # Academic regulations are long
+        'career_navigator': 1800,
+        'uniroom': 1500
+    }
+    AGENT_MAX_TOKENS = {
+        'ai_abitur': 600,
+        'kadrai': 500,
+        'uninav': 600,
+        'career_navigator': 500,
+        'uniroom': 400
+    }
+
+class SearchConfig:
+    """Full-text search over FAQ questions and knowledge base chunks"""
+    
+    # 'auto': database full-text search where available, otherwise BM25; 'database', 'bm25' or 'like'
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')
+    SEARCH_MAX_TERMS = int(os.environ.get('SEARCH_MAX_TERMS', '8'))  # Query stems OR-ed into one ranked search
+    
+    SEARCH_INDEX_REFRESH_INTERVAL = float(os.environ.get('SEARCH_INDEX_REFRESH_INTERVAL', '30'))  # Seconds between checks for changes made by other workers
+    SEARCH_INDEX_CHECKPOINT_ROWS = int(os.environ.get('SEARCH_INDEX_CHECKPOINT_ROWS', '2000'))  # Journaled row changes before an index file is rewritten
+    
+    # In-process BM25 index
+    BM25_INDEX_PATH = os.environ.get('BM25_INDEX_PATH', 'bm25_index.bin')  # Loaded by workers at startup instead of rebuilding
+    BM25_K1 = float(os.environ.get('BM25_K1', '1.2'))
+    BM25_B = float(os.environ.get('BM25_B', '0.75'))
+    
+    # Dense-vector index over knowledge chunks (needs NumPy)
+    VECTOR_SEARCH_ENABLED = os.environ.get('VECTOR_SEARCH_ENABLED', 'false').lower() == 'true'
+    VECTOR_INDEX_PATH = os.environ.get('VECTOR_INDEX_PATH', 'vector_index')  # Prefix of the .npy matrix, ids and metadata files
+    VECTOR_EMBEDDER = os.environ.get('VECTOR_EMBEDDER', 'hashed')  # 'hashed' or 'package.module:factory'
+    VECTOR_DIM = int(os.environ.get('VECTOR_DIM', '256'))
+    VECTOR_DTYPE = os.environ.get('VECTOR_DTYPE', 'float32')  # float16 halves memory but each block is converted per query (~5x slower)
+    VECTOR_BLOCK_ROWS = int(os.environ.get('VECTOR_BLOCK_ROWS', '16384'))  # Rows scored per matrix multiplication
+    
+    # Approximate search (IVF-flat) for large knowledge bases; 'flat' scans every chunk
+    VECTOR_INDEX_TYPE = os.environ.get('VECTOR_INDEX_TYPE', 'flat')  # 'flat' or 'ivf'
+    VECTOR_IVF_LISTS = int(os.environ.get('VECTOR_IVF_LISTS', '0'))  # k-means lists; 0: about sqrt(chunks)
+    VECTOR_IVF_NPROBE = int(os.environ.get('VECTOR_IVF_NPROBE', '8'))  # Lists scanned per query: higher is slower with better recall (ann_benchmark.py)
+
+class RetrievalConfig:
+    """Hybrid retrieval: rankings over agent knowledge, FAQ and knowledge base fused by RRF"""
+    
+    TOP_K = int(os.environ.get('RETRIEVAL_TOP_K', '3'))  # Fused passages returned per message
+    PER_RANKER = int(os.environ.get('RETRIEVAL_PER_RANKER', '8'))  # Candidates taken from each ranking
+    RRF_K = int(os.environ.get('RETRIEVAL_RRF_K', '60'))  # Larger values flatten the rank discount
+    
+    # Ranker weights in the fused score
+    RANKER_WEIGHTS = {
+        'agent_keywords': 1.0,
+        'agent_lexical': 1.0,
+        'faq_lexical': 1.0,
+        'kb_lexical': 1.0,
+        'kb_vector': 1.0
+    }
+
+class MistralConfig:
+    """Mistral AI client and shared HTTP transport settings"""
+    
+    # Model settings
+    MODEL = os.environ.get('MISTRAL_MODEL', 'mistral-small-latest')
+    BASE_URL = os.environ.get('MISTRAL_BASE_URL', 'https://api.mistral.ai/v1')  # Point at mistral_stub.py for offline load tests
+    
+    # Connection pool shared by all agents in the process
+    POOL_CONNECTIONS = int(os.environ.get('MISTRAL_POOL_CONNECTIONS', '4'))  # Number of host pools
+    POOL_MAXSIZE = int(os.environ.get('MISTRAL_POOL_MAXSIZE', '20'))  # Connections kept per host
+    POOL_BLOCK = os.environ.get('MISTRAL_POOL_BLOCK', 'true').lower() == 'true'  # Wait for a free connection instead of opening extra ones
+    
+    # Timeouts (seconds)
+    CONNECT_TIMEOUT = float(os.environ.get('MISTRAL_CONNECT_TIMEOUT', '5'))
+    READ_TIMEOUT = float(os.environ.get('MISTRAL_READ_TIMEOUT', '30'))
+    
+    # HTTP keep-alive limits
+    KEEPALIVE_EXPIRY = float(os.environ.get('MISTRAL_KEEPALIVE_EXPIRY', '60'))  # Recycle pool after this many idle seconds
+    KEEPALIVE_MAX_REQUESTS = int(os.environ.get('MISTRAL_KEEPALIVE_MAX_REQUESTS', '1000'))  # Recycle pool after this many requests
+    
+    # Identical concurrent questions share one provider call
+    COALESCE_REQUESTS = os.environ.get('MISTRAL_COALESCE_REQUESTS', 'true').lower() == 'true'
+
+class RateLimitConfig:
+    """Client-side limits for calls to the LLM provider (per process)"""
+    
+    RATE_LIMIT_ENABLED = os.environ.get('LLM_RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    REQUESTS_PER_SECOND = float(os.environ.get('LLM_REQUESTS_PER_SECOND', '5'))
+    BURST = float(os.environ.get('LLM_BURST', '10'))  # Requests allowed at once after an idle period
+    TOKENS_PER_MINUTE = float(os.environ.get('LLM_TOKENS_PER_MINUTE', '500000'))
+    MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '16'))
+    
+    # Waiting queue
+    MAX_QUEUE = int(os.environ.get('LLM_MAX_QUEUE', '200'))
+    QUEUE_TIMEOUT = float(os.environ.get('LLM_QUEUE_TIMEOUT', '15'))  # Seconds before the fallback answer is served
+
+class ResilienceConfig:
+    """Provider failure handling: circuit breaker, retries, hedged requests"""
+    
+    # Circuit breaker
+    BREAKER_ENABLED = os.environ.get('BREAKER_ENABLED', 'true').lower() == 'true'
+    BREAKER_WINDOW = float(os.environ.get('BREAKER_WINDOW', '60'))  # Sliding window in seconds
+    BREAKER_MIN_REQUESTS = int(os.environ.get('BREAKER_MIN_REQUESTS', '10'))  # Calls in window before it may trip
+    BREAKER_ERROR_RATE = float(os.environ.get('BREAKER_ERROR_RATE', '0.5'))
+    BREAKER_SLOW_CALL_SECONDS = float(os.environ.get('BREAKER_SLOW_CALL_SECONDS', '10'))
+    BREAKER_SLOW_CALL_RATE = float(os.environ.get('BREAKER_SLOW_CALL_RATE', '0.5'))
+    BREAKER_OPEN_SECONDS = float(os.environ.get('BREAKER_OPEN_SECONDS', '30'))  # Time before a probe request
+    
+    # Bounded retries for retryable status codes and connection errors
+    RETRY_MAX_ATTEMPTS = int(os.environ.get('RETRY_MAX_ATTEMPTS', '2'))  # Retries after the first attempt
+    RETRY_BASE_DELAY = float(os.environ.get('RETRY_BASE_DELAY', '0.25'))
+    RETRY_MAX_DELAY = float(os.environ.get('RETRY_MAX_DELAY', '2'))
+    
+    # Hedged requests: second attempt after the p95 latency
+    HEDGING_ENABLED = os.environ.get('HEDGING_ENABLED', 'false').lower() == 'true'
+    HEDGE_PERCENTILE = float(os.environ.get('HEDGE_PERCENTILE', '95'))
+    HEDGE_MIN_DELAY = float(os.environ.get('HEDGE_MIN_DELAY', '1.0'))  # Never hedge earlier than this
+    HEDGE_MIN_SAMPLES = int(os.environ.get('HEDGE_MIN_SAMPLES', '20'))  # Latency samples needed to hedge
+    HEDGE_MAX_WORKERS = int(os.environ.get('HEDGE_MAX_WORKERS', '32'))
+
+class CacheConfig:
+    """Response cache settings"""
+    
+    # Exact-match completion cache in front of the LLM provider
+    COMPLETION_CACHE_ENABLED = os.environ.get('COMPLETION_CACHE_ENABLED', 'true').lower() == 'true'
+    COMPLETION_CACHE_SIZE = int(os.environ.get('COMPLETION_CACHE_SIZE', '1000'))  # Max cached completions
+    COMPLETION_CACHE_TTL = float(os.environ.get('COMPLETION_CACHE_TTL', '3600'))  # 1 hour
+    
+    # Semantic cache of liked answers for paraphrased questions
+    SEMANTIC_CACHE_ENABLED = os.environ.get('SEMANTIC_CACHE_ENABLED', 'true').lower() == 'true'
+    SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.85'))  # Cosine similarity
+    SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get('SEMANTIC_CACHE_MAX_ENTRIES', '5000'))
+    SEMANTIC_CACHE_REFRESH_INTERVAL = float(os.environ.get('SEMANTIC_CACHE_REFRESH_INTERVAL', '300'))  # Reload likes every 5 minutes
+
 class SessionConfig:
     """Session management configuration"""
     
@@ -130,7 +316,11 @@ class SessionConfig:
     
     # User context isolation
     ENABLE_USER_CONTEXT = os.environ.get('ENABLE_USER_CONTEXT', 'true').lower() == 'true'
-    MAX_CONTEXT_HISTORY = int(os.environ.get('MAX_CONTEXT_HISTORY', '10'))
+    MAX_CONTEXT_HISTORY = int(os.environ.get('MAX_CONTEXT_HISTORY', '10'))  # Turns kept verbatim per session
+    CONVERSATION_MAX_SESSIONS = int(os.environ.get('CONVERSATION_MAX_SESSIONS', '5000'))  # Least recently used sessions are dropped
+    HISTORY_TOKEN_BUDGET = int(os.environ.get('HISTORY_TOKEN_BUDGET', '500'))  # Turns plus summary, taken from PROMPT_TOKEN_BUDGET
+    SUMMARY_TOKEN_BUDGET = int(os.environ.get('SUMMARY_TOKEN_BUDGET', '150'))
+    TURN_TOKEN_LIMIT = int(os.environ.get('TURN_TOKEN_LIMIT', '200'))  # Longer messages are stored truncated
 
 class RatingConfig:
     """Rating system configuration"""
@@ -166,6 +356,24 @@ def get_config() -> Dict[str, Any]:
             'types': AgentConfig.AGENT_TYPES,
             'confidence_threshold': AgentConfig.DEFAULT_CONFIDENCE_THRESHOLD
         },
+        'mistral': {
+            'model': MistralConfig.MODEL,
+            'base_url': MistralConfig.BASE_URL,
+            'pool_maxsize': MistralConfig.POOL_MAXSIZE,
+            'connect_timeout': MistralConfig.CONNECT_TIMEOUT,
+            'read_timeout': MistralConfig.READ_TIMEOUT
+        },
+        'token_budget': {
+            'prompt_budget': TokenBudgetConfig.PROMPT_TOKEN_BUDGET,
+            'max_tokens': TokenBudgetConfig.COMPLETION_MAX_TOKENS
+        },
+        'cache': {
+            'completion_enabled': CacheConfig.COMPLETION_CACHE_ENABLED,
+            'completion_size': CacheConfig.COMPLETION_CACHE_SIZE,
+            'completion_ttl': CacheConfig.COMPLETION_CACHE_TTL,
+            'semantic_enabled': CacheConfig.SEMANTIC_CACHE_ENABLED,
+            'semantic_threshold': CacheConfig.SEMANTIC_CACHE_THRESHOLD
+        },
         'sessions': {
             'timeout': SessionConfig.SESSION_TIMEOUT,
             'voice_timeout': SessionConfig.VOICE_SESSION_TIMEOUT,
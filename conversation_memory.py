@@ -0,0 +1,207 @@
+# Память диалога по сессиям: последние реплики + краткое содержание старых
+# Bounded per-session conversation memory with rolling summarization
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from config import SessionConfig
+from token_budget import (MESSAGE_OVERHEAD_TOKENS, estimate_tokens,
+                          truncate_to_tokens)
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_QUESTION_TOKENS = 30
+SUMMARY_ANSWER_TOKENS = 40
+
+
+class Turn(NamedTuple):
+    user: str
+    assistant: str
+    agent_type: Optional[str]
+    tokens: int  # Both messages, including message overhead
+
+
+class ConversationContext(NamedTuple):
+    """What the prompt gets from earlier turns of one session"""
+    summary: str = ""
+    turns: Tuple[Turn, ...] = ()
+    last_agent: Optional[str] = None
+
+    @property
+    def empty(self) -> bool:
+        return not self.summary and not self.turns
+
+    @property
+    def tokens(self) -> int:
+        return sum(turn.tokens for turn in self.turns) + estimate_tokens(self.summary)
+
+    def messages(self) -> List[Dict[str, str]]:
+        """Earlier turns as alternating chat messages, oldest first"""
+        messages = []
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn.user})
+            messages.append({"role": "assistant", "content": turn.assistant})
+        return messages
+
+    def fingerprint(self) -> str:
+        """Stable id of the history for completion cache keys"""
+        if self.empty:
+            return ""
+        digest = hashlib.sha256(self.summary.encode('utf-8'))
+        for turn in self.turns:
+            digest.update(b'\x00' + turn.user.encode('utf-8') + b'\x00' + turn.assistant.encode('utf-8'))
+        return digest.hexdigest()
+
+
+EMPTY_CONTEXT = ConversationContext()
+
+
+def _turn_tokens(user: str, assistant: str) -> int:
+    return estimate_tokens(user) + estimate_tokens(assistant) + 2 * MESSAGE_OVERHEAD_TOKENS
+
+
+def summarize_turn(turn: Turn) -> str:
+    """One extractive summary line: the question and the start of the answer"""
+    question = truncate_to_tokens(' '.join(turn.user.split()), SUMMARY_QUESTION_TOKENS)
+    answer = truncate_to_tokens(' '.join(turn.assistant.replace('*', '').replace('#', '').split()),
+                                SUMMARY_ANSWER_TOKENS)
+    return f"- {question} → {answer}"
+
+
+class SessionHistory:
+    __slots__ = ('turns', 'summary', 'touched')
+
+    def __init__(self, max_turns: int):
+        # Ring buffer: the oldest turn falls out once it is full
+        self.turns: deque = deque(maxlen=max_turns)
+        self.summary = ""
+        self.touched = time.monotonic()
+
+
+class ConversationMemory:
+    """Recent turns per session_id, LRU-bounded in sessions and size.
+
+    Turns that no longer fit the ring buffer or the history token budget are
+    folded into a short summary, which itself keeps only its newest lines.
+
+    Memory lives in the worker process: with several gunicorn or uvicorn
+    workers the balancer must keep a session on one worker (sticky sessions),
+    otherwise a follow-up served by another worker starts without history."""
+
+    def __init__(self, enabled: bool = True, max_sessions: int = 5000, max_turns: int = 10,
+                 ttl: float = 3600, history_tokens: int = 500, summary_tokens: int = 150,
+                 turn_tokens: int = 200):
+        self.enabled = enabled
+        self.max_sessions = max_sessions
+        self.max_turns = max(1, max_turns)
+        self.ttl = ttl
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.turn_tokens = turn_tokens
+        self._sessions: 'OrderedDict[str, SessionHistory]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'evicted': 0, 'expired': 0, 'compacted_turns': 0}
+
+    def _expire(self, now: float):
+        # Sessions are kept in access order, so expired ones are at the front
+        while self._sessions:
+            session_id, history = next(iter(self._sessions.items()))
+            if now - history.touched < self.ttl:
+                break
+            del self._sessions[session_id]
+            self.stats['expired'] += 1
+
+    def context(self, session_id: Optional[str]) -> ConversationContext:
+        if not self.enabled or not session_id:
+            return EMPTY_CONTEXT
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            history = self._sessions.get(session_id)
+            if history is None:
+                return EMPTY_CONTEXT
+            self._sessions.move_to_end(session_id)
+            history.touched = now
+            turns = tuple(history.turns)
+            return ConversationContext(history.summary, turns,
+                                       turns[-1].agent_type if turns else None)
+
+    def record(self, session_id: Optional[str], user_message: str, response: str,
+               agent_type: Optional[str] = None):
+        """Append a finished turn to the session history"""
+        if not self.enabled or not session_id or not response:
+            return
+        user_message = truncate_to_tokens(user_message.strip(), self.turn_tokens)
+        response = truncate_to_tokens(response.strip(), self.turn_tokens)
+        turn = Turn(user_message, response, agent_type, _turn_tokens(user_message, response))
+
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            history = self._sessions.get(session_id)
+            if history is None:
+                history = self._sessions[session_id] = SessionHistory(self.max_turns)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.stats['evicted'] += 1
+            else:
+                self._sessions.move_to_end(session_id)
+            history.touched = now
+
+            if len(history.turns) == self.max_turns:
+                self._compact(history, history.turns[0])
+            history.turns.append(turn)
+            # Keep the newest turn even if it alone exceeds the budget
+            while (len(history.turns) > 1 and
+                   sum(t.tokens for t in history.turns) + estimate_tokens(history.summary)
+                   > self.history_tokens):
+                self._compact(history, history.turns.popleft())
+
+    def _compact(self, history: SessionHistory, turn: Turn):
+        lines = history.summary.split('\n') if history.summary else []
+        lines.append(summarize_turn(turn))
+        while len(lines) > 1 and estimate_tokens('\n'.join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        history.summary = '\n'.join(lines)
+        self.stats['compacted_turns'] += 1
+
+    def clear(self, session_id: Optional[str] = None):
+        with self._lock:
+            if session_id is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(session_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            turns = sum(len(h.turns) for h in self._sessions.values())
+            chars = sum(len(h.summary) + sum(len(t.user) + len(t.assistant) for t in h.turns)
+                        for h in self._sessions.values())
+            return dict(
+                self.stats,
+                enabled=self.enabled,
+                sessions=len(self._sessions),
+                max_sessions=self.max_sessions,
+                turns=turns,
+                stored_chars=chars
+            )
+
+
+_conversation_memory = ConversationMemory(
+    enabled=SessionConfig.ENABLE_USER_CONTEXT,
+    max_sessions=SessionConfig.CONVERSATION_MAX_SESSIONS,
+    max_turns=SessionConfig.MAX_CONTEXT_HISTORY,
+    ttl=SessionConfig.SESSION_TIMEOUT,
+    history_tokens=SessionConfig.HISTORY_TOKEN_BUDGET,
+    summary_tokens=SessionConfig.SUMMARY_TOKEN_BUDGET,
+    turn_tokens=SessionConfig.TURN_TOKEN_LIMIT
+)
+
+
+def get_conversation_memory() -> ConversationMemory:
+    """Get the process-wide conversation memory"""
+    return _conversation_memory
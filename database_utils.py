@@ -3,8 +3,8 @@
 
 import logging
 import os
-from typing import Optional, Dict, Any
-from sqlalchemy import create_engine, text
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from sqlalchemy import create_engine, text, inspect
 from sqlalchemy.exc import SQLAlchemyError
 from config import DatabaseConfig
 
@@ -126,6 +126,84 @@ class DatabaseManager:
             logging.error(f"Unexpected error creating database for {db_type}: {str(e)}")
             return False
 
+def add_missing_columns(db) -> list:
+    """Добавление новых nullable-колонок моделей в уже существующие таблицы
+
+    db.create_all() не изменяет существующие таблицы, поэтому колонки,
+    добавленные в модели позже, создаются здесь через ALTER TABLE.
+    """
+    added = []
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as connection:
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            added.append(f"{table.name}.{column.name}")
+            logging.info(f"Added column {table.name}.{column.name}")
+
+    return added
+
+SYNC_BATCH_SIZE = 500
+
+def sync_changed_rows(model, columns, since, indexed: Callable[[], Set[int]],
+                      put: Callable[[list], None], drop: Callable[[List[int]], None]) -> Tuple[Any, int]:
+    """Приведение in-memory индекса строк модели в соответствие с таблицей
+
+    Строки с updated_at >= since переиндексируются (неактивные удаляются);
+    удалённые строки не оставляют updated_at, поэтому при расхождении числа
+    активных строк сравниваются множества id. put() получает пачки строк
+    (id, is_active, updated_at, *columns), drop() - пачки id.
+    Возвращает (новый watermark, число затронутых строк).
+    """
+    entities = [model.id, model.is_active, model.updated_at] + [getattr(model, c) for c in columns]
+    query = model.query.with_entities(*entities)
+    if since is not None:
+        # >=: rows written in the same instant as the watermark are reindexed, not missed
+        query = query.filter(model.updated_at >= since)
+    latest = since
+    touched = 0
+    batch = []
+    for row in query.yield_per(SYNC_BATCH_SIZE):
+        batch.append(row)
+        if row.updated_at is not None and (latest is None or row.updated_at > latest):
+            latest = row.updated_at
+        if len(batch) == SYNC_BATCH_SIZE:
+            touched += _apply_rows(batch, put, drop)
+            batch = []
+    touched += _apply_rows(batch, put, drop)
+
+    active = model.query.filter(model.is_active == True).count()
+    if active != len(indexed()):
+        ids = {row_id for (row_id,) in model.query.with_entities(model.id).filter(
+            model.is_active == True).all()}
+        removed = list(indexed() - ids)
+        if removed:
+            drop(removed)
+        missing = list(ids - indexed())
+        for start in range(0, len(missing), SYNC_BATCH_SIZE):
+            rows = model.query.with_entities(*entities).filter(
+                model.id.in_(missing[start:start + SYNC_BATCH_SIZE])).all()
+            put(rows)
+        touched += len(removed) + len(missing)
+    return latest, touched
+
+def _apply_rows(rows: list, put, drop) -> int:
+    active = [row for row in rows if row.is_active]
+    if active:
+        put(active)
+    inactive = [row.id for row in rows if not row.is_active]
+    if inactive:
+        drop(inactive)
+    return len(rows)
+
 def test_all_databases() -> Dict[str, bool]:
     """Тестирование всех доступных типов БД"""
     manager = DatabaseManager()
@@ -0,0 +1,109 @@
+# Счётчик обращений к базе данных на запрос
+# Per-request database round-trip counting
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from resilience import LatencyTracker
+
+STATEMENT_PREVIEW = 120  # Characters of each statement kept for diagnostics
+
+
+class RoundTrips:
+    """Statements and commits sent to the database while one request is served"""
+
+    def __init__(self):
+        self.count = 0
+        self.statements: List[str] = []
+
+    def record(self, statement: str):
+        self.count += 1
+        self.statements.append(' '.join(statement.split())[:STATEMENT_PREVIEW])
+
+
+# Shared with threads started through asyncio.to_thread; pool workers get it through track()
+_current: ContextVar[Optional[RoundTrips]] = ContextVar('db_round_trips', default=None)
+_per_endpoint: Dict[str, LatencyTracker] = {}
+_lock = threading.Lock()
+_installed = False
+stats = {'round_trips': 0}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats['round_trips'] += 1
+    counter = _current.get()
+    if counter is not None:
+        counter.record(statement)
+
+
+def _commit(conn):
+    stats['round_trips'] += 1
+    counter = _current.get()
+    if counter is not None:
+        counter.record('COMMIT')
+
+
+def current() -> Optional[RoundTrips]:
+    """Counter of the request being served in this context, if any"""
+    return _current.get()
+
+
+@contextmanager
+def track(counter: Optional[RoundTrips] = None) -> Iterator[RoundTrips]:
+    """Count the round trips of a block outside a request (tests, scripts), or
+    those of a worker thread on the counter of the request it serves"""
+    counter = counter if counter is not None else RoundTrips()
+    token = _current.set(counter)
+    try:
+        yield counter
+    finally:
+        _current.reset(token)
+
+
+def _start_request():
+    g.db_round_trips_token = _current.set(RoundTrips())
+
+
+def _finish_request(response):
+    counter = _current.get()
+    if counter is not None:
+        response.headers['X-DB-Round-Trips'] = str(counter.count)
+        endpoint = request.endpoint or 'unknown'
+        with _lock:
+            tracker = _per_endpoint.setdefault(endpoint, LatencyTracker())
+        tracker.record(counter.count)
+    return response
+
+
+def _reset_request(exception=None):
+    token = g.pop('db_round_trips_token', None)
+    if token is not None:
+        _current.reset(token)
+
+
+def init_app(app):
+    """Count round trips on every engine and report them per request in the
+    X-DB-Round-Trips response header and in get_stats()"""
+    global _installed
+    with _lock:
+        if not _installed:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'commit', _commit)
+            _installed = True
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_reset_request)
+
+
+def get_stats() -> Dict[str, Any]:
+    with _lock:
+        endpoints = dict(_per_endpoint)
+    return dict(stats, per_request={
+        endpoint: {'p50': tracker.percentile(50), 'p95': tracker.percentile(95), 'max': tracker.percentile(100)}
+        for endpoint, tracker in endpoints.items()})
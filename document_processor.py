@@ -6,6 +6,10 @@ import trafilatura
 import requests
 from datetime import datetime
 
+from bm25_index import get_bm25_store
+from retrieval import get_retriever
+from vector_index import get_vector_store
+
 logger = logging.getLogger(__name__)
 
 class DocumentProcessor:
@@ -217,12 +221,15 @@ class KnowledgeBaseUpdater:
                 self.db.session.commit()
 
             # Clear existing knowledge base entries for this document
-            self.KnowledgeBase.query.filter_by(
+            entries = self.KnowledgeBase.query.filter_by(
                 source_type='document', 
                 source_id=document_id
-            ).delete()
+            )
+            removed_ids = [entry_id for (entry_id,) in entries.with_entities(self.KnowledgeBase.id).all()]
+            entries.delete()
 
             # Create new chunks
+            added = []
             chunks = self.document_processor.chunk_text(document.content_text)
             for i, chunk in enumerate(chunks):
                 kb_entry = self.KnowledgeBase(
@@ -232,8 +239,13 @@ class KnowledgeBaseUpdater:
                     extra_data={'chunk_index': i, 'total_chunks': len(chunks)}
                 )
                 self.db.session.add(kb_entry)
+                added.append(kb_entry)
 
+            # Ids are assigned on flush; read them before commit expires the entries
+            self.db.session.flush()
+            added = [(entry.id, entry.content_chunk) for entry in added]
             self.db.session.commit()
+            self._update_indexes(removed_ids, added)
             logger.info(f"Updated knowledge base with {len(chunks)} chunks from document {document_id}")
             return True
 
@@ -261,12 +273,15 @@ class KnowledgeBaseUpdater:
             web_source.last_scraped = datetime.utcnow()
 
             # Clear existing knowledge base entries for this web source
-            self.KnowledgeBase.query.filter_by(
+            entries = self.KnowledgeBase.query.filter_by(
                 source_type='web', 
                 source_id=web_source_id
-            ).delete()
+            )
+            removed_ids = [entry_id for (entry_id,) in entries.with_entities(self.KnowledgeBase.id).all()]
+            entries.delete()
 
             # Create new chunks
+            added = []
             chunks = self.document_processor.chunk_text(text_content)
             for i, chunk in enumerate(chunks):
                 kb_entry = self.KnowledgeBase(
@@ -276,8 +291,13 @@ class KnowledgeBaseUpdater:
                     extra_data={'chunk_index': i, 'total_chunks': len(chunks), 'url': web_source.url}
                 )
                 self.db.session.add(kb_entry)
+                added.append(kb_entry)
 
+            # Ids are assigned on flush; read them before commit expires the entries
+            self.db.session.flush()
+            added = [(entry.id, entry.content_chunk) for entry in added]
             self.db.session.commit()
+            self._update_indexes(removed_ids, added)
             logger.info(f"Updated knowledge base with {len(chunks)} chunks from web source {web_source_id}")
             return True
 
@@ -286,29 +306,21 @@ class KnowledgeBaseUpdater:
             self.db.session.rollback()
             return False
 
+    def _update_indexes(self, removed_ids: List[int], added: List[tuple]):
+        """Apply replaced chunks to the in-process search indexes without a rebuild"""
+        try:
+            get_bm25_store().apply('kb', removed_ids, [(entry_id, [('any', chunk)]) for entry_id, chunk in added])
+            get_vector_store().apply(removed_ids, added)
+        except Exception as e:
+            # The indexes catch up from the database on their next refresh
+            logger.error(f"Error updating search indexes: {str(e)}")
+
     def get_relevant_content(self, query: str, language: str = 'ru', limit: int = 5) -> List[str]:
         """Get relevant content from knowledge base"""
         try:
-            query_lower = query.lower()
-            keywords = [word for word in query_lower.split() if len(word) > 2]
-
-            if not keywords:
-                return []
-
-            # Simple keyword matching - in production, use vector similarity
-            relevant_entries = []
-
-            for keyword in keywords[:3]:  # Limit to first 3 keywords
-                entries = self.KnowledgeBase.query.filter(
-                    self.KnowledgeBase.is_active == True,
-                    self.KnowledgeBase.content_chunk.ilike(f'%{keyword}%')
-                ).limit(limit).all()
-
-                for entry in entries:
-                    if entry not in relevant_entries:
-                        relevant_entries.append(entry)
-
-            return [entry.content_chunk for entry in relevant_entries[:limit]]
+            # Keyword and (when enabled) vector rankings, fused
+            retrieval = get_retriever().retrieve(query, language, sources=('kb',), k=limit)
+            return [passage.content for passage in retrieval.passages]
 
         except Exception as e:
             logger.error(f"Error getting relevant content: {str(e)}")
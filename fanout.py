@@ -0,0 +1,170 @@
+# Параллельный опрос нескольких агентов для неоднозначных сообщений
+# Parallel top-k agent fan-out under one request deadline
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+from flask import current_app, has_app_context
+
+import db_round_trips
+from config import FanoutConfig
+from conversation_memory import ConversationContext
+from resilience import abandonable
+from text_normalizer import fold
+from token_budget import query_terms
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Worker pool for fan-out calls, recreated after fork"""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=FanoutConfig.MAX_WORKERS,
+                                           thread_name_prefix="agent-fanout")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def select_candidates(ranking: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Top-k agents whose confidence is within the margin of the best one"""
+    if not FanoutConfig.ENABLED or len(ranking) < 2:
+        return ranking[:1]
+    best = ranking[0]['confidence']
+    return [item for item in ranking[:FanoutConfig.TOP_K]
+            if best - item['confidence'] <= FanoutConfig.MARGIN]
+
+
+def score_result(message: str, result: Dict[str, Any]) -> float:
+    """Cheap answer quality estimate: question terms echoed, context used, routing confidence"""
+    if not result or result.get('fallback'):
+        return -1.0
+    terms = set(query_terms(message))
+    response = fold(result.get('response') or '')
+    overlap = sum(1 for term in terms if term in response) / len(terms) if terms else 0.0
+    return (overlap
+            + (0.5 if result.get('context_used') else 0.0)
+            + 0.5 * result.get('confidence', 0.0))
+
+
+def _acceptable(result: Optional[Dict[str, Any]]) -> bool:
+    return bool(result) and not result.get('fallback')
+
+
+def _annotate(result: Dict[str, Any], candidates: List[Tuple[Any, float]], started: float) -> Dict[str, Any]:
+    return dict(result,
+                fanout=[agent.agent_type for agent, _ in candidates],
+                fanout_time=time.monotonic() - started)
+
+
+def _finish(message: str, language: str, candidates: List[Tuple[Any, float]],
+            finished: Dict[int, Dict[str, Any]], started: float) -> Dict[str, Any]:
+    """Best finished answer; ties keep the routing order"""
+    ordered = [finished[i] for i in sorted(finished)]
+    if ordered:
+        chosen = max(ordered, key=lambda r: score_result(message, r))
+    else:
+        # Nothing finished before the deadline
+        agent, confidence = candidates[0]
+        chosen = agent.mistral._fallback_result(agent.mistral._get_fallback_response(language))
+        chosen.update(confidence=confidence, agent_type=agent.agent_type,
+                      agent_name=agent.name, context_used=False)
+    return _annotate(chosen, candidates, started)
+
+
+def _current_app():
+    if has_app_context():
+        return current_app._get_current_object()
+    from app import app
+    return app
+
+
+def _call(app, counter: Optional[db_round_trips.RoundTrips], abandoned: threading.Event,
+          agent, message: str, language: str,
+          confidence: float, history: Optional[ConversationContext]) -> Dict[str, Any]:
+    """One fan-out call in a worker: its own app context, hence its own db.session
+    (a session is not shared between threads), counted on the request's counter"""
+    with app.app_context(), db_round_trips.track(counter), abandonable(abandoned):
+        return agent.process_message(message, language, confidence, history)
+
+
+def fan_out(candidates: List[Tuple[Any, float]], message: str,
+            language: str = "ru", history: Optional[ConversationContext] = None) -> Dict[str, Any]:
+    """Run process_message of several (agent, confidence) pairs concurrently.
+
+    Threads cannot be cancelled, so once an answer is chosen or the deadline
+    passes the losing calls are marked abandoned: they stop before their next
+    bulkhead slot or provider request and give back a limiter permit they were
+    queued for unused. A request already sent is allowed to finish."""
+    started = time.monotonic()
+    deadline = started + FanoutConfig.DEADLINE
+    executor = _get_executor()
+    app = _current_app()
+    counter = db_round_trips.current()
+    abandoned = threading.Event()
+    futures = {
+        executor.submit(_call, app, counter, abandoned, agent, message, language, confidence, history): index
+        for index, (agent, confidence) in enumerate(candidates)
+    }
+    finished: Dict[int, Dict[str, Any]] = {}
+    pending = set(futures)
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    finished[futures[future]] = future.result()
+                except Exception as e:
+                    logger.error(f"Fan-out agent call failed: {str(e)}")
+                if FanoutConfig.STRATEGY == 'fastest' and _acceptable(finished.get(futures[future])):
+                    return _annotate(finished[futures[future]], candidates, started)
+    finally:
+        abandoned.set()
+
+    if pending:
+        logger.warning(f"Fan-out deadline reached with {len(pending)} agent(s) still running")
+    return _finish(message, language, candidates, finished, started)
+
+
+async def afan_out(candidates: List[Tuple[Any, float]], message: str,
+                   language: str = "ru", history: Optional[ConversationContext] = None) -> Dict[str, Any]:
+    """Asyncio variant of fan_out"""
+    started = time.monotonic()
+    tasks = {
+        asyncio.ensure_future(agent.aprocess_message(message, language, confidence, history)): index
+        for index, (agent, confidence) in enumerate(candidates)
+    }
+    finished: Dict[int, Dict[str, Any]] = {}
+    pending = set(tasks)
+    try:
+        while pending:
+            remaining = started + FanoutConfig.DEADLINE - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining,
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try:
+                    finished[tasks[task]] = task.result()
+                except Exception as e:
+                    logger.error(f"Fan-out agent call failed: {str(e)}")
+                if FanoutConfig.STRATEGY == 'fastest' and _acceptable(finished.get(tasks[task])):
+                    return _annotate(finished[tasks[task]], candidates, started)
+    finally:
+        for task in pending:
+            task.cancel()
+
+    return _finish(message, language, candidates, finished, started)
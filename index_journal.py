@@ -0,0 +1,68 @@
+# Журнал изменений поисковых индексов между полными сохранениями файла
+# Append-only change journal kept next to a saved search index
+
+import json
+import logging
+import os
+import uuid
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def new_generation() -> str:
+    """Id written into a fully saved index file; journal records name the one they extend"""
+    return uuid.uuid4().hex
+
+
+class IndexJournal:
+    """JSON-lines log of the changes made to an index since its last full save.
+
+    A full save starts a new generation and truncates the log. Records of
+    another generation (a worker that has not seen the newer file, a crash
+    between the save and the truncation) are skipped on replay; the
+    database sync that follows loading recovers whatever they held.
+    Each record is a single append-mode write, so workers sharing the file
+    do not interleave records."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0  # Row changes journaled against the current generation
+
+    def append(self, generation: Optional[str], record: Dict[str, Any], rows: int):
+        if generation is None:
+            return  # Not saved yet: nothing to extend
+        line = json.dumps(dict(record, generation=generation, rows=rows), ensure_ascii=False) + '\n'
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line.encode('utf-8'))
+            finally:
+                os.close(fd)
+            self.rows += rows
+        except OSError as e:
+            logger.error(f"Error writing index journal {self.path}: {str(e)}")
+
+    def replay(self, generation: Optional[str]) -> Iterator[Dict[str, Any]]:
+        """Records extending the given generation, oldest first"""
+        self.rows = 0
+        if generation is None or not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # Torn last write
+                if record.get('generation') == generation:
+                    self.rows += record.get('rows', 0)
+                    yield record
+
+    def reset(self):
+        """Start over after a full save"""
+        self.rows = 0
+        try:
+            with open(self.path, 'w', encoding='utf-8'):
+                pass
+        except OSError as e:
+            logger.error(f"Error truncating index journal {self.path}: {str(e)}")
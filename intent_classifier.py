@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Статистический классификатор намерений для маршрутизации по агентам
+Lightweight intent classifier for agent routing
+
+Хешированные символьные n-граммы + линейная softmax-модель на NumPy.
+Обучается офлайн на user_queries с положительной оценкой; если модели
+нет или NumPy не установлен, используется маршрутизация по ключевым словам.
+
+Обучение / Train:
+    python intent_classifier.py train
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from config import IntentConfig
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional: keyword routing still works
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+def hashed_ngrams(text: str, n_features: int, ngram_min: int = 2,
+                  ngram_max: int = 4) -> Dict[int, float]:
+    """Signed hashed char n-gram counts of a lowercased, space-padded text"""
+    text = f" {' '.join(text.lower().split())} "
+    counts: Dict[int, float] = {}
+    for n in range(ngram_min, ngram_max + 1):
+        for i in range(len(text) - n + 1):
+            h = zlib.crc32(text[i:i + n].encode('utf-8'))
+            index = h % n_features
+            # The top bit decides the sign, which cancels out collisions on average
+            counts[index] = counts.get(index, 0.0) + (1.0 if h & 0x80000000 else -1.0)
+    return counts
+
+
+def vectorize(text: str, n_features: int, ngram_min: int = 2,
+              ngram_max: int = 4) -> Tuple[Any, Any]:
+    """Sparse (indices, values): sublinear tf, L2-normalized"""
+    counts = hashed_ngrams(text, n_features, ngram_min, ngram_max)
+    indices = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+    values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    values = np.sign(values) * (1.0 + np.log(np.abs(values) + 1e-12))
+    norm = np.linalg.norm(values)
+    if norm > 0:
+        values /= norm
+    return indices, values
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class IntentClassifier:
+    """Softmax regression over hashed character n-grams"""
+
+    def __init__(self, labels: Sequence[str], weights, bias,
+                 n_features: int, ngram_min: int = 2, ngram_max: int = 4):
+        self.labels = list(labels)
+        # Stored transposed (n_features x classes) so a row gather scores a message
+        self.weights_t = np.ascontiguousarray(weights.T, dtype=np.float32)
+        self.bias = bias.astype(np.float32)
+        self.n_features = n_features
+        self.ngram_min = ngram_min
+        self.ngram_max = ngram_max
+
+    def predict_proba(self, message: str) -> Dict[str, float]:
+        indices, values = vectorize(message, self.n_features, self.ngram_min, self.ngram_max)
+        logits = values @ self.weights_t[indices] + self.bias
+        return dict(zip(self.labels, _softmax(logits).tolist()))
+
+    def predict(self, message: str) -> Dict[str, Any]:
+        probs = self.predict_proba(message)
+        agent_type = max(probs, key=probs.get)
+        return {'agent_type': agent_type, 'confidence': probs[agent_type], 'probs': probs}
+
+    @classmethod
+    def train(cls, texts: Sequence[str], labels: Sequence[str],
+              n_features: int = 2 ** 15, epochs: int = 40,
+              learning_rate: float = 2.0, l2: float = 1e-4,
+              batch_size: int = 64, seed: int = 0) -> 'IntentClassifier':
+        """Mini-batch gradient descent on the softmax cross-entropy"""
+        classes = sorted(set(labels))
+        class_index = {label: i for i, label in enumerate(classes)}
+        y = np.array([class_index[label] for label in labels], dtype=np.int64)
+        rows = [vectorize(text, n_features) for text in texts]
+
+        weights_t = np.zeros((n_features, len(classes)), dtype=np.float32)
+        bias = np.zeros(len(classes), dtype=np.float32)
+        rng = np.random.default_rng(seed)
+
+        for epoch in range(epochs):
+            order = rng.permutation(len(rows))
+            lr = learning_rate / (1.0 + 0.1 * epoch)
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                indices = np.concatenate([rows[i][0] for i in batch])
+                values = np.concatenate([rows[i][1] for i in batch])
+                lengths = np.array([len(rows[i][0]) for i in batch])
+                row_of = np.repeat(np.arange(len(batch)), lengths)
+
+                # Sparse X @ W: gather the feature rows and sum them per message
+                contrib = weights_t[indices] * values[:, None]
+                logits = np.zeros((len(batch), len(classes)), dtype=np.float32)
+                np.add.at(logits, row_of, contrib)
+                logits += bias
+                grad_logits = _softmax(logits)
+                grad_logits[np.arange(len(batch)), y[batch]] -= 1.0
+                grad_logits /= len(batch)
+
+                grad_w = np.zeros_like(weights_t)
+                np.add.at(grad_w, indices, values[:, None] * grad_logits[row_of])
+                weights_t -= lr * (grad_w + l2 * weights_t)
+                bias -= lr * grad_logits.sum(axis=0)
+
+        return cls(classes, weights_t.T, bias, n_features)
+
+    def save(self, path: str):
+        """Compact .npz: float16 weights are plenty for routing"""
+        np.savez_compressed(
+            path,
+            weights=self.weights_t.T.astype(np.float16),
+            bias=self.bias,
+            labels=np.array(self.labels),
+            params=np.array([self.n_features, self.ngram_min, self.ngram_max]))
+
+    @classmethod
+    def load(cls, path: str) -> 'IntentClassifier':
+        with np.load(path, allow_pickle=False) as data:
+            n_features, ngram_min, ngram_max = (int(x) for x in data['params'])
+            return cls([str(label) for label in data['labels']],
+                       data['weights'].astype(np.float32), data['bias'],
+                       n_features, ngram_min, ngram_max)
+
+
+_classifier: Optional[IntentClassifier] = None
+_classifier_mtime: Optional[float] = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_intent_classifier() -> Optional[IntentClassifier]:
+    """Loaded model, reloaded when the file changes; None if unavailable"""
+    global _classifier, _classifier_mtime, _checked_at
+    if np is None or not IntentConfig.INTENT_CLASSIFIER_ENABLED:
+        return None
+    now = time.monotonic()
+    if now - _checked_at < IntentConfig.INTENT_MODEL_CHECK_INTERVAL:
+        return _classifier
+    with _lock:
+        _checked_at = now
+        try:
+            mtime = os.path.getmtime(IntentConfig.INTENT_MODEL_PATH)
+        except OSError:
+            _classifier, _classifier_mtime = None, None
+            return None
+        if mtime != _classifier_mtime:
+            try:
+                _classifier = IntentClassifier.load(IntentConfig.INTENT_MODEL_PATH)
+                _classifier_mtime = mtime
+                logger.info(f"Intent classifier loaded with labels {_classifier.labels}")
+            except Exception as e:
+                logger.error(f"Failed to load intent classifier: {str(e)}")
+                _classifier = None
+        return _classifier
+
+
+def load_training_data() -> Tuple[List[str], List[str]]:
+    """Liked queries with a known agent (call inside an app context)"""
+    from models import UserQuery
+
+    rows = UserQuery.query.with_entities(UserQuery.user_message, UserQuery.agent_type).filter(
+        UserQuery.agent_type.isnot(None),
+        UserQuery.user_rating == 'like'
+    ).all()
+    texts = [message for message, _ in rows if message and message.strip()]
+    labels = [agent_type for message, agent_type in rows if message and message.strip()]
+    return texts, labels
+
+
+def train_from_history(path: Optional[str] = None, min_per_class: int = 5,
+                       holdout: float = 0.2) -> Dict[str, Any]:
+    """Train on rated history, report holdout accuracy and save the model"""
+    if np is None:
+        raise RuntimeError("NumPy is required to train the intent classifier")
+    path = path or IntentConfig.INTENT_MODEL_PATH
+    texts, labels = load_training_data()
+
+    counts: Dict[str, int] = {}
+    for label in labels:
+        counts[label] = counts.get(label, 0) + 1
+    keep = [i for i, label in enumerate(labels) if counts[label] >= min_per_class]
+    texts = [texts[i] for i in keep]
+    labels = [labels[i] for i in keep]
+    if len(set(labels)) < 2:
+        return {'success': False, 'error': 'Need liked queries for at least two agents', 'samples': len(labels)}
+
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(texts))
+    split = int(len(order) * (1 - holdout)) if len(order) >= 20 else len(order)
+    train_idx, test_idx = order[:split], order[split:]
+
+    model = IntentClassifier.train([texts[i] for i in train_idx], [labels[i] for i in train_idx])
+    accuracy = None
+    if len(test_idx):
+        correct = sum(model.predict(texts[i])['agent_type'] == labels[i] for i in test_idx)
+        accuracy = correct / len(test_idx)
+
+    # Final model uses all rows
+    model = IntentClassifier.train(texts, labels)
+    model.save(path)
+    return {'success': True, 'path': path, 'samples': len(texts), 'classes': counts, 'holdout_accuracy': accuracy}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2 or sys.argv[1] != 'train':
+        print("Usage: python intent_classifier.py train [output.npz]")
+        sys.exit(1)
+    from app import app
+    with app.app_context():
+        result = train_from_history(sys.argv[2] if len(sys.argv) > 2 else None)
+    print(result)
+    sys.exit(0 if result['success'] else 1)
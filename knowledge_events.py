@@ -0,0 +1,83 @@
+# Уведомления об изменении базы знаний
+# Knowledge change notifications for in-process caches and indexes
+
+import logging
+import threading
+from typing import Callable, List, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Таблицы, изменение которых влияет на контекст и промпты ответов
+WATCHED_TABLES = {'faqs', 'knowledge_base', 'agent_knowledge_base', 'agent_types'}
+
+_listeners: List[Callable[[Set[str]], None]] = []
+_lock = threading.Lock()
+_installed = False
+
+
+def on_knowledge_change(callback: Callable[[Set[str]], None]):
+    """Register a callback that receives the set of changed table names"""
+    with _lock:
+        if callback not in _listeners:
+            _listeners.append(callback)
+
+
+def notify_knowledge_changed(tables: Set[str]):
+    """Notify registered listeners that knowledge tables have changed"""
+    changed = set(tables) & WATCHED_TABLES
+    if not changed:
+        return
+    for callback in list(_listeners):
+        try:
+            callback(changed)
+        except Exception as e:
+            logger.error(f"Error in knowledge change listener: {str(e)}")
+
+
+def _table_of(instance) -> str:
+    return getattr(instance, '__tablename__', '')
+
+
+def _pending(session) -> Set[str]:
+    return session.info.setdefault('knowledge_changed', set())
+
+
+def _after_flush(session, flush_context):
+    # Collected here, announced only after commit so that a reload triggered
+    # by the notification cannot read the old rows
+    tables = {_table_of(obj) for obj in list(session.new) + list(session.dirty) + list(session.deleted)}
+    _pending(session).update(tables & WATCHED_TABLES)
+
+
+def _after_bulk(orm_execute_state):
+    # Query.delete()/update() bypass the unit of work and after_flush
+    if orm_execute_state.is_delete or orm_execute_state.is_update:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None and mapper.local_table.name in WATCHED_TABLES:
+            _pending(orm_execute_state.session).add(mapper.local_table.name)
+
+
+def _after_commit(session):
+    tables = session.info.pop('knowledge_changed', None)
+    if tables:
+        notify_knowledge_changed(tables)
+
+
+def _after_rollback(session):
+    session.info.pop('knowledge_changed', None)
+
+
+def install_listeners():
+    """Attach SQLAlchemy session hooks once per process"""
+    global _installed
+    with _lock:
+        if _installed:
+            return
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'do_orm_execute', _after_bulk)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
+        _installed = True
@@ -0,0 +1,186 @@
+# Снимок базы знаний агентов в памяти процесса
+# Versioned in-memory snapshot of active AgentKnowledgeBase entries
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from config import AgentConfig
+from knowledge_events import on_knowledge_change
+from routing import AhoCorasick
+from text_normalizer import normalize_keyword, normalize_phrase
+
+logger = logging.getLogger(__name__)
+
+
+class KnowledgeRecord(NamedTuple):
+    """Immutable view of one active entry in one language"""
+    id: int
+    title: str
+    content: str
+    keywords: Tuple[str, ...]  # Lowercased, stripped
+    priority: int
+    is_featured: bool
+
+
+class KnowledgeSnapshot:
+    """Active entries grouped by (agent_type, language), ordered by priority"""
+
+    def __init__(self, records: Dict[Tuple[str, str], Tuple[KnowledgeRecord, ...]],
+                 version: int, watermark: Tuple[Any, int]):
+        self._records = records
+        self.version = version
+        self.watermark = watermark
+        self.loaded_at = time.time()
+        # Inverted index: stemmed keyword -> positions of entries of one agent.
+        # The 'ru' and 'kz' tuples hold the same entries in the same order.
+        self._indexes: Dict[str, AhoCorasick] = {}
+        for (agent_type, language), entries in records.items():
+            if language != 'ru':
+                continue
+            postings: Dict[str, List[int]] = {}
+            for position, entry in enumerate(entries):
+                for keyword in entry.keywords:
+                    pattern = normalize_keyword(keyword)
+                    if pattern:
+                        postings.setdefault(pattern, []).append(position)
+            self._indexes[agent_type] = AhoCorasick(postings)
+
+    @staticmethod
+    def language_key(language: str) -> str:
+        # Как и раньше: всё, что не 'ru', берётся из казахского текста
+        return 'ru' if language == 'ru' else 'kz'
+
+    def get(self, agent_type: str, language: str = 'ru') -> Tuple[KnowledgeRecord, ...]:
+        return self._records.get((agent_type, self.language_key(language)), ())
+
+    def match(self, agent_type: str, message: str,
+              language: str = 'ru') -> List[Tuple[int, KnowledgeRecord]]:
+        """Entries whose keywords occur in the message as (distinct keyword hits, entry),
+        best first: more hits, then lower priority value, then featured"""
+        index = self._indexes.get(agent_type)
+        if index is None:
+            return []
+        entries = self.get(agent_type, language)
+        matched: Dict[int, Set[str]] = {}
+        # One pass over the message regardless of the number of entries
+        for _, keyword, position in index.iter_matches(normalize_phrase(message)):
+            matched.setdefault(position, set()).add(keyword)
+        ranked = sorted(matched.items(), key=lambda item: (
+            -len(item[1]), entries[item[0]].priority, not entries[item[0]].is_featured, item[0]))
+        return [(len(keywords), entries[position]) for position, keywords in ranked]
+
+    def __len__(self):
+        return sum(len(records) for key, records in self._records.items() if key[1] == 'ru')
+
+
+def split_keywords(keywords: Optional[str]) -> Tuple[str, ...]:
+    if not keywords:
+        return ()
+    return tuple(k for k in (part.strip().lower() for part in keywords.split(',')) if k)
+
+
+class KnowledgeStore:
+    """Holds the current snapshot and rebuilds it when knowledge changes.
+
+    Writes in this process bump the version immediately; writes made by other
+    worker processes are picked up through a throttled max(updated_at)/count
+    watermark query."""
+
+    def __init__(self, refresh_interval: float = 30):
+        self.refresh_interval = refresh_interval
+        self._snapshot: Optional[KnowledgeSnapshot] = None
+        self._version = 0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def invalidate(self):
+        self._version += 1
+
+    def snapshot(self) -> KnowledgeSnapshot:
+        """Current snapshot; must be called inside an app context"""
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if (snapshot is not None and snapshot.version == self._version
+                and now - self._checked_at < self.refresh_interval):
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.version == self._version:
+                if now - self._checked_at < self.refresh_interval:
+                    return snapshot
+                self._checked_at = now
+                if self._watermark() == snapshot.watermark:
+                    return snapshot
+            self._snapshot = self._load()
+            self._checked_at = now
+            return self._snapshot
+
+    def _watermark(self) -> Tuple[Any, int]:
+        from models import AgentKnowledgeBase, db
+
+        # count catches deletions, max(updated_at) catches edits and toggles
+        latest, total = db.session.query(
+            db.func.max(AgentKnowledgeBase.updated_at),
+            db.func.count(AgentKnowledgeBase.id)
+        ).one()
+        return latest, total
+
+    def _load(self) -> KnowledgeSnapshot:
+        from models import AgentKnowledgeBase
+
+        version = self._version
+        watermark = self._watermark()
+        # Plain column tuples: no ORM objects are hydrated
+        rows = AgentKnowledgeBase.query.with_entities(
+            AgentKnowledgeBase.id,
+            AgentKnowledgeBase.agent_type,
+            AgentKnowledgeBase.title,
+            AgentKnowledgeBase.content_ru,
+            AgentKnowledgeBase.content_kz,
+            AgentKnowledgeBase.keywords,
+            AgentKnowledgeBase.priority,
+            AgentKnowledgeBase.is_featured
+        ).filter(AgentKnowledgeBase.is_active == True).order_by(
+            AgentKnowledgeBase.priority.asc(), AgentKnowledgeBase.id.asc()
+        ).all()
+
+        grouped: Dict[Tuple[str, str], list] = {}
+        for row in rows:
+            keywords = split_keywords(row.keywords)
+            priority = row.priority if row.priority is not None else AgentConfig.DEFAULT_AGENT_PRIORITY
+            for language, content in (('ru', row.content_ru), ('kz', row.content_kz or row.content_ru)):
+                grouped.setdefault((row.agent_type, language), []).append(KnowledgeRecord(
+                    row.id, row.title, content or '', keywords, priority, bool(row.is_featured)))
+
+        self.reloads += 1
+        logger.info(f"Agent knowledge snapshot v{version} loaded: {len(rows)} entries")
+        return KnowledgeSnapshot({key: tuple(records) for key, records in grouped.items()},
+                                 version, watermark)
+
+    def get_stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            'version': self._version,
+            'loaded': snapshot is not None,
+            'entries': len(snapshot) if snapshot else 0,
+            'reloads': self.reloads
+        }
+
+
+_knowledge_store = KnowledgeStore(refresh_interval=AgentConfig.KNOWLEDGE_REFRESH_INTERVAL)
+
+
+def get_knowledge_store() -> KnowledgeStore:
+    return _knowledge_store
+
+
+def _invalidate_on_knowledge_change(tables: Set[str]):
+    if 'agent_knowledge_base' in tables:
+        _knowledge_store.invalidate()
+
+
+on_knowledge_change(_invalidate_on_knowledge_change)
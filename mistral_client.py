@@ -1,20 +1,342 @@
 import os
+import time
+import asyncio
 import logging
+import threading
+import weakref
 import requests
 import json
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, Dict, Any, List, Iterator
+from requests.adapters import HTTPAdapter
+
+from config import (MistralConfig, RateLimitConfig, ResilienceConfig,
+                    TokenBudgetConfig)
+from completion_cache import get_completion_cache, make_cache_key
+from conversation_memory import ConversationContext
+from request_coalescing import SingleFlight, AsyncSingleFlight
+from token_budget import (estimate_messages_tokens, estimate_tokens,
+                          usage_from_response)
+from rate_limiter import LimiterRejected, ProviderLimiter
+from resilience import (CallAbandoned, CircuitBreaker, CircuitOpenError,
+                        LatencyTracker, RETRYABLE_STATUS_CODES, backoff_delay,
+                        raise_if_abandoned, retry_after_seconds)
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
 
 logger = logging.getLogger(__name__)
 
 
+class SharedTransport:
+    """Process-wide pooled HTTP session shared by every MistralClient.
+
+    The session is rebuilt after fork and once the keep-alive limits from
+    MistralConfig are reached. A replaced session is closed as soon as the
+    requests still running on it have returned.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._session: Optional[requests.Session] = None
+        self._pid: Optional[int] = None
+        self._last_used = 0.0
+        self._session_requests = 0
+        self._total_requests = 0
+        self._recycles = 0
+        self._in_flight: Dict[requests.Session, int] = {}
+        self._retired: List[requests.Session] = []
+
+    @property
+    def timeout(self) -> tuple:
+        return (MistralConfig.CONNECT_TIMEOUT, MistralConfig.READ_TIMEOUT)
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=MistralConfig.POOL_CONNECTIONS,
+                              pool_maxsize=MistralConfig.POOL_MAXSIZE,
+                              pool_block=MistralConfig.POOL_BLOCK,
+                              max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({"Connection": "keep-alive"})
+        return session
+
+    def _needs_recycle(self, now: float) -> bool:
+        if self._session is None or self._pid != os.getpid():
+            return True
+        if now - self._last_used > MistralConfig.KEEPALIVE_EXPIRY:
+            return True
+        return self._session_requests >= MistralConfig.KEEPALIVE_MAX_REQUESTS
+
+    def _retire(self, session: requests.Session):
+        """Close a replaced session now, or once its last request returns.
+        Called with the lock held"""
+        if self._in_flight.get(session):
+            self._retired.append(session)
+        else:
+            session.close()
+
+    def _acquire(self) -> requests.Session:
+        with self._lock:
+            now = time.monotonic()
+            if self._needs_recycle(now):
+                if self._session is not None:
+                    self._recycles += 1
+                    if self._pid == os.getpid():
+                        self._retire(self._session)
+                    else:
+                        # After fork the sockets belong to the parent process
+                        self._in_flight.clear()
+                        self._retired.clear()
+                self._session = self._create_session()
+                self._pid = os.getpid()
+                self._session_requests = 0
+            self._last_used = now
+            self._session_requests += 1
+            self._total_requests += 1
+            self._in_flight[self._session] = self._in_flight.get(self._session, 0) + 1
+            return self._session
+
+    def _release(self, session: requests.Session):
+        with self._lock:
+            count = self._in_flight.get(session, 0) - 1
+            if count > 0:
+                self._in_flight[session] = count
+                return
+            self._in_flight.pop(session, None)
+            if session in self._retired:
+                self._retired.remove(session)
+                session.close()
+
+    def get_session(self) -> requests.Session:
+        """Return the pooled session, rebuilding it when limits are reached.
+        Prefer post(): a session taken here is not kept open for the caller"""
+        session = self._acquire()
+        self._release(session)
+        return session
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        # A streamed body may outlive the call; its connection is closed
+        # instead of pooled when it is released into a closed session
+        kwargs.setdefault("timeout", self.timeout)
+        session = self._acquire()
+        try:
+            return session.post(url, **kwargs)
+        finally:
+            self._release(session)
+
+    def close(self):
+        with self._lock:
+            if self._session is not None and self._pid == os.getpid():
+                self._retire(self._session)
+            self._session = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'pool_maxsize': MistralConfig.POOL_MAXSIZE,
+            'total_requests': self._total_requests,
+            'session_requests': self._session_requests,
+            'recycles': self._recycles,
+            'retired_open': len(self._retired)
+        }
+
+
+_transport = SharedTransport()
+
+
+def get_transport() -> SharedTransport:
+    """Get the process-wide HTTP transport for the Mistral API"""
+    return _transport
+
+
+class AsyncTransport:
+    """Pooled httpx.AsyncClient per event loop, used by AsyncMistralClient"""
+
+    def __init__(self):
+        self._clients = weakref.WeakKeyDictionary()
+        self._pid: Optional[int] = None
+
+    def _create_client(self):
+        limits = httpx.Limits(
+            max_connections=MistralConfig.POOL_MAXSIZE,
+            max_keepalive_connections=MistralConfig.POOL_MAXSIZE,
+            keepalive_expiry=MistralConfig.KEEPALIVE_EXPIRY)
+        timeout = httpx.Timeout(MistralConfig.READ_TIMEOUT,
+                                connect=MistralConfig.CONNECT_TIMEOUT)
+        return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+    def get_client(self):
+        if self._pid != os.getpid():
+            # Clients inherited through fork belong to the parent's loop
+            self._clients = weakref.WeakKeyDictionary()
+            self._pid = os.getpid()
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._create_client()
+            self._clients[loop] = client
+        return client
+
+    async def post(self, url: str, **kwargs):
+        return await self.get_client().post(url, **kwargs)
+
+    async def aclose(self):
+        """Close the client bound to the running event loop"""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+_async_transport = AsyncTransport()
+
+
+def get_async_transport() -> AsyncTransport:
+    """Get the process-wide async HTTP transport for the Mistral API"""
+    return _async_transport
+
+
+# In-flight provider calls keyed by prompt fingerprint, shared by all agents
+_single_flight = SingleFlight(wait_timeout=MistralConfig.CONNECT_TIMEOUT + MistralConfig.READ_TIMEOUT,
+                              retry_errors=(CallAbandoned,))
+_async_single_flight = AsyncSingleFlight()
+
+
+def get_coalescing_stats() -> Dict[str, Any]:
+    return {'sync': _single_flight.get_stats(), 'async': _async_single_flight.get_stats()}
+
+
+# Provider health shared by sync and async clients: one breaker per process
+_breaker = CircuitBreaker(
+    enabled=ResilienceConfig.BREAKER_ENABLED,
+    window=ResilienceConfig.BREAKER_WINDOW,
+    min_requests=ResilienceConfig.BREAKER_MIN_REQUESTS,
+    error_rate_threshold=ResilienceConfig.BREAKER_ERROR_RATE,
+    slow_call_threshold=ResilienceConfig.BREAKER_SLOW_CALL_SECONDS,
+    slow_rate_threshold=ResilienceConfig.BREAKER_SLOW_CALL_RATE,
+    open_seconds=ResilienceConfig.BREAKER_OPEN_SECONDS)
+_latency = LatencyTracker()
+_limiter = ProviderLimiter(
+    enabled=RateLimitConfig.RATE_LIMIT_ENABLED,
+    rps=RateLimitConfig.REQUESTS_PER_SECOND,
+    burst=RateLimitConfig.BURST,
+    tokens_per_minute=RateLimitConfig.TOKENS_PER_MINUTE,
+    max_concurrency=RateLimitConfig.MAX_CONCURRENCY,
+    max_queue=RateLimitConfig.MAX_QUEUE,
+    queue_timeout=RateLimitConfig.QUEUE_TIMEOUT)
+_resilience_stats = {'retries': 0, 'hedged': 0, 'hedge_wins': 0, 'hedges_skipped': 0}
+_resilience_stats_lock = threading.Lock()  # Counted from request threads, hedge workers and event loops
+_hedge_executor = None
+_hedge_executor_pid = None
+_hedge_lock = threading.Lock()
+
+
+def _get_hedge_executor() -> ThreadPoolExecutor:
+    """Thread pool for hedged attempts, recreated after fork"""
+    global _hedge_executor, _hedge_executor_pid
+    with _hedge_lock:
+        if _hedge_executor is None or _hedge_executor_pid != os.getpid():
+            _hedge_executor = ThreadPoolExecutor(
+                max_workers=ResilienceConfig.HEDGE_MAX_WORKERS,
+                thread_name_prefix="mistral-hedge")
+            _hedge_executor_pid = os.getpid()
+        return _hedge_executor
+
+
+def _hedge_delay() -> Optional[float]:
+    """Delay before the backup attempt, None until enough latency samples"""
+    if not ResilienceConfig.HEDGING_ENABLED or len(_latency) < ResilienceConfig.HEDGE_MIN_SAMPLES:
+        return None
+    return max(ResilienceConfig.HEDGE_MIN_DELAY,
+               _latency.percentile(ResilienceConfig.HEDGE_PERCENTILE))
+
+
+def _retry_delay(response, attempt: int) -> float:
+    retry_after = retry_after_seconds(response.headers, ResilienceConfig.RETRY_MAX_DELAY) if response is not None else None
+    if retry_after is not None:
+        return retry_after
+    return backoff_delay(attempt, ResilienceConfig.RETRY_BASE_DELAY,
+                         ResilienceConfig.RETRY_MAX_DELAY)
+
+
+def _count(name: str):
+    with _resilience_stats_lock:
+        _resilience_stats[name] += 1
+
+
+def get_limiter() -> ProviderLimiter:
+    return _limiter
+
+
+def _reserved_tokens(payload: Dict[str, Any]) -> int:
+    """Tokens a request may consume: prompt estimate plus the answer limit"""
+    return estimate_messages_tokens(payload['messages']) + payload.get('max_tokens', 0)
+
+
+def _used_tokens(response) -> Optional[int]:
+    try:
+        usage = response.json().get('usage') or {}
+    except Exception:
+        return None
+    return usage.get('total_tokens')
+
+
+def get_provider_health() -> Dict[str, Any]:
+    """Circuit breaker state and observed provider latency for /api/health"""
+    p50 = _latency.percentile(50)
+    p95 = _latency.percentile(95)
+    with _resilience_stats_lock:
+        counters = dict(_resilience_stats)
+    return {
+        'circuit': _breaker.get_stats(),
+        'latency_p50': round(p50, 3) if p50 is not None else None,
+        'latency_p95': round(p95, 3) if p95 is not None else None,
+        'retries': counters['retries'],
+        'hedged': counters['hedged'],
+        'hedge_wins': counters['hedge_wins'],
+        'hedges_skipped': counters['hedges_skipped'],
+        'hedge_delay': _hedge_delay()
+    }
+
+
+def _close_future_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def _future_tokens(future) -> int:
+    """Provider tokens spent by a finished attempt (thread future or asyncio task)"""
+    if future.cancelled() or future.exception() is not None:
+        return 0
+    response = future.result()
+    if response.status_code != 200:
+        return 0
+    return _used_tokens(response) or 0
+
+
+def _backup_permit(reserved: int):
+    """Limiter permit for a hedged backup attempt, without waiting for one.
+    Returns (admitted, permit)"""
+    try:
+        return True, _limiter.try_acquire(reserved)
+    except LimiterRejected:
+        _count('hedges_skipped')
+        return False, None
+
+
 class MistralClient:
     """Client for interacting with Mistral AI API"""
 
     def __init__(self):
         self.api_key = os.environ.get("MISTRAL_API_KEY",
                                       "nxJcrPGFtx89fMeaLM2FdJS6STblMHAf")
-        self.base_url = "https://api.mistral.ai/v1"
-        self.model = "mistral-small-latest"
+        self.base_url = MistralConfig.BASE_URL.rstrip('/')
+        self.model = MistralConfig.MODEL
+        # All clients share one connection pool instead of opening a new
+        # TCP+TLS connection per message
+        self.transport = get_transport()
 
         self.system_prompts = {
             'ru': """
@@ -39,53 +361,8 @@ class MistralClient:
                      user_message: str,
                      context: str = "",
                      language: str = "ru") -> str:
-        try:
-            system_prompt = self.system_prompts.get(language,
-                                                    self.system_prompts['ru'])
-
-            messages = [{
-                "role": "system",
-                "content": system_prompt
-            }, {
-                "role":
-                "user",
-                "content":
-                f"Контекст из FAQ:\n{context}\n\nВопрос пользователя: {user_message}"
-            }]
-
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-
-            data = {
-                "model": self.model,
-                "messages": messages,
-                "max_tokens": 500,
-                "temperature": 0.7
-            }
-
-            response = requests.post(f"{self.base_url}/chat/completions",
-                                     headers=headers,
-                                     json=data,
-                                     timeout=30)
-
-            if response.status_code == 200:
-                result = response.json()
-                return result['choices'][0]['message']['content'].strip()
-            else:
-                logger.error(
-                    f"Mistral API error: {response.status_code} - {response.text}"
-                )
-                return self._get_fallback_response(language)
-
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Request error to Mistral API: {str(e)}")
-            return self._get_smart_fallback_response(user_message, context,
-                                                     language)
-        except Exception as e:
-            logger.error(f"Unexpected error in Mistral client: {str(e)}")
-            return self._get_fallback_response(language)
+        return self.get_response_with_system_prompt(user_message, context,
+                                                    language)
 
     def get_response_with_system_prompt(self,
                                         user_message: str,
@@ -93,53 +370,389 @@ class MistralClient:
                                         language: str = "ru",
                                         custom_system_prompt: str = "") -> str:
         """Get response using a custom system prompt"""
+        return self.complete(user_message, context, language,
+                             custom_system_prompt)['response']
+
+    def complete(self,
+                 user_message: str,
+                 context: str = "",
+                 language: str = "ru",
+                 custom_system_prompt: str = "",
+                 max_tokens: Optional[int] = None,
+                 history: Optional[ConversationContext] = None) -> Dict[str, Any]:
+        """Get response together with metadata ('cache_hit', 'fallback', token counts)"""
+        # Use custom system prompt if provided, otherwise fall back to default
+        system_prompt = custom_system_prompt if custom_system_prompt else self.system_prompts.get(language, self.system_prompts['ru'])
+
+        cache = get_completion_cache()
+        cache_key = make_cache_key(self.model, system_prompt, context,
+                                   user_message, language,
+                                   history.fingerprint() if history else "")
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return {'response': cached, 'cache_hit': True, 'fallback': False}
+
+        def request_completion():
+            return self._request_completion(system_prompt, user_message,
+                                            context, language, cache_key,
+                                            max_tokens, history)
+
+        if not MistralConfig.COALESCE_REQUESTS:
+            return request_completion()
+        # Concurrent identical questions wait for one provider call
+        result, shared = _single_flight.do(cache_key, request_completion)
+        # Followers did not spend any provider tokens
+        return dict(result, coalesced=True, prompt_tokens=None,
+                    completion_tokens=None) if shared else result
+
+    def _request_completion(self, system_prompt: str, user_message: str,
+                            context: str, language: str,
+                            cache_key: str,
+                            max_tokens: Optional[int] = None,
+                            history: Optional[ConversationContext] = None) -> Dict[str, Any]:
+        """Call the provider and cache a successful completion"""
         try:
-            # Use custom system prompt if provided, otherwise fall back to default
-            system_prompt = custom_system_prompt if custom_system_prompt else self.system_prompts.get(language, self.system_prompts['ru'])
+            messages = self._build_messages(system_prompt, user_message,
+                                            context, history)
 
-            messages = [{
-                "role": "system",
-                "content": system_prompt
-            }, {
-                "role":
-                "user",
-                "content":
-                f"Контекст из FAQ:\n{context}\n\nВопрос пользователя: {user_message}"
-            }]
-
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-
-            data = {
-                "model": self.model,
-                "messages": messages,
-                "max_tokens": 500,
-                "temperature": 0.7
-            }
-
-            response = requests.post(f"{self.base_url}/chat/completions",
-                                     headers=headers,
-                                     json=data,
-                                     timeout=30)
+            response = self._post_completion(
+                self._build_payload(messages, max_tokens))
 
             if response.status_code == 200:
                 result = response.json()
-                return result['choices'][0]['message']['content'].strip()
+                content = result['choices'][0]['message']['content'].strip()
+                get_completion_cache().set(cache_key, content)
+                return self._completion_result(content, messages, result)
             else:
                 logger.error(
                     f"Mistral API error: {response.status_code} - {response.text}"
                 )
-                return self._get_fallback_response(language)
+                return self._fallback_result(
+                    self._get_fallback_response(language))
 
+        except CallAbandoned:
+            raise  # Nobody waits for this answer; coalesced callers retry
+        except CircuitOpenError:
+            logger.warning("Mistral API circuit is open, serving fallback")
+            return self._fallback_result(
+                self._get_smart_fallback_response(user_message, context,
+                                                  language))
+        except LimiterRejected as e:
+            logger.warning(f"Mistral API request not admitted: {str(e)}")
+            return self._fallback_result(
+                self._get_smart_fallback_response(user_message, context,
+                                                  language))
         except requests.exceptions.RequestException as e:
             logger.error(f"Request error to Mistral API: {str(e)}")
-            return self._get_smart_fallback_response(user_message, context,
-                                                     language)
+            return self._fallback_result(
+                self._get_smart_fallback_response(user_message, context,
+                                                  language))
         except Exception as e:
             logger.error(f"Unexpected error in Mistral client: {str(e)}")
-            return self._get_fallback_response(language)
+            return self._fallback_result(self._get_fallback_response(language))
+
+    def _post_completion(self, payload: Dict[str, Any],
+                         stream: bool = False,
+                         hold: Optional[list] = None) -> requests.Response:
+        """POST to the provider through the rate limiter and circuit breaker,
+        with bounded jittered retries.
+
+        For streams pass a list as hold: the limiter permit of the successful
+        attempt is appended to it and must be released by the caller.
+        Raises CallAbandoned instead of sending once the caller has given up
+        (a losing fan-out call)."""
+        url = f"{self.base_url}/chat/completions"
+        headers = self._build_headers()
+        max_attempts = ResilienceConfig.RETRY_MAX_ATTEMPTS + 1
+        reserved = _reserved_tokens(payload)
+        response = None
+
+        for attempt in range(max_attempts):
+            raise_if_abandoned()
+            # Do not queue behind the limiter while the circuit is open
+            if _breaker.state == CircuitBreaker.OPEN:
+                if response is not None:
+                    return response
+                raise CircuitOpenError()
+            permit = _limiter.acquire(reserved)
+            try:
+                raise_if_abandoned()  # Given up while queued
+            except CallAbandoned:
+                _limiter.release(permit, 0)
+                raise
+            if not _breaker.allow_request():
+                _limiter.release(permit, 0)
+                if response is not None:
+                    return response
+                raise CircuitOpenError()
+            if attempt:
+                _count('retries')
+
+            started = time.monotonic()
+            try:
+                if stream:
+                    response = self.transport.post(url, headers=headers,
+                                                   json=payload, stream=True)
+                else:
+                    response = self._hedged_post(url, headers, payload, reserved)
+            except requests.exceptions.RequestException:
+                _limiter.release(permit, 0)
+                _breaker.record_failure(time.monotonic() - started)
+                if attempt == max_attempts - 1:
+                    raise
+                time.sleep(_retry_delay(None, attempt))
+                continue
+            except BaseException:
+                # Interrupted without an answer: no outcome for the breaker
+                _limiter.release(permit, 0)
+                _breaker.abandon_probe()
+                raise
+
+            latency = time.monotonic() - started
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                # Any non-retryable answer means the provider is reachable
+                _breaker.record_success(latency)
+                if response.status_code == 200:
+                    _latency.record(latency)
+                    if stream and hold is not None:
+                        hold.append(permit)
+                    else:
+                        _limiter.release(permit, None if stream else _used_tokens(response))
+                else:
+                    _limiter.release(permit, 0)
+                return response
+
+            _limiter.release(permit, 0)
+            _breaker.record_failure(latency)
+            if attempt == max_attempts - 1:
+                return response
+            logger.warning(
+                f"Mistral API returned {response.status_code}, retrying")
+            response.close()
+            time.sleep(_retry_delay(response, attempt))
+
+        return response
+
+    def _hedged_post(self, url: str, headers: Dict[str, str],
+                     payload: Dict[str, Any],
+                     reserved: int = 0) -> requests.Response:
+        """Send a backup attempt if the first one is slower than p95.
+
+        The caller's permit covers the first attempt; the backup takes its
+        own without waiting and is skipped when the limiter has none free"""
+        delay = _hedge_delay()
+        if delay is None:
+            return self.transport.post(url, headers=headers, json=payload)
+
+        executor = _get_hedge_executor()
+        primary = executor.submit(self.transport.post, url, headers=headers,
+                                  json=payload)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        admitted, permit = _backup_permit(reserved)
+        if not admitted:
+            return primary.result()
+        _count('hedged')
+        backup = executor.submit(self.transport.post, url, headers=headers,
+                                 json=payload)
+        backup.add_done_callback(
+            lambda future: _limiter.release(permit, _future_tokens(future)))
+        pending = {primary, backup}
+        fallback_response = None
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except requests.exceptions.RequestException as e:
+                    error = e
+                    continue
+                if response.status_code == 200:
+                    if future is backup:
+                        _count('hedge_wins')
+                    # The slower attempt is abandoned, release its connection
+                    for other in pending:
+                        other.add_done_callback(_close_future_response)
+                    return response
+                if fallback_response is None:
+                    fallback_response = response
+                else:
+                    response.close()
+
+        if fallback_response is not None:
+            return fallback_response
+        raise error
+
+    def get_cached_response(self,
+                            user_message: str,
+                            context: str = "",
+                            language: str = "ru",
+                            custom_system_prompt: str = "",
+                            history: Optional[ConversationContext] = None) -> Optional[str]:
+        """Look up a completion in the cache without calling the provider"""
+        system_prompt = custom_system_prompt if custom_system_prompt else self.system_prompts.get(language, self.system_prompts['ru'])
+        return get_completion_cache().get(
+            make_cache_key(self.model, system_prompt, context, user_message,
+                           language, history.fingerprint() if history else ""))
+
+    def _completion_result(self, content: str,
+                           messages: List[Dict[str, str]],
+                           data: Dict[str, Any]) -> Dict[str, Any]:
+        usage = self._fill_usage(usage_from_response(data), messages, content)
+        return dict(usage, response=content, cache_hit=False, fallback=False)
+
+    def _fill_usage(self, usage: Dict[str, Optional[int]],
+                    messages: List[Dict[str, str]],
+                    content: str) -> Dict[str, Optional[int]]:
+        # Estimate whatever the provider did not report
+        if usage.get('prompt_tokens') is None:
+            usage['prompt_tokens'] = estimate_messages_tokens(messages)
+        if usage.get('completion_tokens') is None:
+            usage['completion_tokens'] = estimate_tokens(content)
+        return usage
+
+    def _fallback_result(self, response: str) -> Dict[str, Any]:
+        # Fallback answers are never cached
+        return {'response': response, 'cache_hit': False, 'fallback': True}
+
+    def stream_response_with_system_prompt(
+            self,
+            user_message: str,
+            context: str = "",
+            language: str = "ru",
+            custom_system_prompt: str = "",
+            max_tokens: Optional[int] = None,
+            usage: Optional[Dict[str, Any]] = None,
+            history: Optional[ConversationContext] = None) -> Iterator[str]:
+        """Stream response tokens as they arrive from the provider
+
+        If a dict is passed as usage, it receives the token counts once the
+        stream has finished, or 'fallback': True when the answer is canned
+        text or was cut short by an error."""
+        yielded = False
+        completed = False
+        # The limiter slot is held until the whole answer has been streamed
+        held_permits = []
+        used_tokens = None
+        try:
+            system_prompt = custom_system_prompt if custom_system_prompt else self.system_prompts.get(language, self.system_prompts['ru'])
+
+            messages = self._build_messages(system_prompt, user_message,
+                                            context, history)
+            payload = self._build_payload(messages, max_tokens)
+            payload["stream"] = True
+
+            # Streams are retried only before the first token and never hedged
+            response = self._post_completion(payload, stream=True,
+                                             hold=held_permits)
+
+            with response:
+                if response.status_code != 200:
+                    logger.error(
+                        f"Mistral API error: {response.status_code} - {response.text}"
+                    )
+                    yield self._get_fallback_response(language)
+                    return
+
+                tokens = []
+                reported = {}
+                for token in self._iter_stream_tokens(response, reported):
+                    yielded = True
+                    tokens.append(token)
+                    yield token
+
+            content = "".join(tokens).strip()
+            get_completion_cache().set(
+                make_cache_key(self.model, system_prompt, context,
+                               user_message, language,
+                               history.fingerprint() if history else ""),
+                content)
+            filled = self._fill_usage(usage_from_response(reported),
+                                      messages, content)
+            used_tokens = filled['prompt_tokens'] + filled['completion_tokens']
+            completed = True
+            if usage is not None:
+                usage.update(filled)
+
+        except CircuitOpenError:
+            logger.warning("Mistral API circuit is open, serving fallback")
+            yield self._get_smart_fallback_response(user_message, context,
+                                                    language)
+        except LimiterRejected as e:
+            logger.warning(f"Mistral API request not admitted: {str(e)}")
+            yield self._get_smart_fallback_response(user_message, context,
+                                                    language)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Request error to Mistral API stream: {str(e)}")
+            if not yielded:
+                yield self._get_smart_fallback_response(
+                    user_message, context, language)
+        except Exception as e:
+            logger.error(f"Unexpected error in Mistral stream: {str(e)}")
+            if not yielded:
+                yield self._get_fallback_response(language)
+        finally:
+            if not completed and usage is not None:
+                usage['fallback'] = True
+            for permit in held_permits:
+                _limiter.release(permit, used_tokens)
+
+    def _iter_stream_tokens(self,
+                            response: requests.Response,
+                            reported: Optional[Dict[str, Any]] = None) -> Iterator[str]:
+        """Parse server-sent events of a streamed chat completion"""
+        # Decode each line ourselves: without a charset requests would use
+        # latin-1 and split UTF-8 text on bytes that look like line breaks
+        for raw_line in response.iter_lines():
+            line = raw_line.decode('utf-8')
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            # The last chunk carries token usage
+            if reported is not None and chunk.get('usage'):
+                reported['usage'] = chunk['usage']
+            choices = chunk.get('choices') or []
+            if not choices:
+                continue
+            token = (choices[0].get('delta') or {}).get('content')
+            if token:
+                yield token
+
+    def _build_messages(self, system_prompt: str, user_message: str,
+                        context: str,
+                        history: Optional[ConversationContext] = None) -> List[Dict[str, str]]:
+        if history and history.summary:
+            system_prompt = f"{system_prompt}\n\nРанее в этом диалоге:\n{history.summary}"
+        return [{
+            "role": "system",
+            "content": system_prompt
+        }] + (history.messages() if history else []) + [{
+            "role":
+            "user",
+            "content":
+            f"Контекст из FAQ:\n{context}\n\nВопрос пользователя: {user_message}"
+        }]
+
+    def _build_headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def _build_payload(self, messages: List[Dict[str, str]],
+                       max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens or TokenBudgetConfig.COMPLETION_MAX_TOKENS,
+            "temperature": 0.7
+        }
 
     def _get_smart_fallback_response(self,
                                      user_message: str,
@@ -209,4 +822,218 @@ class MistralClient:
             'kz':
             "**Кешіріңіз, мен уақытша қолжетімсізбін.**\n\nУниверситеттің қабылдау комиссиясына телефон немесе электрондық пошта арқылы хабарласыңыз."
         }
-        return fallback_responses.get(language, fallback_responses['ru'])
\ No newline at end of file
+        return fallback_responses.get(language, fallback_responses['ru'])
+
+
+class AsyncMistralClient(MistralClient):
+    """Asyncio variant of MistralClient for the ASGI chat endpoint"""
+
+    def __init__(self):
+        if httpx is None:
+            raise RuntimeError("httpx is required for AsyncMistralClient")
+        super().__init__()
+        self.async_transport = get_async_transport()
+
+    async def get_response(self,
+                           user_message: str,
+                           context: str = "",
+                           language: str = "ru") -> str:
+        return await self.get_response_with_system_prompt(
+            user_message, context, language)
+
+    async def get_response_with_system_prompt(
+            self,
+            user_message: str,
+            context: str = "",
+            language: str = "ru",
+            custom_system_prompt: str = "") -> str:
+        """Get response using a custom system prompt without blocking the loop"""
+        result = await self.complete(user_message, context, language,
+                                     custom_system_prompt)
+        return result['response']
+
+    async def complete(self,
+                       user_message: str,
+                       context: str = "",
+                       language: str = "ru",
+                       custom_system_prompt: str = "",
+                       max_tokens: Optional[int] = None,
+                       history: Optional[ConversationContext] = None) -> Dict[str, Any]:
+        """Async variant of MistralClient.complete"""
+        system_prompt = custom_system_prompt if custom_system_prompt else self.system_prompts.get(language, self.system_prompts['ru'])
+
+        cache = get_completion_cache()
+        cache_key = make_cache_key(self.model, system_prompt, context,
+                                   user_message, language,
+                                   history.fingerprint() if history else "")
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return {'response': cached, 'cache_hit': True, 'fallback': False}
+
+        def request_completion():
+            return self._arequest_completion(system_prompt, user_message,
+                                             context, language, cache_key,
+                                             max_tokens, history)
+
+        if not MistralConfig.COALESCE_REQUESTS:
+            return await request_completion()
+        result, shared = await _async_single_flight.do(cache_key,
+                                                        request_completion)
+        # Followers did not spend any provider tokens
+        return dict(result, coalesced=True, prompt_tokens=None,
+                    completion_tokens=None) if shared else result
+
+    async def _arequest_completion(self, system_prompt: str,
+                                   user_message: str, context: str,
+                                   language: str,
+                                   cache_key: str,
+                                   max_tokens: Optional[int] = None,
+                                   history: Optional[ConversationContext] = None) -> Dict[str, Any]:
+        """Async variant of MistralClient._request_completion"""
+        try:
+            messages = self._build_messages(system_prompt, user_message,
+                                            context, history)
+
+            response = await self._apost_completion(
+                self._build_payload(messages, max_tokens))
+
+            if response.status_code == 200:
+                result = response.json()
+                content = result['choices'][0]['message']['content'].strip()
+                get_completion_cache().set(cache_key, content)
+                return self._completion_result(content, messages, result)
+            else:
+                logger.error(
+                    f"Mistral API error: {response.status_code} - {response.text}"
+                )
+                return self._fallback_result(
+                    self._get_fallback_response(language))
+
+        except CircuitOpenError:
+            logger.warning("Mistral API circuit is open, serving fallback")
+            return self._fallback_result(
+                self._get_smart_fallback_response(user_message, context,
+                                                  language))
+        except LimiterRejected as e:
+            logger.warning(f"Mistral API request not admitted: {str(e)}")
+            return self._fallback_result(
+                self._get_smart_fallback_response(user_message, context,
+                                                  language))
+        except httpx.HTTPError as e:
+            logger.error(f"Request error to Mistral API: {str(e)}")
+            return self._fallback_result(
+                self._get_smart_fallback_response(user_message, context,
+                                                  language))
+        except Exception as e:
+            logger.error(f"Unexpected error in async Mistral client: {str(e)}")
+            return self._fallback_result(self._get_fallback_response(language))
+
+    async def _apost_completion(self, payload: Dict[str, Any]):
+        """Async variant of MistralClient._post_completion"""
+        url = f"{self.base_url}/chat/completions"
+        headers = self._build_headers()
+        max_attempts = ResilienceConfig.RETRY_MAX_ATTEMPTS + 1
+        reserved = _reserved_tokens(payload)
+        response = None
+
+        for attempt in range(max_attempts):
+            if _breaker.state == CircuitBreaker.OPEN:
+                if response is not None:
+                    return response
+                raise CircuitOpenError()
+            permit = await _limiter.acquire_async(reserved)
+            if not _breaker.allow_request():
+                _limiter.release(permit, 0)
+                if response is not None:
+                    return response
+                raise CircuitOpenError()
+            if attempt:
+                _count('retries')
+
+            started = time.monotonic()
+            try:
+                response = await self._ahedged_post(url, headers, payload, reserved)
+            except httpx.HTTPError:
+                _limiter.release(permit, 0)
+                _breaker.record_failure(time.monotonic() - started)
+                if attempt == max_attempts - 1:
+                    raise
+                await asyncio.sleep(_retry_delay(None, attempt))
+                continue
+            except BaseException:
+                # Cancelled while waiting for the provider: no outcome for the breaker
+                _limiter.release(permit, 0)
+                _breaker.abandon_probe()
+                raise
+
+            latency = time.monotonic() - started
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                _breaker.record_success(latency)
+                if response.status_code == 200:
+                    _latency.record(latency)
+                    _limiter.release(permit, _used_tokens(response))
+                else:
+                    _limiter.release(permit, 0)
+                return response
+
+            _limiter.release(permit, 0)
+            _breaker.record_failure(latency)
+            if attempt == max_attempts - 1:
+                return response
+            logger.warning(
+                f"Mistral API returned {response.status_code}, retrying")
+            await asyncio.sleep(_retry_delay(response, attempt))
+
+        return response
+
+    async def _ahedged_post(self, url: str, headers: Dict[str, str],
+                            payload: Dict[str, Any], reserved: int = 0):
+        """Async variant of MistralClient._hedged_post"""
+        delay = _hedge_delay()
+        if delay is None:
+            return await self.async_transport.post(url, headers=headers,
+                                                   json=payload)
+
+        primary = asyncio.ensure_future(
+            self.async_transport.post(url, headers=headers, json=payload))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if done:
+            return primary.result()
+
+        admitted, permit = _backup_permit(reserved)
+        if not admitted:
+            return await primary
+        _count('hedged')
+        backup = asyncio.ensure_future(
+            self.async_transport.post(url, headers=headers, json=payload))
+        backup.add_done_callback(
+            lambda task: _limiter.release(permit, _future_tokens(task)))
+        pending = {primary, backup}
+        fallback_response = None
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        response = task.result()
+                    except httpx.HTTPError as e:
+                        error = e
+                        continue
+                    if response.status_code == 200:
+                        if task is backup:
+                            _count('hedge_wins')
+                        return response
+                    fallback_response = response
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if fallback_response is not None:
+            return fallback_response
+        raise error
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальная заглушка Mistral AI API для нагрузочного тестирования
+Local Mistral-compatible stub server for load and latency testing
+
+Отвечает на POST /v1/chat/completions (в том числе stream=true) без обращения
+к платному API. Задержки, ошибки и тексты ответов настраиваются.
+
+Запуск / Run:
+    python mistral_stub.py --port 8081 --latency lognormal:-0.5,0.4 --error-429 0.05
+    MISTRAL_BASE_URL=http://127.0.0.1:8081/v1 python main.py
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+from token_budget import estimate_messages_tokens, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CANNED_RESPONSES = [
+    "**Приёмная комиссия** работает с 20 июня по 25 августа.\n\n"
+    "- Документы принимаются онлайн и в главном корпусе\n"
+    "- Консультации: пн–пт, 9:00–18:00",
+    "**Общежитие** предоставляется иногородним студентам первого курса.\n\n"
+    "Заявление подаётся через деканат после зачисления.",
+    "**Стипендия** назначается по итогам сессии.\n\n"
+    "Подробности уточняйте в офисе регистратора.",
+]
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Build a latency sampler from 'fixed:0.5', 'uniform:0.2,1', 'normal:0.8,0.2',
+    'lognormal:mu,sigma' or 'exp:mean' (seconds)"""
+    kind, _, args = spec.partition(':')
+    params = [float(x) for x in args.split(',') if x.strip()] if args else []
+    kind = kind.strip().lower()
+    if kind == 'fixed':
+        value = params[0] if params else 0.0
+        return lambda: value
+    if kind == 'uniform':
+        low, high = params
+        return lambda: random.uniform(low, high)
+    if kind == 'normal':
+        mean, stddev = params
+        return lambda: max(0.0, random.gauss(mean, stddev))
+    if kind == 'lognormal':
+        mu, sigma = params
+        return lambda: random.lognormvariate(mu, sigma)
+    if kind == 'exp':
+        mean = params[0]
+        return lambda: random.expovariate(1.0 / mean) if mean > 0 else 0.0
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class StubBehaviour:
+    """Latency, fault injection and response settings shared by all handlers"""
+
+    def __init__(self, latency: str = 'fixed:0.2', token_delay: float = 0.02,
+                 error_429: float = 0.0, error_500: float = 0.0,
+                 timeout_rate: float = 0.0, timeout_seconds: float = 60.0,
+                 mode: str = 'canned', canned: Optional[List[str]] = None,
+                 seed: Optional[int] = None):
+        self.latency_spec = latency
+        self.sample_latency = parse_latency(latency)
+        self.token_delay = token_delay
+        self.error_429 = error_429
+        self.error_500 = error_500
+        self.timeout_rate = timeout_rate
+        self.timeout_seconds = timeout_seconds
+        self.mode = mode
+        self.canned = canned or DEFAULT_CANNED_RESPONSES
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'streams': 0, 'errors_429': 0,
+                      'errors_500': 0, 'timeouts': 0}
+
+    def count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def pick_fault(self) -> Optional[str]:
+        """Return '429', '500', 'timeout' or None for this request"""
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.timeout_rate:
+            return 'timeout'
+        roll -= self.timeout_rate
+        if roll < self.error_429:
+            return '429'
+        roll -= self.error_429
+        if roll < self.error_500:
+            return '500'
+        return None
+
+    def make_response(self, messages: List[Dict[str, str]]) -> str:
+        if self.mode == 'echo':
+            question = messages[-1].get('content', '') if messages else ''
+            # Only the question itself, without the knowledge context
+            question = question.rsplit('Вопрос пользователя:', 1)[-1].strip()
+            return f"Эхо: {question}"
+        with self._lock:
+            return self._random.choice(self.canned)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Speaks the subset of the Mistral API used by MistralClient"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'MistralStub/1.0'
+
+    @property
+    def behaviour(self) -> StubBehaviour:
+        return self.server.behaviour
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            self._send_json(200, dict(self.behaviour.stats,
+                                      latency=self.behaviour.latency_spec))
+        elif self.path.rstrip('/') == '/v1/models':
+            self._send_json(200, {'object': 'list', 'data': [
+                {'id': 'mistral-small-latest', 'object': 'model'}]})
+        else:
+            self._send_json(404, {'message': 'Not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if self.path.rstrip('/') != '/v1/chat/completions':
+            self._send_json(404, {'message': 'Not found'})
+            return
+        try:
+            request = json.loads(body or b'{}')
+        except ValueError:
+            self._send_json(400, {'message': 'Invalid JSON body'})
+            return
+
+        behaviour = self.behaviour
+        behaviour.count('requests')
+        fault = behaviour.pick_fault()
+        if fault == 'timeout':
+            behaviour.count('timeouts')
+            # Держим соединение, пока клиент не отвалится по таймауту
+            time.sleep(behaviour.timeout_seconds)
+            self.close_connection = True
+            return
+
+        time.sleep(behaviour.sample_latency())
+        if fault == '429':
+            behaviour.count('errors_429')
+            self._send_json(429, {'message': 'Requests rate limit exceeded'},
+                            extra_headers={'Retry-After': '1'})
+            return
+        if fault == '500':
+            behaviour.count('errors_500')
+            self._send_json(500, {'message': 'Internal server error'})
+            return
+
+        messages = request.get('messages') or []
+        content = behaviour.make_response(messages)
+        max_tokens = request.get('max_tokens')
+        words = content.split(' ')
+        if max_tokens and estimate_tokens(content) > max_tokens:
+            # Grossly imitate truncation at max_tokens
+            words = words[:max(1, int(max_tokens * len(words) / estimate_tokens(content)))]
+            content = ' '.join(words)
+        usage = {
+            'prompt_tokens': estimate_messages_tokens(messages),
+            'completion_tokens': estimate_tokens(content)
+        }
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        model = request.get('model', 'mistral-small-latest')
+
+        if request.get('stream'):
+            behaviour.count('streams')
+            self._send_stream(model, words, usage)
+        else:
+            self._send_json(200, {
+                'id': f"cmpl-{uuid.uuid4().hex}",
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': content},
+                    'finish_reason': 'stop'
+                }],
+                'usage': usage
+            })
+
+    def _send_json(self, status: int, data: Dict[str, Any],
+                   extra_headers: Optional[Dict[str, str]] = None):
+        payload = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _write_chunk(self, data: str):
+        encoded = data.encode('utf-8')
+        self.wfile.write(f"{len(encoded):X}\r\n".encode() + encoded + b"\r\n")
+        self.wfile.flush()
+
+    def _send_stream(self, model: str, words: List[str], usage: Dict[str, int]):
+        """Server-sent events in the provider's chunk format"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        completion_id = f"cmpl-{uuid.uuid4().hex}"
+        try:
+            for index, word in enumerate(words):
+                token = word if index == 0 else ' ' + word
+                chunk = {
+                    'id': completion_id,
+                    'object': 'chat.completion.chunk',
+                    'model': model,
+                    'choices': [{'index': 0, 'delta': {'content': token},
+                                 'finish_reason': None}]
+                }
+                self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+                if self.behaviour.token_delay:
+                    time.sleep(self.behaviour.token_delay)
+            final = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'model': model,
+                'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+                'usage': usage
+            }
+            self._write_chunk(f"data: {json.dumps(final)}\n\n")
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+def create_stub_server(host: str = '127.0.0.1', port: int = 8081,
+                       **behaviour_options) -> ThreadingHTTPServer:
+    """Create a stub server; port=0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.behaviour = StubBehaviour(**behaviour_options)
+    return server
+
+
+def start_stub_server(host: str = '127.0.0.1', port: int = 0,
+                      **behaviour_options) -> ThreadingHTTPServer:
+    """Run a stub server in a background thread (for tests and benchmarks)"""
+    server = create_stub_server(host, port, **behaviour_options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True,
+                              name='mistral-stub')
+    thread.start()
+    return server
+
+
+def stub_base_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/v1"
+
+
+def _load_canned(path: Optional[str]) -> Optional[List[str]]:
+    """Canned answers from a JSON list or a text file separated by blank lines"""
+    if not path:
+        return None
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    if path.endswith('.json'):
+        return [str(item) for item in json.loads(text)]
+    return [part.strip() for part in text.split('\n\n\n') if part.strip()]
+
+
+def main():
+    env = os.environ.get
+    parser = argparse.ArgumentParser(description="Local Mistral-compatible stub server")
+    parser.add_argument('--host', default=env('MISTRAL_STUB_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(env('MISTRAL_STUB_PORT', '8081')))
+    parser.add_argument('--latency', default=env('MISTRAL_STUB_LATENCY', 'fixed:0.2'),
+                        help="fixed:S | uniform:A,B | normal:MEAN,SD | lognormal:MU,SIGMA | exp:MEAN")
+    parser.add_argument('--token-delay', type=float, default=float(env('MISTRAL_STUB_TOKEN_DELAY', '0.02')),
+                        help="Delay between streamed tokens, seconds")
+    parser.add_argument('--error-429', type=float, default=float(env('MISTRAL_STUB_ERROR_429', '0')),
+                        help="Share of requests answered with 429")
+    parser.add_argument('--error-500', type=float, default=float(env('MISTRAL_STUB_ERROR_500', '0')),
+                        help="Share of requests answered with 500")
+    parser.add_argument('--timeout-rate', type=float, default=float(env('MISTRAL_STUB_TIMEOUT_RATE', '0')),
+                        help="Share of requests that never get an answer")
+    parser.add_argument('--timeout-seconds', type=float, default=float(env('MISTRAL_STUB_TIMEOUT_SECONDS', '60')))
+    parser.add_argument('--mode', choices=['canned', 'echo'], default=env('MISTRAL_STUB_MODE', 'canned'))
+    parser.add_argument('--canned-file', default=env('MISTRAL_STUB_CANNED_FILE'),
+                        help="JSON list or text file with answers separated by two blank lines")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = create_stub_server(
+        args.host, args.port,
+        latency=args.latency, token_delay=args.token_delay,
+        error_429=args.error_429, error_500=args.error_500,
+        timeout_rate=args.timeout_rate, timeout_seconds=args.timeout_seconds,
+        mode=args.mode, canned=_load_canned(args.canned_file), seed=args.seed)
+    logger.info(f"Mistral stub listening on {stub_base_url(server)} "
+                f"(latency {args.latency}, mode {args.mode})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
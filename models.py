@@ -71,6 +71,11 @@ class UserQuery(db.Model):
     agent_name = db.Column(db.String(100))  # Name of the agent
     agent_confidence = db.Column(db.Float)  # Confidence score of the selected agent
     context_used = db.Column(db.Boolean, default=False)  # Whether FAQ context was used
+    cache_hit = db.Column(db.Boolean, default=False)  # Whether the answer came from the response cache
+    fallback = db.Column(db.Boolean, default=False)  # Canned or cut-short answer instead of a provider completion
+    semantic_source_id = db.Column(db.Integer)  # Liked query whose answer the semantic cache reused
+    prompt_tokens = db.Column(db.Integer)  # Tokens sent to the LLM (null if no provider call)
+    completion_tokens = db.Column(db.Integer)  # Tokens generated by the LLM
     
     # Rating system fields
     user_rating = db.Column(db.String(10))  # 'like', 'dislike', or null
@@ -182,6 +187,7 @@ class AgentType(db.Model):
     system_prompt_ru = db.Column(db.Text)  # System prompt in Russian
     system_prompt_kz = db.Column(db.Text)  # System prompt in Kazakh
     system_prompt_en = db.Column(db.Text)  # System prompt in English
+    keywords = db.Column(db.Text)  # Comma-separated routing keywords; empty keeps the built-in ones
     icon_class = db.Column(db.String(50))  # CSS icon class
     color_scheme = db.Column(db.String(20))  # Color scheme identifier
     priority = db.Column(db.Integer, default=1)  # Display priority
@@ -0,0 +1,203 @@
+# Ограничение нагрузки на LLM-провайдера: RPS, токены в минуту, параллельность
+# Process-wide rate and concurrency limiter with a fair FIFO queue
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from resilience import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+
+class LimiterRejected(Exception):
+    """The request could not be admitted (queue full or deadline passed)"""
+
+
+class TokenBucket:
+    """Classic token bucket; not thread-safe, guarded by the limiter lock"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (after refill)"""
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate if self.rate > 0 else float('inf')
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+    def give_back(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class Permit:
+    def __init__(self, tokens: int, waited: float):
+        self.tokens = tokens
+        self.waited = waited
+
+
+class ProviderLimiter:
+    """Requests-per-second, tokens-per-minute and concurrency limits.
+
+    Callers queue in arrival order; only the head of the queue may be
+    admitted, so a large request cannot be starved by small ones."""
+
+    def __init__(self, enabled: bool = True, rps: float = 5, burst: float = 10,
+                 tokens_per_minute: float = 500000, max_concurrency: int = 16,
+                 max_queue: int = 200, queue_timeout: float = 15):
+        self.enabled = enabled
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._requests = TokenBucket(rps, max(burst, 1))
+        self._tokens = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute)
+        self._queue = deque()
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._wait_times = LatencyTracker(size=500)
+        self.stats = {'admitted': 0, 'rejected_queue_full': 0,
+                      'timed_out': 0, 'max_queue_depth': 0}
+
+    def _admission_delay(self, tokens: int, now: float) -> Optional[float]:
+        """0 if admissible now, seconds to wait for a bucket, None to wait for a release"""
+        if self._in_flight >= self.max_concurrency:
+            return None
+        self._requests.refill(now)
+        self._tokens.refill(now)
+        return max(self._requests.wait_time(1), self._tokens.wait_time(tokens))
+
+    def _enqueue(self) -> object:
+        if len(self._queue) >= self.max_queue:
+            self.stats['rejected_queue_full'] += 1
+            raise LimiterRejected("LLM request queue is full")
+        ticket = object()
+        self._queue.append(ticket)
+        self.stats['max_queue_depth'] = max(self.stats['max_queue_depth'], len(self._queue))
+        return ticket
+
+    def _try_admit(self, ticket: object, tokens: int, started: float):
+        """Return a Permit, or the delay hint if the ticket must keep waiting"""
+        now = time.monotonic()
+        if self._queue[0] is not ticket:
+            return None, None
+        delay = self._admission_delay(tokens, now)
+        if delay != 0:
+            return None, delay
+        self._queue.popleft()
+        self._requests.take(1)
+        self._tokens.take(tokens)
+        self._in_flight += 1
+        self.stats['admitted'] += 1
+        waited = now - started
+        self._wait_times.record(waited)
+        # The next ticket is now at the head of the queue
+        self._cond.notify_all()
+        return Permit(tokens, waited), 0
+
+    def _abandon(self, ticket: object):
+        if ticket in self._queue:
+            self._queue.remove(ticket)
+            self.stats['timed_out'] += 1
+            self._cond.notify_all()
+
+    def acquire(self, tokens: int = 0, timeout: Optional[float] = None) -> Optional[Permit]:
+        """Block until the request may be sent; raises LimiterRejected"""
+        if not self.enabled:
+            return None
+        started = time.monotonic()
+        deadline = started + (self.queue_timeout if timeout is None else timeout)
+        with self._cond:
+            ticket = self._enqueue()
+            try:
+                while True:
+                    permit, delay = self._try_admit(ticket, tokens, started)
+                    if permit is not None:
+                        return permit
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise LimiterRejected("Timed out waiting for an LLM request slot")
+                    self._cond.wait(min(remaining, delay) if delay else remaining)
+            finally:
+                self._abandon(ticket)
+
+    async def acquire_async(self, tokens: int = 0, timeout: Optional[float] = None) -> Optional[Permit]:
+        """Event-loop friendly acquire sharing the same queue and budgets"""
+        if not self.enabled:
+            return None
+        started = time.monotonic()
+        deadline = started + (self.queue_timeout if timeout is None else timeout)
+        with self._cond:
+            ticket = self._enqueue()
+        try:
+            while True:
+                with self._cond:
+                    permit, delay = self._try_admit(ticket, tokens, started)
+                if permit is not None:
+                    return permit
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LimiterRejected("Timed out waiting for an LLM request slot")
+                # Poll: the loop must not block on the threading condition
+                await asyncio.sleep(min(remaining, delay or 0.01, 0.05))
+        finally:
+            with self._cond:
+                self._abandon(ticket)
+
+    def try_acquire(self, tokens: int = 0) -> Optional[Permit]:
+        """Admit the request only if it would not wait (nobody queued and the
+        budgets allow it now); raises LimiterRejected otherwise"""
+        if not self.enabled:
+            return None
+        with self._cond:
+            if self._queue or self._admission_delay(tokens, time.monotonic()) != 0:
+                raise LimiterRejected("No LLM request slot is free right now")
+            ticket = self._enqueue()
+            permit, _ = self._try_admit(ticket, tokens, time.monotonic())
+            return permit
+
+    def release(self, permit: Optional[Permit], used_tokens: Optional[int] = None):
+        """Free the concurrency slot and settle the token reservation"""
+        if permit is None:
+            return
+        with self._cond:
+            self._in_flight -= 1
+            if used_tokens is not None:
+                now = time.monotonic()
+                self._tokens.refill(now)
+                if used_tokens < permit.tokens:
+                    self._tokens.give_back(permit.tokens - used_tokens)
+                else:
+                    self._tokens.take(used_tokens - permit.tokens)
+            self._cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            now = time.monotonic()
+            self._requests.refill(now)
+            self._tokens.refill(now)
+            p50 = self._wait_times.percentile(50)
+            p95 = self._wait_times.percentile(95)
+            return dict(
+                self.stats,
+                enabled=self.enabled,
+                queue_depth=len(self._queue),
+                in_flight=self._in_flight,
+                max_concurrency=self.max_concurrency,
+                tokens_available=int(self._tokens.tokens),
+                wait_p50=round(p50, 3) if p50 is not None else None,
+                wait_p95=round(p95, 3) if p95 is not None else None
+            )
@@ -0,0 +1,114 @@
+# Объединение одинаковых одновременных запросов к LLM (single-flight)
+# Request coalescing for identical concurrent provider calls
+
+import asyncio
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Run at most one call per key; concurrent callers wait and share its result.
+
+    A leader error of one of the retry_errors types concerns the leader alone
+    (e.g. its caller gave up); waiting callers then make the call themselves."""
+
+    def __init__(self, wait_timeout: Optional[float] = None,
+                 retry_errors: Tuple[Type[BaseException], ...] = ()):
+        self.wait_timeout = wait_timeout
+        self.retry_errors = retry_errors
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return (result, shared) where shared is True for waiting callers"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            if not call.done.wait(self.wait_timeout):
+                # The leader is stuck; make our own call rather than wait forever
+                return fn(), False
+            if isinstance(call.error, self.retry_errors):
+                return self.do(key, fn)
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'in_flight': len(self._calls), 'leaders': self.leaders, 'shared': self.shared}
+
+
+_LEADER_CANCELLED = object()  # Result seen by followers when the leader was cancelled
+
+
+class AsyncSingleFlight:
+    """asyncio variant of SingleFlight for a single event loop"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.shared = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        future = self._calls.get(key)
+        while future is not None and future.get_loop() is asyncio.get_running_loop():
+            # shield: a cancelled follower must not cancel the leader's call
+            result = await asyncio.shield(future)
+            if result is not _LEADER_CANCELLED:
+                self.shared += 1
+                return result, True
+            # The leader's own request was cancelled; this one was not, so make
+            # the call (or follow whoever got to it first)
+            future = self._calls.get(key)
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self.leaders += 1
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            future.set_result(_LEADER_CANCELLED)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody is waiting
+            future.exception()
+            raise
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'in_flight': len(self._calls), 'leaders': self.leaders, 'shared': self.shared}
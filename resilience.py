@@ -0,0 +1,200 @@
+# Устойчивость вызовов LLM: circuit breaker, повторы с джиттером, хеджирование
+# Resilience primitives for provider calls
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# HTTP-статусы, при которых имеет смысл повторить запрос
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the circuit is open"""
+
+
+class CallAbandoned(Exception):
+    """Raised before a provider request whose caller no longer needs the answer"""
+
+
+# Set by fan-out workers: once the fan-out has picked an answer or hit its
+# deadline, the losing calls stop before their next provider request
+_abandoned: ContextVar[Optional[threading.Event]] = ContextVar('call_abandoned', default=None)
+
+
+@contextmanager
+def abandonable(event: threading.Event) -> Iterator[None]:
+    """Calls made in this block raise CallAbandoned at their next check once event is set"""
+    token = _abandoned.set(event)
+    try:
+        yield
+    finally:
+        _abandoned.reset(token)
+
+
+def raise_if_abandoned():
+    event = _abandoned.get()
+    if event is not None and event.is_set():
+        raise CallAbandoned()
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies"""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class CircuitBreaker:
+    """Trips on error rate or slow-call rate over a sliding time window"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, enabled: bool = True, window: float = 60, min_requests: int = 10,
+                 error_rate_threshold: float = 0.5, slow_call_threshold: float = 10.0,
+                 slow_rate_threshold: float = 0.5, open_seconds: float = 30):
+        self.enabled = enabled
+        self.window = window
+        self.min_requests = min_requests
+        self.error_rate_threshold = error_rate_threshold
+        self.slow_call_threshold = slow_call_threshold
+        self.slow_rate_threshold = slow_rate_threshold
+        self.open_seconds = open_seconds
+        self._outcomes = deque()  # (timestamp, failed, slow)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.trips = 0
+        self.rejected = 0
+
+    def allow_request(self) -> bool:
+        """False while the circuit is open; lets one probe through when half-open"""
+        if not self.enabled:
+            return True
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    self.rejected += 1
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self.rejected += 1
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def abandon_probe(self):
+        """A call let through by allow_request ended without an outcome (e.g.
+        cancelled); the next call may probe instead"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probe_in_flight = False
+
+    def record_success(self, latency: float):
+        self._record(failed=False, latency=latency)
+
+    def record_failure(self, latency: float = 0.0):
+        self._record(failed=True, latency=latency)
+
+    def _record(self, failed: bool, latency: float):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        slow = latency >= self.slow_call_threshold
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                if failed or slow:
+                    self._open(now)
+                else:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                return
+
+            self._outcomes.append((now, failed, slow))
+            self._trim(now)
+            total = len(self._outcomes)
+            if self._state != self.CLOSED or total < self.min_requests:
+                return
+            failures = sum(1 for _, f, _ in self._outcomes if f)
+            slow_calls = sum(1 for _, _, s in self._outcomes if s)
+            if (failures / total >= self.error_rate_threshold
+                    or slow_calls / total >= self.slow_rate_threshold):
+                self._open(now)
+
+    def _open(self, now: float):
+        self._state = self.OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        self.trips += 1
+        logger.warning(f"Circuit breaker opened for {self.open_seconds}s")
+
+    def _trim(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                return self.HALF_OPEN
+            return self._state
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._trim(time.monotonic())
+            total = len(self._outcomes)
+            failures = sum(1 for _, f, _ in self._outcomes if f)
+        return {
+            'state': self.state,
+            'window_requests': total,
+            'error_rate': failures / total if total else 0.0,
+            'trips': self.trips,
+            'rejected': self.rejected
+        }
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def retry_after_seconds(headers, cap: float) -> Optional[float]:
+    """Parse a numeric Retry-After header, bounded by cap"""
+    value = headers.get('Retry-After') if headers else None
+    if not value:
+        return None
+    try:
+        return min(cap, max(0.0, float(value)))
+    except ValueError:
+        return None
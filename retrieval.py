@@ -0,0 +1,201 @@
+# Гибридный поиск контекста: знания агента, FAQ и база знаний, слияние рангов (RRF)
+# Hybrid retrieval: lexical and vector rankings over all knowledge sources, fused by reciprocal rank
+
+import logging
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from bm25_index import get_bm25_store
+from config import RetrievalConfig, SearchConfig
+from knowledge_snapshot import KnowledgeRecord, get_knowledge_store
+from resilience import LatencyTracker
+from search_backend import ContextRow, get_search_backend, search_context, similar_knowledge
+from text_normalizer import fold, search_terms
+
+logger = logging.getLogger(__name__)
+
+SOURCES = ('agent', 'faq', 'kb')
+PRIORITY_FALLBACK = 2  # Agent entries used when no ranker finds anything
+
+
+class Passage(NamedTuple):
+    """One context passage; row_id is unique within its source"""
+    source: str
+    row_id: int
+    title: str
+    content: str
+    score: float = 0.0  # Fused RRF score
+    rankers: Tuple[str, ...] = ()  # Rankings that returned the passage
+
+
+class Retrieval(NamedTuple):
+    passages: List[Passage]  # Best first
+    timings: Dict[str, float]  # Seconds per stage, plus 'total'
+
+    def parts(self) -> List[Dict[str, str]]:
+        """Passages as TokenBudget.fit_context parts"""
+        return [{'title': passage.title, 'content': passage.content} for passage in self.passages]
+
+
+def _agent_passage(entry: KnowledgeRecord) -> Passage:
+    return Passage('agent', entry.id, entry.title, entry.content)
+
+
+def _row_passage(row: ContextRow) -> Passage:
+    title = row.title
+    if row.source == 'kb':
+        title = "Документ" if row.title == 'document' else "Веб-сайт"
+    return Passage(row.source, row.row_id, title, row.content)
+
+
+# In-memory rankers: (message, language, agent_type, limit) -> passages, best first
+
+def _agent_keywords(message: str, language: str, agent_type: Optional[str], limit: int) -> List[Passage]:
+    if not agent_type:
+        return []
+    matched = get_knowledge_store().snapshot().match(agent_type, message, language)
+    return [_agent_passage(entry) for _, entry in matched[:limit]]
+
+
+def _agent_lexical(message: str, language: str, agent_type: Optional[str], limit: int) -> List[Passage]:
+    # Agent entries are only in the BM25 index, which is built when it is the search backend
+    if not agent_type or get_search_backend().name != 'bm25':
+        return []
+    terms = search_terms(message)[:SearchConfig.SEARCH_MAX_TERMS]
+    if not terms:
+        return []
+    snapshot = get_knowledge_store().snapshot()
+    hits = get_bm25_store().index().search(terms, limit, sources=('agent',),
+                                           languages=(snapshot.language_key(language),), tag=agent_type)
+    entries = {entry.id: entry for entry in snapshot.get(agent_type, language)}
+    return [_agent_passage(entries[key[1]]) for key, _ in hits if key[1] in entries]
+
+
+# name -> (source, ranker); FAQ and knowledge base rankers run in the database stage
+RANKERS: Dict[str, Tuple[str, Callable[..., List[Passage]]]] = {
+    'agent_keywords': ('agent', _agent_keywords),
+    'agent_lexical': ('agent', _agent_lexical),
+}
+DATABASE_SOURCES = ('faq', 'kb')
+STAGES = tuple(RANKERS) + ('kb_vector', 'database')
+
+
+def fuse(rankings: Dict[str, List[Passage]], k: int, rrf_k: int = 60,
+         weights: Optional[Dict[str, float]] = None) -> List[Passage]:
+    """Reciprocal-rank fusion: a passage scores sum(weight / (rrf_k + rank)) over
+    the rankings that returned it. Rankings of the same row merge; a passage whose
+    normalized text repeats a better one is dropped"""
+    weights = weights or {}
+    fused: Dict[Tuple[str, int], Passage] = {}
+    for name, ranking in rankings.items():
+        weight = weights.get(name, 1.0)
+        for rank, passage in enumerate(ranking, 1):
+            key = (passage.source, passage.row_id)
+            score = weight / (rrf_k + rank)
+            current = fused.get(key)
+            if current is None:
+                fused[key] = passage._replace(score=score, rankers=(name,))
+            elif name not in current.rankers:
+                fused[key] = current._replace(score=current.score + score,
+                                              rankers=current.rankers + (name,))
+
+    # Stable sort: ties keep the ranker order
+    selected = []
+    seen = set()
+    for passage in sorted(fused.values(), key=lambda p: -p.score):
+        text = ' '.join(fold(passage.content or '').split())
+        if not text or text in seen:
+            continue
+        seen.add(text)
+        selected.append(passage)
+        if len(selected) == k:
+            break
+    return selected
+
+
+class HybridRetriever:
+    """Runs the rankers of the requested sources for a message and fuses them.
+
+    Agent knowledge and vectors are searched in memory; the FAQ and knowledge
+    base rankings, with the rows of the vector hits, come from one statement
+    (search_backend.search_context), so a message costs one database round trip."""
+
+    def __init__(self, top_k: int = 3, per_ranker: int = 8, rrf_k: int = 60,
+                 weights: Optional[Dict[str, float]] = None):
+        self.top_k = top_k
+        self.per_ranker = per_ranker
+        self.rrf_k = rrf_k
+        self.weights = dict(weights or {})
+        self._latency = {name: LatencyTracker() for name in STAGES}
+        self._failures = dict.fromkeys(STAGES, 0)
+        self.stats = {'requests': 0, 'empty': 0, 'fallbacks': 0}
+
+    def _run(self, name: str, default, func, *args):
+        """(result, seconds) of one stage; a failing index must not cost the others' results"""
+        started = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception as e:
+            logger.error(f"Retrieval stage {name} failed: {str(e)}")
+            self._failures[name] += 1
+            result = default
+        elapsed = time.perf_counter() - started
+        self._latency[name].record(elapsed)
+        return result, round(elapsed, 6)
+
+    def retrieve(self, message: str, language: str = 'ru', agent_type: Optional[str] = None,
+                 sources: Sequence[str] = SOURCES, k: Optional[int] = None) -> Retrieval:
+        """Top-k deduplicated passages for a message with per-stage timings;
+        agent sources need agent_type. Must be called inside an app context"""
+        started = time.perf_counter()
+        k = k or self.top_k
+        rankings: Dict[str, List[Passage]] = {}
+        timings: Dict[str, float] = {}
+        for name, (source, ranker) in RANKERS.items():
+            if source in sources:
+                rankings[name], timings[name] = self._run(
+                    name, [], ranker, message, language, agent_type, self.per_ranker)
+
+        if any(source in sources for source in DATABASE_SOURCES):
+            vector_hits = []
+            if 'kb' in sources:
+                vector_hits, timings['kb_vector'] = self._run(
+                    'kb_vector', [], similar_knowledge, message, self.per_ranker)
+            rows, timings['database'] = self._run(
+                'database', {}, search_context, message, language, self.per_ranker, sources, vector_hits)
+            for name, ranked in rows.items():
+                rankings[name] = [_row_passage(row) for row in ranked]
+
+        passages = fuse(rankings, k, self.rrf_k, self.weights)
+
+        self.stats['requests'] += 1
+        if not passages and agent_type and 'agent' in sources:
+            # Nothing matched: the agent's top priority entries, as before
+            entries = get_knowledge_store().snapshot().get(agent_type, language)[:PRIORITY_FALLBACK]
+            passages = [_agent_passage(entry)._replace(rankers=('priority',)) for entry in entries]
+            if passages:
+                self.stats['fallbacks'] += 1
+        if not passages:
+            self.stats['empty'] += 1
+        timings['total'] = round(time.perf_counter() - started, 6)
+        return Retrieval(passages, timings)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stages = {}
+        for name, latency in self._latency.items():
+            p50 = latency.percentile(50)
+            p95 = latency.percentile(95)
+            stages[name] = {
+                'failures': self._failures[name],
+                'p50': round(p50, 6) if p50 is not None else None,
+                'p95': round(p95, 6) if p95 is not None else None
+            }
+        return dict(self.stats, top_k=self.top_k, stages=stages)
+
+
+_retriever = HybridRetriever(top_k=RetrievalConfig.TOP_K, per_ranker=RetrievalConfig.PER_RANKER,
+                             rrf_k=RetrievalConfig.RRF_K, weights=RetrievalConfig.RANKER_WEIGHTS)
+
+
+def get_retriever() -> HybridRetriever:
+    return _retriever
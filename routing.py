@@ -0,0 +1,145 @@
+# Маршрутизация сообщений по агентам за один проход (Aho-Corasick)
+# Single-pass multi-pattern keyword router
+
+import logging
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from text_normalizer import normalize_keyword, normalize_phrase
+
+logger = logging.getLogger(__name__)
+
+
+class AhoCorasick:
+    """Multi-pattern substring matcher; each pattern carries a list of payloads"""
+
+    def __init__(self, patterns: Dict[str, List[Any]]):
+        # Node i: transitions, failure link, payloads of patterns ending here
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, Any]]] = [[]]
+        for pattern, payloads in patterns.items():
+            if pattern:
+                self._add(pattern, payloads)
+        self._build()
+
+    def _add(self, pattern: str, payloads: List[Any]):
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[node][char] = next_node
+            node = next_node
+        self._output[node].extend((pattern, payload) for payload in payloads)
+
+    def _build(self):
+        """Breadth-first construction of failure links"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                # Patterns that end at the failure state also end here
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, str, Any]]:
+        """Yield (end position, pattern, payload) for every occurrence"""
+        node = 0
+        goto = self._goto
+        fail = self._fail
+        for position, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for pattern, payload in self._output[node]:
+                yield position, pattern, payload
+
+    def __len__(self):
+        return len(self._goto)
+
+
+def normalize_keywords(keywords) -> Dict[str, float]:
+    """Accept a list of keywords or a {keyword: weight} mapping; keys become
+    word-prefix patterns over normalize_phrase() output"""
+    if isinstance(keywords, dict):
+        items = keywords.items()
+    else:
+        items = ((keyword, 1.0) for keyword in keywords or [])
+    normalized = {}
+    for keyword, weight in items:
+        pattern = normalize_keyword(keyword or '')
+        if pattern:
+            normalized[pattern] = float(weight)
+    return normalized
+
+
+class RoutingEngine:
+    """Scores every agent in one pass over the stemmed message.
+
+    Each agent spec is {'agent_type', 'keywords' (list or weights),
+    'base_confidence', 'match_confidence'}."""
+
+    def __init__(self, specs: Iterable[Dict[str, Any]]):
+        self.specs = list(specs)
+        self.agent_types = [spec['agent_type'] for spec in self.specs]
+        patterns: Dict[str, List[Tuple[int, float]]] = {}
+        for index, spec in enumerate(self.specs):
+            for keyword, weight in normalize_keywords(spec.get('keywords')).items():
+                patterns.setdefault(keyword, []).append((index, weight))
+        self.automaton = AhoCorasick(patterns)
+        self.pattern_count = len(patterns)
+
+    @classmethod
+    def from_agents(cls, agents) -> 'RoutingEngine':
+        return cls(agent.routing_spec() for agent in agents)
+
+    def score(self, message: str) -> Dict[str, Any]:
+        """Per-agent weighted hit scores and confidences for a message"""
+        scores = [0.0] * len(self.specs)
+        hits: List[List[str]] = [[] for _ in self.specs]
+        for _, pattern, (index, weight) in self.automaton.iter_matches(normalize_phrase(message)):
+            scores[index] += weight
+            hits[index].append(pattern.strip())
+
+        confidences = {}
+        for index, spec in enumerate(self.specs):
+            if scores[index] > 0:
+                confidences[spec['agent_type']] = spec.get('match_confidence', 1.0)
+            else:
+                confidences[spec['agent_type']] = spec.get('base_confidence', 0.2)
+        return {
+            'scores': dict(zip(self.agent_types, scores)),
+            'confidences': confidences,
+            'hits': {t: h for t, h in zip(self.agent_types, hits) if h}
+        }
+
+    def rank(self, message: str) -> List[Dict[str, Any]]:
+        """All agents best first: highest confidence, then score, then declaration order"""
+        result = self.score(message)
+        order = sorted(range(len(self.specs)), key=lambda i: (
+            -result['confidences'][self.agent_types[i]],
+            -result['scores'][self.agent_types[i]], i))
+        return [{
+            'agent_type': self.agent_types[i],
+            'confidence': result['confidences'][self.agent_types[i]],
+            'score': result['scores'][self.agent_types[i]],
+            'hits': result['hits'].get(self.agent_types[i], [])
+        } for i in order]
+
+    def route(self, message: str) -> Optional[Dict[str, Any]]:
+        """Best agent plus the full ranking"""
+        if not self.specs:
+            return None
+        ranking = self.rank(message)
+        return dict(ranking[0],
+                    scores={item['agent_type']: item['score'] for item in ranking},
+                    ranking=ranking,
+                    source='keywords')
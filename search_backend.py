@@ -0,0 +1,307 @@
+# Поиск по FAQ и базе знаний: PostgreSQL GIN / SQLite FTS5 / BM25, векторный поиск
+# Ranked full-text search over FAQ questions and knowledge base chunks
+
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, text
+
+from bm25_index import get_bm25_store
+from config import SearchConfig
+from models import db
+from text_normalizer import search_terms
+from vector_index import get_vector_store
+
+logger = logging.getLogger(__name__)
+
+# Indexed text columns per table; FAQ answers are not searched
+FAQ_COLUMNS = {'ru': 'question_ru', 'kz': 'question_kz'}
+FAQ_ANSWERS = {'ru': 'answer_ru', 'kz': 'answer_kz'}
+KNOWLEDGE_COLUMN = 'content_chunk'
+KNOWLEDGE_TITLE = 'source_type'  # Chunks have no title; the passage label depends on the source
+
+
+class ContextRow(NamedTuple):
+    """One candidate of one ranker: a FAQ (question, answer) or a chunk (source_type, text)"""
+    source: str  # 'faq' or 'kb'
+    ranker: str
+    row_id: int
+    title: str
+    content: str
+    score: float  # Higher is better; scales differ between rankers
+
+
+class QueryPart(NamedTuple):
+    """SELECT of one ranker inside the combined context statement. Parameter
+    names start with the ranker; an id lookup carries its ranked {id: score}
+    and expands :{ranker}_ids"""
+    source: str
+    ranker: str
+    sql: str
+    params: Dict[str, Any]
+    ids: Optional[Dict[int, float]] = None
+
+
+def _faq_column(language: str) -> str:
+    return FAQ_COLUMNS.get(language, FAQ_COLUMNS['ru'])
+
+
+def _faq_answer(language: str) -> str:
+    return FAQ_ANSWERS.get(language, FAQ_ANSWERS['ru'])
+
+
+def _columns(source: str, ranker: str, language: str, score: str) -> str:
+    """Select list shared by every part of the UNION"""
+    if source == 'faq':
+        table, title, content = 'faqs', _faq_column(language), _faq_answer(language)
+    else:
+        table, title, content = 'knowledge_base', KNOWLEDGE_TITLE, KNOWLEDGE_COLUMN
+    return (f"'{ranker}' AS ranker, {table}.id AS id, {table}.{title} AS title, "
+            f"{table}.{content} AS content, {score} AS score")
+
+
+def id_lookup(source: str, ranker: str, table: str, language: str, ids: Dict[int, float]) -> QueryPart:
+    """Active rows of ids ranked outside the database (BM25, vectors)"""
+    return QueryPart(source, ranker,
+                     f"SELECT {_columns(source, ranker, language, '0.0')} FROM {table} "
+                     f"WHERE {table}.is_active = :{ranker}_active AND {table}.id IN :{ranker}_ids",
+                     {f'{ranker}_active': True, f'{ranker}_ids': list(ids)}, ids)
+
+
+class LikeSearch:
+    """Unranked substring scan; used for MySQL or when full-text search is unavailable"""
+    name = 'like'
+    max_terms = 3  # Every term is another full scan condition
+
+    def install(self, connection):
+        pass
+
+    def _part(self, source: str, ranker: str, table: str, column: str, language: str,
+              terms: Sequence[str], limit: int) -> QueryPart:
+        terms = terms[:self.max_terms]
+        matches = ' OR '.join(f'LOWER({table}.{column}) LIKE :{ranker}_{i}' for i in range(len(terms)))
+        params = {f'{ranker}_{i}': f'%{term}%' for i, term in enumerate(terms)}
+        params.update({f'{ranker}_active': True, f'{ranker}_limit': limit})
+        return QueryPart(source, ranker,
+                         f"SELECT {_columns(source, ranker, language, '0.0')} FROM {table} "
+                         f"WHERE {table}.is_active = :{ranker}_active AND ({matches}) "
+                         f"ORDER BY {table}.id LIMIT :{ranker}_limit", params)
+
+    def faq_part(self, terms: Sequence[str], language: str, limit: int) -> Optional[QueryPart]:
+        return self._part('faq', 'faq_lexical', 'faqs', _faq_column(language), language, terms, limit)
+
+    def knowledge_part(self, terms: Sequence[str], limit: int) -> Optional[QueryPart]:
+        return self._part('kb', 'kb_lexical', 'knowledge_base', KNOWLEDGE_COLUMN, 'ru', terms, limit)
+
+
+class PostgresSearch(LikeSearch):
+    """Stored generated tsvector columns under GIN indexes.
+
+    The 'simple' configuration only lowercases: the terms are already stems
+    from text_normalizer and are matched as prefixes. PostgreSQL keeps the
+    generated columns current on every insert and update."""
+    name = 'postgresql'
+
+    @staticmethod
+    def _vector_column(column: str) -> str:
+        return f'search_{column}'
+
+    def install(self, connection):
+        for table, columns in (('faqs', FAQ_COLUMNS.values()), ('knowledge_base', (KNOWLEDGE_COLUMN,))):
+            for column in columns:
+                vector = self._vector_column(column)
+                connection.execute(text(
+                    f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {vector} tsvector "
+                    f"GENERATED ALWAYS AS (to_tsvector('simple', translate(coalesce({column}, ''), 'ёЁ', 'еЕ'))) STORED"))
+                connection.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{table}_{vector} ON {table} USING GIN ({vector})"))
+
+    @staticmethod
+    def _query(terms: Sequence[str]) -> str:
+        # Stems are \w+ only, so they cannot inject tsquery operators
+        return ' | '.join(f'{term}:*' for term in terms)
+
+    def _part(self, source: str, ranker: str, table: str, column: str, language: str,
+              terms: Sequence[str], limit: int) -> QueryPart:
+        vector = f'{table}.{self._vector_column(column)}'
+        query = f"to_tsquery('simple', :{ranker}_query)"
+        score = f"CAST(ts_rank({vector}, {query}) AS DOUBLE PRECISION)"
+        return QueryPart(source, ranker,
+                         f"SELECT {_columns(source, ranker, language, score)} "
+                         f"FROM {table} WHERE {table}.is_active AND {vector} @@ {query} "
+                         f"ORDER BY score DESC, {table}.id LIMIT :{ranker}_limit",
+                         {f'{ranker}_query': self._query(terms), f'{ranker}_limit': limit})
+
+
+class SqliteSearch(LikeSearch):
+    """Contentless FTS5 tables kept in sync by triggers.
+
+    FTS5 folds Cyrillic case but not ё, so the triggers index folded copies
+    of the text; contentless tables avoid storing the text a second time."""
+    name = 'sqlite'
+
+    @staticmethod
+    def _fold(expression: str) -> str:
+        return f"replace(replace(coalesce({expression}, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+    def _install_table(self, connection, table: str, columns: Sequence[str]):
+        fts = f'{table}_fts'
+        created = connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': fts}).first() is None
+        column_list = ', '.join(columns)
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({column_list}, content='')"))
+
+        def values(prefix):
+            return ', '.join(self._fold(f'{prefix}.{column}') for column in columns)
+
+        insert = f"INSERT INTO {fts}(rowid, {column_list}) VALUES (new.id, {values('new')});"
+        delete = f"INSERT INTO {fts}({fts}, rowid, {column_list}) VALUES ('delete', old.id, {values('old')});"
+        for name, event, body in (('ai', 'AFTER INSERT', insert),
+                                  ('ad', 'AFTER DELETE', delete),
+                                  ('au', f'AFTER UPDATE OF {column_list}', delete + ' ' + insert)):
+            connection.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {fts}_{name} {event} ON {table} BEGIN {body} END"))
+        if created:
+            connection.execute(text(
+                f"INSERT INTO {fts}(rowid, {column_list}) "
+                f"SELECT id, {', '.join(self._fold(column) for column in columns)} FROM {table}"))
+            logger.info(f"Built full-text index {fts}")
+
+    def install(self, connection):
+        self._install_table(connection, 'faqs', tuple(FAQ_COLUMNS.values()))
+        self._install_table(connection, 'knowledge_base', (KNOWLEDGE_COLUMN,))
+
+    @staticmethod
+    def _query(column: str, terms: Sequence[str]) -> str:
+        # Stems are \w+ only; quoting keeps FTS5 keywords like OR/NOT literal
+        phrases = ' OR '.join('"%s"*' % term for term in terms)
+        return f'{column} : ({phrases})'
+
+    def _part(self, source: str, ranker: str, table: str, column: str, language: str,
+              terms: Sequence[str], limit: int) -> QueryPart:
+        fts = f'{table}_fts'
+        # FTS5 rank is bm25() negated: lower is better
+        return QueryPart(source, ranker,
+                         f"SELECT {_columns(source, ranker, language, f'-{fts}.rank')} FROM {fts} JOIN {table} ON {table}.id = {fts}.rowid "
+                         f"WHERE {fts} MATCH :{ranker}_query AND {table}.is_active = 1 "
+                         f"ORDER BY {fts}.rank, {table}.id LIMIT :{ranker}_limit",
+                         {f'{ranker}_query': self._query(column, terms), f'{ranker}_limit': limit})
+
+
+class BM25Search(LikeSearch):
+    """In-process BM25 index (bm25_index), independent of the database engine;
+    the database only returns the rows of the hits"""
+    name = 'bm25'
+
+    def faq_part(self, terms: Sequence[str], language: str, limit: int) -> Optional[QueryPart]:
+        language = language if language in FAQ_COLUMNS else 'ru'
+        hits = get_bm25_store().index().search(terms, limit, sources=('faq',), languages=(language,))
+        if not hits:
+            return None
+        return id_lookup('faq', 'faq_lexical', 'faqs', language, {key[1]: score for key, score in hits})
+
+    def knowledge_part(self, terms: Sequence[str], limit: int) -> Optional[QueryPart]:
+        hits = get_bm25_store().index().search(terms, limit, sources=('kb',))
+        if not hits:
+            return None
+        return id_lookup('kb', 'kb_lexical', 'knowledge_base', 'ru', {key[1]: score for key, score in hits})
+
+
+BACKENDS = {'postgresql': PostgresSearch, 'sqlite': SqliteSearch}
+
+_backend = LikeSearch()
+
+
+def install_search_indexes(db) -> str:
+    """Pick the search backend per SearchConfig.SEARCH_BACKEND and prepare it:
+    database indexes and triggers, or the BM25 index loaded from disk. The
+    vector index, when enabled, is loaded here as well.
+
+    Idempotent and safe to run from several workers; returns the backend name."""
+    global _backend
+    mode = SearchConfig.SEARCH_BACKEND
+    backend_class = BACKENDS.get(db.engine.dialect.name)
+    if SearchConfig.VECTOR_SEARCH_ENABLED:
+        try:
+            get_vector_store().index()
+        except Exception as e:
+            logger.error(f"Vector index unavailable: {str(e)}")
+
+    if mode in ('auto', 'database') and backend_class is not None:
+        backend = backend_class()
+        try:
+            with db.engine.begin() as connection:
+                backend.install(connection)
+            _backend = backend
+            return _backend.name
+        except Exception as e:
+            # E.g. SQLite without FTS5 or PostgreSQL older than 12
+            logger.error(f"Database full-text search unavailable: {str(e)}")
+
+    if mode in ('auto', 'bm25'):
+        try:
+            get_bm25_store().index()
+            _backend = BM25Search()
+            return _backend.name
+        except Exception as e:
+            logger.error(f"BM25 index unavailable: {str(e)}")
+
+    logger.warning("Knowledge search falls back to ILIKE scans")
+    _backend = LikeSearch()
+    return _backend.name
+
+
+def get_search_backend() -> LikeSearch:
+    return _backend
+
+
+def similar_knowledge(message: str, limit: int = 3) -> List[Tuple[int, float]]:
+    """(chunk id, cosine) closest to the message by embedding; in memory, no query"""
+    store = get_vector_store()
+    if not SearchConfig.VECTOR_SEARCH_ENABLED or not store.available or not message.strip():
+        return []
+    return store.search([message], limit)[0]
+
+
+def search_context(message: str, language: str = 'ru', limit: int = 3,
+                   sources: Sequence[str] = ('faq', 'kb'),
+                   vector_hits: Sequence[Tuple[int, float]] = ()) -> Dict[str, List[ContextRow]]:
+    """Candidates of every database ranker, best first, keyed by ranker: FAQ and
+    knowledge base full-text matches plus the rows of vector hits, fetched by a
+    single UNION ALL statement (one round trip per message)"""
+    terms = search_terms(message)[:SearchConfig.SEARCH_MAX_TERMS]
+    parts = []
+    if terms and 'faq' in sources:
+        parts.append(_backend.faq_part(terms, language, limit))
+    if terms and 'kb' in sources:
+        parts.append(_backend.knowledge_part(terms, limit))
+    if vector_hits and 'kb' in sources:
+        parts.append(id_lookup('kb', 'kb_vector', 'knowledge_base', language, dict(vector_hits)))
+    parts = [part for part in parts if part is not None]
+    if not parts:
+        return {}
+
+    statement = text(' UNION ALL '.join(f'SELECT * FROM ({part.sql}) AS {part.ranker}' for part in parts))
+    expanding = [bindparam(f'{part.ranker}_ids', expanding=True) for part in parts if part.ids is not None]
+    if expanding:
+        statement = statement.bindparams(*expanding)
+    params: Dict[str, Any] = {}
+    for part in parts:
+        params.update(part.params)
+
+    rankings: Dict[str, List[ContextRow]] = {part.ranker: [] for part in parts}
+    sources_by_ranker = {part.ranker: part.source for part in parts}
+    for row in db.session.execute(statement, params):
+        rankings[row.ranker].append(ContextRow(sources_by_ranker[row.ranker], row.ranker, row.id,
+                                               row.title, row.content, float(row.score)))
+    for part in parts:
+        rows = rankings[part.ranker]
+        if part.ids is not None:
+            # Ranked outside the database: restore that order and its scores
+            order = {row_id: position for position, row_id in enumerate(part.ids)}
+            rankings[part.ranker] = [row._replace(score=float(part.ids[row.row_id]))
+                                     for row in sorted(rows, key=lambda row: order[row.row_id])]
+        else:
+            rows.sort(key=lambda row: (-row.score, row.row_id))
+    return rankings
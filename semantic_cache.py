@@ -0,0 +1,205 @@
+# Семантический кэш: повторное использование понравившихся ответов
+# Semantic answer cache built from liked UserQuery answers
+
+import logging
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from config import CacheConfig
+from completion_cache import normalize_message
+from knowledge_events import on_knowledge_change
+
+logger = logging.getLogger(__name__)
+
+NGRAM_SIZE = 3
+MAX_CANDIDATES = 64  # Entries scored per lookup, those sharing the most rare n-grams
+
+
+def char_ngrams(text: str, n: int = NGRAM_SIZE) -> Counter:
+    """Character n-gram counts of a normalized message, words padded with spaces"""
+    grams = Counter()
+    for word in normalize_message(text).split():
+        padded = f" {word} "
+        if len(padded) <= n:
+            grams[padded] += 1
+            continue
+        for i in range(len(padded) - n + 1):
+            grams[padded[i:i + n]] += 1
+    return grams
+
+
+class _Entry(NamedTuple):
+    query_id: int
+    bucket: Tuple[str, str]
+    grams: Counter
+    norm: float
+    answer: str
+
+
+class SemanticCache:
+    """Near-duplicate question lookup over liked answers (cosine on char n-grams)"""
+
+    def __init__(self, threshold: float = 0.85, max_entries: int = 5000,
+                 refresh_interval: float = 300, enabled: bool = True):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.refresh_interval = refresh_interval
+        self.enabled = enabled
+        self._entries: 'OrderedDict[int, _Entry]' = OrderedDict()
+        # (agent_type, language) -> n-gram -> query ids
+        self._postings: Dict[Tuple[str, str], Dict[str, Set[int]]] = {}
+        self._lock = threading.RLock()
+        self._loaded_at: Optional[float] = None
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, agent_type: str, language: str, message: str) -> Optional[Dict[str, Any]]:
+        """Return the best stored answer above the similarity threshold"""
+        if not self.enabled:
+            return None
+        self._ensure_loaded()
+        grams = char_ngrams(message)
+        norm = math.sqrt(sum(c * c for c in grams.values()))
+        if not norm:
+            return None
+
+        with self._lock:
+            postings = self._postings.get((agent_type, language), {})
+            best_entry, best_score = None, 0.0
+            for query_id in self._candidates(postings, grams):
+                entry = self._entries[query_id]
+                dot = sum(count * entry.grams.get(gram, 0) for gram, count in grams.items())
+                score = dot / (norm * entry.norm)
+                if score > best_score:
+                    best_entry, best_score = entry, score
+
+            if best_entry is None or best_score < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return {'response': best_entry.answer, 'query_id': best_entry.query_id,
+                    'similarity': best_score}
+
+    def _candidates(self, postings: Dict[str, Set[int]], grams: Counter) -> List[int]:
+        """Entries that can reach the threshold, most shared n-grams first.
+
+        With cosine >= t an entry shares at least t^2 of the message's distinct
+        n-grams (exact for n-grams that occur once), so it appears in one of the
+        rarest len - ceil(t^2 * len) + 1 of them: common n-grams, whose postings
+        hold most entries, are never scanned"""
+        min_shared = max(1, math.ceil(self.threshold ** 2 * len(grams)))
+        rarest = sorted(grams, key=lambda gram: len(postings.get(gram, ())))
+        shared = Counter()
+        for gram in rarest[:len(rarest) - min_shared + 1]:
+            shared.update(postings.get(gram, ()))
+        return [query_id for query_id, _ in shared.most_common(MAX_CANDIDATES)]
+
+    def add(self, query_id: int, agent_type: str, language: str, message: str, answer: str,
+            fallback: bool = False):
+        """Index a liked answer; canned fallback and load-shedding answers are refused"""
+        if not self.enabled or not answer or not agent_type or fallback:
+            return
+        grams = char_ngrams(message)
+        norm = math.sqrt(sum(c * c for c in grams.values()))
+        if not norm:
+            return
+        bucket = (agent_type, language)
+        with self._lock:
+            self.evict(query_id)
+            self._entries[query_id] = _Entry(query_id, bucket, grams, norm, answer)
+            postings = self._postings.setdefault(bucket, {})
+            for gram in grams:
+                postings.setdefault(gram, set()).add(query_id)
+            while len(self._entries) > self.max_entries:
+                self.evict(next(iter(self._entries)))
+
+    def evict(self, query_id: int):
+        """Remove an answer, e.g. after a dislike"""
+        with self._lock:
+            entry = self._entries.pop(query_id, None)
+            if entry is None:
+                return
+            postings = self._postings.get(entry.bucket, {})
+            for gram in entry.grams:
+                ids = postings.get(gram)
+                if ids is not None:
+                    ids.discard(query_id)
+                    if not ids:
+                        del postings[gram]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._postings.clear()
+            self._loaded_at = None
+
+    def _ensure_loaded(self):
+        now = time.monotonic()
+        if self._loaded_at is not None and now - self._loaded_at < self.refresh_interval:
+            return
+        with self._lock:
+            if self._loaded_at is not None and now - self._loaded_at < self.refresh_interval:
+                return
+            # Mark first so a failing load is not retried on every message
+            self._loaded_at = now
+            try:
+                self._load()
+            except Exception as e:
+                logger.error(f"Error loading semantic cache: {str(e)}")
+
+    def _load(self):
+        """Load liked answers given after the last knowledge change"""
+        from models import UserQuery, FAQ, KnowledgeBase, AgentKnowledgeBase, db
+
+        watermarks = [db.session.query(db.func.max(model.updated_at)).scalar()
+                      for model in (FAQ, KnowledgeBase, AgentKnowledgeBase)]
+        watermarks = [w for w in watermarks if w is not None]
+
+        # A liked answer stops being reused once a reuse of it is disliked
+        disliked_sources = db.session.query(UserQuery.semantic_source_id).filter(
+            UserQuery.user_rating == 'dislike', UserQuery.semantic_source_id.isnot(None))
+        query = UserQuery.query.filter(UserQuery.user_rating == 'like',
+                                       UserQuery.agent_type.isnot(None),
+                                       UserQuery.fallback.isnot(True),
+                                       UserQuery.id.notin_(disliked_sources))
+        if watermarks:
+            query = query.filter(UserQuery.created_at >= max(watermarks))
+        rows = query.order_by(UserQuery.created_at.desc()).limit(self.max_entries).all()
+
+        self._entries.clear()
+        self._postings.clear()
+        for row in reversed(rows):
+            self.add(row.id, row.agent_type, row.language, row.user_message, row.bot_response)
+        logger.info(f"Semantic cache loaded {len(self._entries)} liked answers")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'size': len(self._entries),
+            'threshold': self.threshold,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+_semantic_cache = SemanticCache(threshold=CacheConfig.SEMANTIC_CACHE_THRESHOLD,
+                                max_entries=CacheConfig.SEMANTIC_CACHE_MAX_ENTRIES,
+                                refresh_interval=CacheConfig.SEMANTIC_CACHE_REFRESH_INTERVAL,
+                                enabled=CacheConfig.SEMANTIC_CACHE_ENABLED)
+
+
+def get_semantic_cache() -> SemanticCache:
+    """Get the process-wide semantic answer cache"""
+    return _semantic_cache
+
+
+def _invalidate_on_knowledge_change(tables: Set[str]):
+    # Stored answers may rely on the old knowledge; the next lookup reloads
+    # only likes given after the change
+    _semantic_cache.clear()
+
+
+on_knowledge_change(_invalidate_on_knowledge_change)
@@ -1321,6 +1321,40 @@
                             this.unreadCount++;
                             this.updateUnreadBadge();
                         }
+                        return message;
+                    }
+
+                    // Update text of a bot message while the answer is streaming
+                    updateMessageText(message, text) {
+                        const content = message.querySelector('.message-content');
+                        if (content) {
+                            content.innerHTML = `<strong>QabyldauBot:</strong> ${this.escapeHtml(text)}`;
+                            this.scrollToBottom();
+                        }
+                    }
+
+                    // Parse Server-Sent Events from a fetch response (EventSource cannot POST)
+                    async readEventStream(response, onEvent) {
+                        const reader = response.body.getReader();
+                        const decoder = new TextDecoder('utf-8');
+                        let buffer = '';
+                        while (true) {
+                            const { value, done } = await reader.read();
+                            if (done) break;
+                            buffer += decoder.decode(value, { stream: true });
+                            let boundary;
+                            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                                const rawEvent = buffer.slice(0, boundary);
+                                buffer = buffer.slice(boundary + 2);
+                                let event = 'message';
+                                const dataLines = [];
+                                rawEvent.split('\n').forEach(line => {
+                                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                                    else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+                                });
+                                if (dataLines.length) onEvent(event, JSON.parse(dataLines.join('\n')));
+                            }
+                        }
                     }
 
                     escapeHtml(text) {
@@ -1437,9 +1471,9 @@
                         this.suggestRelevantReplies(text);
                         try {
                             this.showTyping();
-                            const response = await fetch(`${WIDGET_CONFIG.apiEndpoint}/api/chat`, {
+                            const response = await fetch(`${WIDGET_CONFIG.apiEndpoint}/api/chat/stream`, {
                                 method: 'POST',
-                                headers: { 'Content-Type': 'application/json', },
+                                headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
                                 body: JSON.stringify({ message: text, language: this.language, agent_type: 'communication' })
                             });
                             if (!response.ok) {
@@ -1450,9 +1484,30 @@
                                 this.showErrorAlert('Ошибка сети', errText);
                                 return;
                             }
-                            const data = await response.json();
+                            // Render tokens as they arrive instead of waiting for the full answer
+                            let botMessage = null;
+                            let fullText = '';
+                            let streamError = null;
+                            let data = {};
+                            await this.readEventStream(response, (event, eventData) => {
+                                if (event === 'error') {
+                                    streamError = eventData.error;
+                                } else if (event === 'done') {
+                                    data = eventData;
+                                } else if (eventData.token) {
+                                    fullText += eventData.token;
+                                    if (!botMessage) {
+                                        this.hideTyping();
+                                        botMessage = this.addMessage('bot', fullText, false);
+                                    } else {
+                                        this.updateMessageText(botMessage, fullText);
+                                    }
+                                }
+                            });
                             this.hideTyping();
-                            this.addMessage('bot', data.response || 'Извините, произошла ошибка. Попробуйте позже.', false);
+                            if (!botMessage) {
+                                this.addMessage('bot', streamError || 'Извините, произошла ошибка. Попробуйте позже.', false);
+                            }
                             if (data.quickReplies && data.quickReplies.length > 0) {
                                 QUICK_REPLIES_DATA.results = data.quickReplies.map(text => ({
                                     text,
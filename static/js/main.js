@@ -1,7 +1,8 @@
 import { BOT_AVATAR, TYPING_INDICATOR, SUGGESTIONS, MODEL_OPTIONS } from './moduls/constants.js';
 import { saveHistory, loadHistory } from './moduls/storage.js';
 import { setupModelSelector } from './moduls/modelSelector.js';
-import { renderAllMessages, appendMessage, renderMessage, typeBotMessage, renderSuggestions, removeTyping, initRatingHandler } from './moduls/render.js';
+import { renderAllMessages, appendMessage, renderMessage, typeBotMessage, renderSuggestions, removeTyping, initRatingHandler, updateTypingText } from './moduls/render.js';
+import { streamChat } from './moduls/stream.js';
 import { setupVoiceInput } from './moduls/voice.js';
 import { setupBotStatus } from './moduls/botStatus.js';
 
@@ -102,16 +103,13 @@ document.addEventListener('DOMContentLoaded', function () {
         agent_type: currentModel,
         language: currentLang,
       };
-      const resp = await fetch('/api/chat', {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify(payload),
+      // Токены ответа рисуются в typing bubble по мере поступления
+      const data = await streamChat(payload, {
+        onToken: text => updateTypingText(text, chatHistory),
       });
-      const data = await resp.json();
-
-      removeTyping(chatHistory);
 
       if (data.error) {
+        removeTyping(chatHistory);
         appendMessage(
           { text: data.error, who: "bot", error: true }, 
           messages, 
@@ -120,7 +118,7 @@ document.addEventListener('DOMContentLoaded', function () {
         );
       } else {
         await typeBotMessage(
-          data.response || "", 
+          data.text || "", 
           { who: "bot", id: data.query_id }, 
           messages, 
           chatHistory
@@ -103,6 +103,17 @@ function replaceTypingWithAnswer(msg, chatHistory, renderMessage) {
   }
 }
 
+// Показать частичный ответ в typing bubble, пока идёт стриминг
+export function updateTypingText(text, chatHistory) {
+  const bubble = chatHistory.querySelector('.chat-bubble.bubble-bot[data-typing="true"]');
+  if (!bubble) return;
+  const content = bubble.querySelector('.message-content');
+  if (content) {
+    content.innerHTML = renderFormattedText(text);
+    scrollDown(chatHistory, false);
+  }
+}
+
 // Рендер всех сообщений
 export function renderAllMessages(messages, chatHistory, renderMessage, renderSuggestions) {
   chatHistory.innerHTML = '';
@@ -0,0 +1,61 @@
+// stream.js
+
+// Разбор Server-Sent Events из потока fetch (EventSource не поддерживает POST)
+async function readEventStream(response, onEvent) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder('utf-8');
+  let buffer = '';
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let event = 'message';
+      const dataLines = [];
+      rawEvent.split('\n').forEach(line => {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+      });
+      if (dataLines.length) onEvent(event, JSON.parse(dataLines.join('\n')));
+    }
+  }
+}
+
+// Отправка сообщения в /api/chat/stream; onToken вызывается с накопленным текстом
+export async function streamChat(payload, { onMeta, onToken } = {}) {
+  const resp = await fetch('/api/chat/stream', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+    body: JSON.stringify(payload),
+  });
+
+  if (!resp.ok || !resp.body) {
+    let error = 'Ошибка соединения. Попробуйте ещё раз.';
+    try {
+      const data = await resp.json();
+      error = data.error || error;
+    } catch {}
+    return { error };
+  }
+
+  const result = { text: '', query_id: null, error: null };
+  await readEventStream(resp, (event, data) => {
+    if (event === 'meta' && onMeta) {
+      onMeta(data);
+    } else if (event === 'error') {
+      result.error = data.error;
+    } else if (event === 'done') {
+      result.query_id = data.query_id;
+    } else if (data.token) {
+      result.text += data.token;
+      if (onToken) onToken(result.text);
+    }
+  });
+  return result;
+}
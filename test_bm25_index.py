@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BM25-индекс: журнал изменений и его воспроизведение после перезапуска
+BM25 store: journaled changes replayed after a restart
+"""
+
+import pytest
+from flask import Flask
+
+from bm25_index import BM25Index, BM25Store
+from models import KnowledgeBase, db
+from text_normalizer import search_terms
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'bm25.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            KnowledgeBase(source_type='manual', content_chunk='Общежитие предоставляется иногородним студентам.'),
+            KnowledgeBase(source_type='manual', content_chunk='Приём документов начинается двадцатого июня.'),
+        ])
+        db.session.commit()
+        yield app
+
+
+def _store(tmp_path, checkpoint_rows: int = 100) -> BM25Store:
+    return BM25Store(path=str(tmp_path / 'bm25.bin'), refresh_interval=3600,
+                     checkpoint_rows=checkpoint_rows)
+
+
+def _ingest(store: BM25Store, removed_id: int, text: str) -> int:
+    """What document_processor does: commit the rows, then apply them to the index"""
+    db.session.delete(db.session.get(KnowledgeBase, removed_id))
+    row = KnowledgeBase(source_type='document', content_chunk=text)
+    db.session.add(row)
+    db.session.commit()
+    store.apply('kb', [removed_id], [(row.id, [('any', text)])])
+    return row.id
+
+
+def _kb_hits(index: BM25Index, text: str):
+    return [row_id for (_, row_id, _), _ in index.search(search_terms(text), sources=('kb',))]
+
+
+def test_apply_is_journaled_and_replayed_after_a_restart(app, tmp_path):
+    store = _store(tmp_path)
+    store.index()
+    assert store.stats['saves'] == 1
+    added_id = _ingest(store, 1, 'Стипендия выплачивается ежемесячно.')
+    assert store.stats['saves'] == 1  # The file was not rewritten
+    assert store.get_stats()['journal_rows'] == 2
+
+    # The saved file plus the journal, without the database sync
+    restarted = _store(tmp_path)
+    index = BM25Index.load(restarted.path)
+    restarted._replay(index)
+    assert restarted.stats['journal_replayed'] == 2
+    assert _kb_hits(index, 'стипендия') == [added_id]
+    assert _kb_hits(index, 'общежитие') == []
+
+    # A full restart loads, replays and syncs without rewriting the file
+    restarted = _store(tmp_path)
+    index = restarted.index()
+    assert restarted.stats['journal_replayed'] == 2
+    assert restarted.stats['saves'] == 0
+    assert _kb_hits(index, 'стипендия') == [added_id]
+    assert _kb_hits(index, 'общежитие') == []
+
+
+def test_checkpoint_rewrites_the_file_and_empties_the_journal(app, tmp_path):
+    store = _store(tmp_path, checkpoint_rows=2)
+    store.index()
+    added_id = _ingest(store, 1, 'Стипендия выплачивается ежемесячно.')
+    assert store.stats['saves'] == 2
+    assert store.get_stats()['journal_rows'] == 0
+
+    restarted = _store(tmp_path, checkpoint_rows=2)
+    index = restarted.index()
+    assert restarted.stats['journal_replayed'] == 0
+    assert _kb_hits(index, 'стипендия') == [added_id]
+
+
+def test_records_of_another_generation_and_a_torn_tail_are_skipped(app, tmp_path):
+    store = _store(tmp_path)
+    store.index()
+    _ingest(store, 1, 'Стипендия выплачивается ежемесячно.')
+    with open(store.journal.path, 'a', encoding='utf-8') as f:
+        f.write('{"generation": "other", "source": "kb", "removed": [2], "added": [], "rows": 1}\n')
+        f.write('{"generation": "torn')
+
+    restarted = _store(tmp_path)
+    index = BM25Index.load(restarted.path)
+    restarted._replay(index)
+    assert restarted.stats['journal_replayed'] == 2
+    assert _kb_hits(index, 'документов') == [2]
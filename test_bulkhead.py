@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Изоляция агентов: сброс нагрузки, ожидание в очереди, освобождение слотов
+Bulkheads: load shedding, queue timeout and slot release
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from bulkhead import Bulkhead, BulkheadGroup, BulkheadRejected
+
+
+def _wait_for(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.001)
+
+
+def test_slot_is_released_when_the_call_fails():
+    group = BulkheadGroup(4)
+    bulkhead = Bulkhead('test', max_concurrency=1, group=group)
+    with pytest.raises(ValueError):
+        with bulkhead.slot():
+            assert bulkhead.get_stats()['in_flight'] == 1
+            raise ValueError()
+    assert bulkhead.get_stats()['in_flight'] == 0
+    assert group.get_stats()['busy'] == 0
+    with bulkhead.slot():
+        pass
+
+
+def test_waiting_request_gets_the_released_slot():
+    bulkhead = Bulkhead('test', max_concurrency=1, queue_timeout=2)
+    bulkhead.acquire()
+    admitted = threading.Event()
+
+    def waiter():
+        with bulkhead.slot():
+            admitted.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    _wait_for(lambda: bulkhead.get_stats()['queued'] == 1)
+    assert not admitted.is_set()
+    bulkhead.release()
+    thread.join()
+    assert admitted.is_set()
+    assert bulkhead.get_stats()['in_flight'] == 0
+
+
+def test_queue_timeout_rejects_and_frees_the_queue_place():
+    group = BulkheadGroup(4)
+    bulkhead = Bulkhead('test', max_concurrency=1, queue_timeout=0.05, group=group)
+    with bulkhead.slot():
+        with pytest.raises(BulkheadRejected, match='timed out'):
+            bulkhead.acquire()
+        stats = bulkhead.get_stats()
+        assert stats['timed_out'] == 1
+        assert stats['queued'] == 0
+        assert group.get_stats()['busy'] == 1
+    assert group.get_stats()['busy'] == 0
+
+
+def test_full_queue_is_rejected_at_once():
+    bulkhead = Bulkhead('test', max_concurrency=1, max_queue=0, queue_timeout=5)
+    with bulkhead.slot():
+        started = time.monotonic()
+        with pytest.raises(BulkheadRejected, match='queue is full'):
+            bulkhead.acquire()
+        assert time.monotonic() - started < 0.5
+    assert bulkhead.get_stats()['rejected_queue_full'] == 1
+
+
+def test_low_priority_agent_sheds_first():
+    group = BulkheadGroup(4)
+    high = Bulkhead('high', max_concurrency=1, queue_timeout=0.05, shed_utilization=1.0, group=group)
+    low = Bulkhead('low', max_concurrency=1, queue_timeout=0.05, shed_utilization=0.5, group=group)
+    high.acquire()
+    low.acquire()  # Group half busy: both agents are full
+    # The low-priority agent refuses to queue, the high-priority one still waits
+    with pytest.raises(BulkheadRejected, match='shedding'):
+        low.acquire()
+    with pytest.raises(BulkheadRejected, match='timed out'):
+        high.acquire()
+    assert low.get_stats()['shed'] == 1
+    assert high.get_stats()['shed'] == 0
+    high.release()
+    low.release()
+    assert group.get_stats()['busy'] == 0
+
+
+def test_cancelled_async_wait_frees_the_queue_place():
+    group = BulkheadGroup(4)
+    bulkhead = Bulkhead('test', max_concurrency=1, queue_timeout=5, group=group)
+
+    async def main():
+        async with bulkhead.aslot():
+            waiter = asyncio.ensure_future(bulkhead.acquire_async())
+            await asyncio.sleep(0.02)
+            assert bulkhead.get_stats()['queued'] == 1
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+
+    asyncio.run(main())
+    stats = bulkhead.get_stats()
+    assert stats['queued'] == 0
+    assert stats['in_flight'] == 0
+    assert group.get_stats()['busy'] == 0
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Число обращений к базе данных на одно сообщение чата
+Database round trips per /api/chat message
+"""
+
+import pytest
+
+# Context query, INSERT of the user query, COMMIT
+CHAT_ROUND_TRIPS = 3
+
+
+def _reset_caches(registry):
+    """Process-wide caches outlive the app; drop what they hold from another database"""
+    from completion_cache import get_completion_cache
+    from knowledge_snapshot import get_knowledge_store
+    from semantic_cache import get_semantic_cache
+
+    get_knowledge_store().invalidate()
+    get_semantic_cache().clear()
+    get_completion_cache().clear()
+    registry.invalidate()
+
+
+def _seed(db):
+    from models import AdminUser, AgentKnowledgeBase, AgentType, KnowledgeBase
+
+    admin = AdminUser(username='admin', email='admin@example.com', password_hash='-')
+    db.session.add(admin)
+    db.session.add_all([
+        AgentType(type_code='admission', name_ru='Приёмная комиссия', name_kz='Қабылдау комиссиясы',
+                  keywords='поступление, документы, приём', priority=1),
+        AgentType(type_code='uniroom', name_ru='Общежитие', name_kz='Жатақхана',
+                  keywords='общежитие, заселение, проживание', priority=2),
+    ])
+    db.session.flush()
+    db.session.add_all([
+        AgentKnowledgeBase(agent_type='uniroom', title='Заселение в общежитие',
+                           content_ru='Для заселения в общежитие подайте заявление в студенческом портале.',
+                           content_kz='Жатақханаға орналасу үшін студенттік порталда өтініш беріңіз.',
+                           keywords='общежитие, заселение', created_by=admin.id),
+        KnowledgeBase(source_type='manual',
+                      content_chunk='Проживание в общежитии стоит от 3 000 до 15 000 тенге в месяц.'),
+        KnowledgeBase(source_type='manual',
+                      content_chunk='Приём документов начинается 20 июня и длится до 25 августа.'),
+    ])
+    db.session.commit()
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # Before app.py is first imported: its module-level app must not open the default database either
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'chat.db'}")
+    from app import create_app
+    from knowledge_snapshot import get_knowledge_store
+    from mistral_client import MistralClient
+    from models import db
+    from semantic_cache import get_semantic_cache
+    from views import initialize_agent_router
+
+    def complete(self, user_message, context="", language="ru", system_prompt=None, **kwargs):
+        return {'response': 'Ответ', 'cache_hit': False, 'fallback': False}
+
+    monkeypatch.setattr(MistralClient, 'complete', complete)
+    app = create_app()
+    with app.app_context():
+        _seed(db)
+        registry = initialize_agent_router().registry
+        _reset_caches(registry)
+    # Periodic freshness checks would add a query to whichever request hits them
+    for holder in (get_knowledge_store(), get_semantic_cache(), registry):
+        monkeypatch.setattr(holder, 'refresh_interval', 3600)
+    yield app
+    _reset_caches(registry)
+
+
+def _chat(client, message):
+    response = client.post('/api/chat', json={'message': message, 'language': 'ru'})
+    assert response.status_code == 200
+    assert response.get_json()['success']
+    return int(response.headers['X-DB-Round-Trips'])
+
+
+def test_chat_round_trips(app):
+    client = app.test_client()
+    _chat(client, 'Как заселиться в общежитие?')  # Loads the snapshots and caches
+    assert _chat(client, 'Сколько стоит проживание в общежитии?') == CHAT_ROUND_TRIPS
+    assert _chat(client, 'Когда начинается приём документов?') == CHAT_ROUND_TRIPS
+
+
+def test_context_is_one_statement(app):
+    import db_round_trips
+    from retrieval import get_retriever
+
+    with app.app_context():
+        get_retriever().retrieve('Как заселиться в общежитие?', 'ru', agent_type='uniroom')
+        with db_round_trips.track() as trips:
+            result = get_retriever().retrieve('Сколько стоит проживание в общежитии?', 'ru', agent_type='uniroom')
+    assert trips.count == 1, trips.statements
+    assert {passage.source for passage in result.passages} == {'agent', 'kb'}
+
+
+def test_chat_without_agents_serves_the_fallback(app, monkeypatch):
+    from agents import AgentRouter
+
+    monkeypatch.setattr(AgentRouter, 'route', lambda self, message, language='ru', history=None: (None, None))
+    response = app.test_client().post('/api/chat', json={'message': 'Привет', 'language': 'kz'})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['success']
+    assert data['response'].startswith('**Кешіріңіз')
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Параллельный опрос агентов: стратегии 'fastest' и крайний срок
+Agent fan-out: 'fastest' strategy, deadline and abandoned losers
+"""
+
+import time
+
+import pytest
+from flask import Flask
+
+import mistral_client
+from config import FanoutConfig, ResilienceConfig
+from fanout import fan_out
+from rate_limiter import ProviderLimiter
+from resilience import CallAbandoned, CircuitBreaker
+
+PAYLOAD = {'messages': [{'role': 'user', 'content': 'Привет'}], 'max_tokens': 10}
+
+
+class CountingTransport:
+    def __init__(self):
+        self.posts = 0
+
+    def post(self, url, headers=None, json=None, **kwargs):
+        self.posts += 1
+        raise AssertionError("a losing fan-out call reached the provider")
+
+
+class SlowAgent:
+    """Answers after delay seconds, then asks the provider if it still has to"""
+
+    def __init__(self, agent_type: str, delay: float, ask_provider: bool = False):
+        self.agent_type = agent_type
+        self.name = agent_type
+        self.delay = delay
+        self.ask_provider = ask_provider
+        self.abandoned = False
+        self.mistral = mistral_client.MistralClient()
+        self.mistral.transport = CountingTransport()
+
+    def process_message(self, message, language, confidence, history):
+        time.sleep(self.delay)
+        if self.ask_provider:
+            try:
+                self.mistral._post_completion(PAYLOAD)
+            except CallAbandoned:
+                self.abandoned = True
+        return {'response': f'{self.agent_type}: {message}', 'confidence': confidence,
+                'agent_type': self.agent_type, 'agent_name': self.name,
+                'context_used': True, 'fallback': False}
+
+
+@pytest.fixture(autouse=True)
+def provider(monkeypatch):
+    monkeypatch.setattr(mistral_client, '_breaker', CircuitBreaker())
+    monkeypatch.setattr(mistral_client, '_limiter', ProviderLimiter(max_concurrency=4))
+    monkeypatch.setattr(ResilienceConfig, 'HEDGING_ENABLED', False)
+    with Flask(__name__).app_context():
+        yield
+
+
+def test_fastest_returns_the_first_acceptable_answer(monkeypatch):
+    monkeypatch.setattr(FanoutConfig, 'STRATEGY', 'fastest')
+    monkeypatch.setattr(FanoutConfig, 'DEADLINE', 5)
+    fast, slow = SlowAgent('fast', 0.01), SlowAgent('slow', 0.3, ask_provider=True)
+
+    started = time.monotonic()
+    result = fan_out([(slow, 0.9), (fast, 0.85)], 'вопрос')
+    assert result['agent_type'] == 'fast'
+    assert result['fanout'] == ['slow', 'fast']
+    assert time.monotonic() - started < 0.25
+
+    time.sleep(0.4)  # The loser wakes up after the winner was chosen
+    assert slow.abandoned
+    assert slow.mistral.transport.posts == 0
+    assert mistral_client.get_limiter().get_stats()['in_flight'] == 0
+
+
+def test_deadline_serves_the_fallback_and_abandons_running_calls(monkeypatch):
+    monkeypatch.setattr(FanoutConfig, 'STRATEGY', 'score')
+    monkeypatch.setattr(FanoutConfig, 'DEADLINE', 0.05)
+    agents = [SlowAgent('first', 0.2, ask_provider=True), SlowAgent('second', 0.2, ask_provider=True)]
+
+    started = time.monotonic()
+    result = fan_out([(agents[0], 0.9), (agents[1], 0.85)], 'вопрос')
+    assert time.monotonic() - started < 0.15
+    assert result['fallback']
+    assert result['agent_type'] == 'first'
+
+    time.sleep(0.3)
+    assert all(agent.abandoned for agent in agents)
+    assert sum(agent.mistral.transport.posts for agent in agents) == 0
+
+
+def test_score_waits_for_all_and_picks_the_best(monkeypatch):
+    monkeypatch.setattr(FanoutConfig, 'STRATEGY', 'score')
+    monkeypatch.setattr(FanoutConfig, 'DEADLINE', 5)
+    result = fan_out([(SlowAgent('first', 0.05), 0.5), (SlowAgent('second', 0.01), 0.9)], 'вопрос')
+    assert result['agent_type'] == 'second'  # Higher routing confidence, same overlap
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ограничитель запросов к LLM: порядок очереди, токены, отказы
+Provider limiter: FIFO admission, token reservations and rejections
+"""
+
+import threading
+import time
+
+import pytest
+
+from rate_limiter import LimiterRejected, ProviderLimiter
+
+
+def _wait_for(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.001)
+
+
+def test_waiting_requests_are_admitted_in_arrival_order():
+    limiter = ProviderLimiter(rps=1000, burst=1000, max_concurrency=1)
+    held = limiter.acquire()
+    order = []
+
+    def request(number):
+        permit = limiter.acquire()
+        order.append(number)
+        limiter.release(permit, 0)
+
+    threads = []
+    for number in range(5):
+        thread = threading.Thread(target=request, args=(number,))
+        thread.start()
+        threads.append(thread)
+        _wait_for(lambda: limiter.get_stats()['queue_depth'] == number + 1)
+
+    limiter.release(held, 0)
+    for thread in threads:
+        thread.join()
+    assert order == [0, 1, 2, 3, 4]
+    assert limiter.get_stats()['in_flight'] == 0
+
+
+def test_large_request_at_the_head_is_not_overtaken():
+    # 60 tokens per minute: one token per second, a full bucket of 60
+    limiter = ProviderLimiter(rps=1000, burst=1000, tokens_per_minute=60, max_concurrency=4)
+    limiter.release(limiter.acquire(55), None)  # 5 tokens left
+    order = []
+
+    def request(number, tokens, timeout):
+        try:
+            limiter.release(limiter.acquire(tokens, timeout=timeout), 0)
+            order.append(number)
+        except LimiterRejected:
+            order.append(f'{number} rejected')
+
+    large = threading.Thread(target=request, args=(0, 30, 0.5))
+    large.start()
+    _wait_for(lambda: limiter.get_stats()['queue_depth'] == 1)
+    small = threading.Thread(target=request, args=(1, 1, 0.1))
+    small.start()
+    small.join()
+    # The small one fits the bucket but waits behind the large one
+    assert order == ['1 rejected']
+    assert limiter.get_stats()['queue_depth'] == 1
+    large.join()
+    assert order == ['1 rejected', '0 rejected']
+    assert limiter.get_stats()['queue_depth'] == 0
+
+
+def test_unused_reserved_tokens_are_refunded():
+    limiter = ProviderLimiter(tokens_per_minute=6000, max_concurrency=4)
+    permit = limiter.acquire(5000)
+    assert limiter.get_stats()['tokens_available'] <= 1010
+    limiter.release(permit, used_tokens=1000)
+    assert 4990 <= limiter.get_stats()['tokens_available'] <= 5020
+
+
+def test_tokens_used_beyond_the_reservation_are_charged():
+    limiter = ProviderLimiter(tokens_per_minute=6000, max_concurrency=4)
+    limiter.release(limiter.acquire(1000), used_tokens=3000)
+    assert limiter.get_stats()['tokens_available'] <= 3010
+
+
+def test_unknown_usage_keeps_the_reservation():
+    limiter = ProviderLimiter(tokens_per_minute=6000, max_concurrency=4)
+    limiter.release(limiter.acquire(2000), used_tokens=None)
+    assert limiter.get_stats()['tokens_available'] <= 4010
+
+
+def test_queue_timeout_and_full_queue_are_rejected():
+    limiter = ProviderLimiter(max_concurrency=1, max_queue=1)
+    held = limiter.acquire()
+
+    waiter = threading.Thread(target=lambda: pytest.raises(LimiterRejected, limiter.acquire, timeout=0.2))
+    waiter.start()
+    _wait_for(lambda: limiter.get_stats()['queue_depth'] == 1)
+    with pytest.raises(LimiterRejected):
+        limiter.acquire(timeout=0.2)
+    waiter.join()
+
+    stats = limiter.get_stats()
+    assert stats['rejected_queue_full'] == 1
+    assert stats['timed_out'] == 1
+    assert stats['queue_depth'] == 0
+    limiter.release(held, 0)
+    assert limiter.get_stats()['in_flight'] == 0
+
+
+def test_try_acquire_never_jumps_the_queue():
+    limiter = ProviderLimiter(max_concurrency=1)
+    held = limiter.try_acquire()
+    with pytest.raises(LimiterRejected):
+        limiter.try_acquire()  # No free slot
+    limiter.release(held, 0)
+    assert limiter.get_stats()['in_flight'] == 0
+    limiter.release(limiter.try_acquire(), 0)
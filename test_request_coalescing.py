@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Объединение одинаковых одновременных запросов (single-flight)
+Request coalescing: shared results and cancellation
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from request_coalescing import AsyncSingleFlight, SingleFlight
+from resilience import CallAbandoned
+
+
+def test_followers_share_the_leaders_result():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'answer'
+
+    async def main():
+        return await asyncio.gather(*(flight.do('key', fn) for _ in range(3)))
+
+    results = asyncio.run(main())
+    assert results == [('answer', False), ('answer', True), ('answer', True)]
+    assert len(calls) == 1
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'answer'
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do('key', fn))
+        await asyncio.sleep(0)
+        followers = [asyncio.ensure_future(flight.do('key', fn)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await asyncio.gather(*followers)
+
+    results = asyncio.run(main())
+    # The first follower makes the call again, the other one shares it
+    assert results == [('answer', False), ('answer', True)]
+    assert len(calls) == 2
+    assert flight.get_stats()['in_flight'] == 0
+
+
+def test_cancelled_follower_does_not_cancel_the_leader():
+    flight = AsyncSingleFlight()
+
+    async def fn():
+        await asyncio.sleep(0.02)
+        return 'answer'
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do('key', fn))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do('key', fn))
+        await asyncio.sleep(0.005)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader
+
+    assert asyncio.run(main()) == ('answer', False)
+
+
+def test_follower_retries_when_the_leaders_caller_gave_up():
+    flight = SingleFlight(retry_errors=(CallAbandoned,))
+    leader_waits = threading.Event()
+
+    def abandoned():
+        leader_waits.wait()
+        raise CallAbandoned()
+
+    def answer():
+        return 'answer'
+
+    results = {}
+    leader = threading.Thread(target=lambda: results.setdefault('leader', _catch(flight, abandoned)))
+    leader.start()
+    time.sleep(0.01)
+    follower = threading.Thread(target=lambda: results.setdefault('follower', flight.do('key', answer)))
+    follower.start()
+    time.sleep(0.01)
+    leader_waits.set()
+    leader.join()
+    follower.join()
+    assert isinstance(results['leader'], CallAbandoned)
+    assert results['follower'] == ('answer', False)
+
+
+def _catch(flight, fn):
+    try:
+        return flight.do('key', fn)
+    except CallAbandoned as e:
+        return e
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Circuit breaker: переходы состояний и прерванные пробные запросы
+Circuit breaker state transitions and interrupted probes
+"""
+
+import asyncio
+import time
+
+import pytest
+
+import mistral_client
+from config import ResilienceConfig
+from rate_limiter import ProviderLimiter
+from resilience import CircuitBreaker
+
+PAYLOAD = {'messages': [{'role': 'user', 'content': 'Привет'}], 'max_tokens': 10}
+
+
+def _open_breaker(**kwargs) -> CircuitBreaker:
+    breaker = CircuitBreaker(min_requests=2, error_rate_threshold=0.5, open_seconds=0, **kwargs)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def test_breaker_stays_closed_below_min_requests():
+    breaker = CircuitBreaker(min_requests=3, error_rate_threshold=0.5)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.get_stats()['trips'] == 1
+
+
+def test_breaker_trips_on_slow_calls():
+    breaker = CircuitBreaker(min_requests=2, slow_call_threshold=1.0, slow_rate_threshold=0.5)
+    breaker.record_success(0.1)
+    breaker.record_success(2.0)
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_open_breaker_rejects_until_one_probe_is_let_through():
+    breaker = _open_breaker()
+    breaker.open_seconds = 0.05
+    assert not breaker.allow_request()
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()  # The probe
+    assert not breaker.allow_request()
+    assert breaker.get_stats()['rejected'] == 2
+
+
+def test_successful_probe_closes_the_breaker():
+    breaker = _open_breaker()
+    assert breaker.allow_request()
+    breaker.record_success(0.1)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+    assert breaker.allow_request()
+
+
+def test_failed_or_slow_probe_opens_it_again():
+    for record in (lambda b: b.record_failure(), lambda b: b.record_success(60.0)):
+        breaker = _open_breaker(slow_call_threshold=10.0)
+        assert breaker.allow_request()
+        record(breaker)
+        assert breaker.get_stats()['trips'] == 2
+        assert breaker.allow_request()  # open_seconds=0: half-open again, next probe
+
+
+def test_abandoned_probe_lets_the_next_call_probe():
+    breaker = _open_breaker()
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.abandon_probe()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow_request()
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    """Fresh process-wide breaker and limiter, no hedging"""
+    breaker = _open_breaker()
+    monkeypatch.setattr(mistral_client, '_breaker', breaker)
+    monkeypatch.setattr(mistral_client, '_limiter', ProviderLimiter(max_concurrency=4))
+    monkeypatch.setattr(ResilienceConfig, 'HEDGING_ENABLED', False)
+    monkeypatch.setattr(ResilienceConfig, 'RETRY_MAX_ATTEMPTS', 0)
+    return breaker
+
+
+def test_cancelled_async_probe_does_not_wedge_the_breaker(provider):
+    class HangingTransport:
+        async def post(self, url, headers=None, json=None):
+            await asyncio.sleep(10)
+
+    client = mistral_client.AsyncMistralClient()
+    client.async_transport = HangingTransport()
+
+    async def main():
+        probe = asyncio.ensure_future(client._apost_completion(PAYLOAD))
+        await asyncio.sleep(0.01)
+        assert provider.state == CircuitBreaker.HALF_OPEN
+        assert not provider.allow_request()  # The probe is in flight
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(main())
+    assert provider.allow_request()
+    assert mistral_client.get_limiter().get_stats()['in_flight'] == 0
+
+
+def test_interrupted_sync_probe_does_not_wedge_the_breaker(provider):
+    class Interrupted(BaseException):
+        pass
+
+    class InterruptedTransport:
+        def post(self, url, headers=None, json=None, **kwargs):
+            raise Interrupted()
+
+    client = mistral_client.MistralClient()
+    client.transport = InterruptedTransport()
+    with pytest.raises(Interrupted):
+        client._post_completion(PAYLOAD)
+    assert provider.allow_request()
+    assert mistral_client.get_limiter().get_stats()['in_flight'] == 0
@@ -0,0 +1,142 @@
+# Нормализация русского и казахского текста для маршрутизации и поиска
+# Case folding, tokenization and light suffix stripping for ru/kz text
+
+import re
+from functools import lru_cache
+from typing import Iterable, List, Tuple
+
+STEM_CACHE_SIZE = 65536
+MIN_STEM_LENGTH = 4  # Russian: 'приём' must not become 'при'
+MIN_KAZAKH_STEM_LENGTH = 3  # Kazakh roots are short: 'жұмыс', 'кадр'
+
+_word_re = re.compile(r'\w+', re.UNICODE)
+
+# Буквы, которых нет в русском алфавите
+KAZAKH_LETTERS = frozenset('әғқңөұүһі')
+
+# Окончания: только словоизменение, без словообразования, длинные первыми
+RUSSIAN_SUFFIXES = tuple(sorted({
+    # Nouns
+    'иями', 'ями', 'ами', 'иях', 'иям', 'ием', 'ией', 'ях', 'ам', 'ям', 'ах', 'ов', 'ев',
+    'ом', 'ем', 'ей', 'ой', 'ия', 'ие', 'ии', 'ию', 'ья', 'ье', 'ью', 'ьи',
+    # Adjectives and participles
+    'ыми', 'ими', 'ого', 'его', 'ому', 'ему', 'ая', 'яя', 'ое', 'ее', 'ые', 'ий', 'ый',
+    'ую', 'юю', 'ых', 'их', 'ым', 'им',
+    # Verbs
+    'ться', 'тся', 'ешь', 'ете', 'ишь', 'ите', 'ить', 'ать', 'ять', 'еть', 'уть', 'ла', 'ли', 'ло',
+    'ть', 'ет', 'ит', 'ут', 'ют', 'ят', 'ем', 'им',
+    # Single letters last
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й'
+}, key=lambda suffix: (-len(suffix), suffix)))
+
+# Казахские окончания в порядке снятия с конца слова: падеж, принадлежность, множественное число
+KAZAKH_SUFFIX_GROUPS = (
+    # Case
+    ('ның', 'нің', 'дың', 'дің', 'тың', 'тің', 'нан', 'нен', 'дан', 'ден', 'тан', 'тен',
+     'нда', 'нде', 'ға', 'ге', 'қа', 'ке', 'на', 'не', 'ны', 'ні', 'ды', 'ді', 'ты', 'ті',
+     'да', 'де', 'та', 'те', 'мен', 'бен', 'пен', 'ша', 'ше'),
+    # Possessive
+    ('ымыз', 'іміз', 'мыз', 'міз', 'ыңыз', 'іңіз', 'ңыз', 'ңіз', 'сы', 'сі', 'ым', 'ім', 'ың', 'ің',
+     'ы', 'і'),
+    # Plural
+    ('лар', 'лер', 'дар', 'дер', 'тар', 'тер'),
+)
+
+RUSSIAN_STOPWORDS = frozenset(
+    'и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только '
+    'ее её мне было вот от меня еще ещё нет о об из ему когда даже ну ли если уже или ни быть '
+    'был него до вас вам там где есть надо ней для мы тебя их чем была сам без чего тоже '
+    'себе под будет тогда кто этот того этого какой какая какие ним здесь этом мой тем чтобы '
+    'можно при после над через эти нас про них много эту моя этой перед такой более между '
+    'мне мой могу хочу нужно подскажите пожалуйста скажите'.split())
+
+KAZAKH_STOPWORDS = frozenset(
+    'және мен бен пен да де та те бір бұл сол осы ол сен сіз біз олар не қалай қашан қайда '
+    'ма ме ба бе па пе ғой үшін туралы бойынша деген керек бар жоқ ал бірақ немесе әлде '
+    'маған саған сізге қандай қанша'.split())
+
+STOPWORDS = RUSSIAN_STOPWORDS | KAZAKH_STOPWORDS
+
+
+def fold(text: str) -> str:
+    """Case-insensitive form used on both sides of every comparison"""
+    return text.casefold().replace('ё', 'е')
+
+
+def tokenize(text: str) -> List[str]:
+    return _word_re.findall(fold(text))
+
+
+def is_kazakh(token: str) -> bool:
+    return any(char in KAZAKH_LETTERS for char in token)
+
+
+def _strip_russian(token: str) -> str:
+    for suffix in RUSSIAN_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM_LENGTH:
+            return token[:-len(suffix)]
+    return token
+
+
+def _strip_kazakh(token: str) -> str:
+    # Agglutinative: peel case, then possessive, then plural
+    for group in KAZAKH_SUFFIX_GROUPS:
+        for suffix in group:
+            if token.endswith(suffix) and len(token) - len(suffix) >= MIN_KAZAKH_STEM_LENGTH:
+                token = token[:-len(suffix)]
+                break
+    # Bare vowel endings (dative/possessive: кестеге -> кесте -> кест)
+    if token[-1:] in ('а', 'е', 'ы', 'і') and len(token) - 1 >= MIN_KAZAKH_STEM_LENGTH:
+        token = token[:-1]
+    return token
+
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem(token: str) -> str:
+    """Stem of one folded token.
+
+    The rules are chosen per token, not per request: Kazakh messages mix in
+    Russian words, and keywords have no language at all."""
+    if len(token) < MIN_KAZAKH_STEM_LENGTH + 1 or token.isdigit():
+        return token
+    if is_kazakh(token):
+        return _strip_kazakh(token)
+    return _strip_russian(token)
+
+
+def stems(text: str, keep_stopwords: bool = False) -> List[str]:
+    """Stems of the words of a text, in order"""
+    return [stem(token) for token in tokenize(text)
+            if keep_stopwords or token not in STOPWORDS]
+
+
+def search_terms(text: str, min_length: int = MIN_KAZAKH_STEM_LENGTH) -> List[str]:
+    """Distinct stems worth searching for, in order of appearance"""
+    seen = set()
+    terms = []
+    for term in stems(text):
+        if len(term) >= min_length and term not in seen:
+            seen.add(term)
+            terms.append(term)
+    return terms
+
+
+def normalize_phrase(text: str) -> str:
+    """Stems separated and surrounded by spaces. A keyword matches where
+    ' ' + normalize_keyword(keyword) occurs, i.e. as a word prefix"""
+    return ' ' + ' '.join(stems(text, keep_stopwords=True)) + ' '
+
+
+def normalize_keyword(keyword: str) -> str:
+    """Keyword in normalize_phrase form, with a leading space anchoring it to a
+    word start. Hand-truncated stems ('трудоустройств') stay prefixes"""
+    normalized = ' '.join(stems(keyword, keep_stopwords=True))
+    return ' ' + normalized if normalized else ''
+
+
+def normalize_keywords(keywords: Iterable[str]) -> Tuple[str, ...]:
+    return tuple(k for k in (normalize_keyword(keyword) for keyword in keywords) if k)
+
+
+def cache_info():
+    return stem.cache_info()
@@ -0,0 +1,151 @@
+# Бюджет токенов для сборки промпта
+# Offline token estimation and context trimming for prompt assembly
+
+import math
+import re
+from typing import Any, Dict, List, Optional
+
+from config import TokenBudgetConfig
+from text_normalizer import fold, search_terms
+
+_piece_re = re.compile(r'\w+|[^\w\s]', re.UNICODE)
+_sentence_re = re.compile(r'(?<=[.!?;])\s+')
+
+# Средняя длина токена: латиница кодируется плотнее кириллицы
+ASCII_CHARS_PER_TOKEN = 4.0
+OTHER_CHARS_PER_TOKEN = 2.5
+MESSAGE_OVERHEAD_TOKENS = 4  # Role and separators of each chat message
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate BPE token count without calling the provider"""
+    if not text:
+        return 0
+    count = 0
+    for piece in _piece_re.findall(text):
+        if len(piece) == 1:
+            count += 1
+        elif piece.isascii():
+            count += math.ceil(len(piece) / ASCII_CHARS_PER_TOKEN)
+        else:
+            count += math.ceil(len(piece) / OTHER_CHARS_PER_TOKEN)
+    return count
+
+
+def estimate_messages_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(estimate_tokens(m.get('content', '')) + MESSAGE_OVERHEAD_TOKENS
+               for m in messages)
+
+
+def query_terms(message: str) -> List[str]:
+    """Stems of the question words used to score passages (match against fold())"""
+    return search_terms(message)
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """Cut text at a sentence, then word boundary so it fits the budget"""
+    if estimate_tokens(text) <= budget:
+        return text
+    kept = []
+    used = 0
+    for sentence in _sentence_re.split(text):
+        cost = estimate_tokens(sentence)
+        if used + cost > budget:
+            break
+        kept.append(sentence)
+        used += cost
+    if not kept:
+        words = []
+        for word in text.split():
+            used += estimate_tokens(word)
+            if used > budget:
+                break
+            words.append(word)
+        return " ".join(words) + "…" if words else ""
+    return " ".join(kept) + " …"
+
+
+def select_passages(content: str, terms: List[str], budget: int) -> str:
+    """Keep the paragraphs that mention the question, in original order"""
+    paragraphs = [p.strip() for p in re.split(r'\n\s*\n|\n', content) if p.strip()]
+    if not paragraphs:
+        return ""
+    scored = []
+    for index, paragraph in enumerate(paragraphs):
+        folded = fold(paragraph)
+        score = sum(1 for term in terms if term in folded)
+        scored.append((score, index, paragraph))
+
+    # Without any matches the beginning of an entry is the best summary
+    if any(score for score, _, _ in scored):
+        scored.sort(key=lambda item: (-item[0], item[1]))
+
+    chosen = []
+    used = 0
+    for score, index, paragraph in scored:
+        cost = estimate_tokens(paragraph)
+        if used + cost > budget:
+            if not chosen:
+                chosen.append((index, truncate_to_tokens(paragraph, budget)))
+            break
+        chosen.append((index, paragraph))
+        used += cost
+    chosen.sort()
+    return "\n".join(paragraph for _, paragraph in chosen)
+
+
+class TokenBudget:
+    """Per-agent prompt budget and completion length"""
+
+    def __init__(self, prompt_budget: int, max_tokens: int,
+                 max_entries: int = None, min_part_tokens: int = None):
+        self.prompt_budget = prompt_budget
+        self.max_tokens = max_tokens
+        self.max_entries = max_entries or TokenBudgetConfig.MAX_CONTEXT_ENTRIES
+        self.min_part_tokens = min_part_tokens or TokenBudgetConfig.MIN_PART_TOKENS
+
+    @classmethod
+    def for_agent(cls, agent_type: str) -> 'TokenBudget':
+        return cls(
+            TokenBudgetConfig.AGENT_PROMPT_BUDGETS.get(agent_type, TokenBudgetConfig.PROMPT_TOKEN_BUDGET),
+            TokenBudgetConfig.AGENT_MAX_TOKENS.get(agent_type, TokenBudgetConfig.COMPLETION_MAX_TOKENS)
+        )
+
+    def context_budget(self, system_prompt: str, message: str) -> int:
+        """Tokens left for knowledge context after the fixed prompt parts"""
+        fixed = (estimate_tokens(system_prompt) + estimate_tokens(message)
+                 + 2 * MESSAGE_OVERHEAD_TOKENS + 16)
+        return max(0, self.prompt_budget - fixed)
+
+    def fit_context(self, message: str, parts: List[Dict[str, Any]],
+                    budget: int) -> str:
+        """Build context from ranked parts ({'title', 'content'}) within budget"""
+        terms = query_terms(message)
+        sections = []
+        used = 0
+        for part in parts[:self.max_entries]:
+            header = f"**{part['title']}**\n"
+            header_cost = estimate_tokens(header)
+            content = part.get('content') or ''
+            cost = header_cost + estimate_tokens(content)
+            remaining = budget - used
+            if cost <= remaining:
+                sections.append(header + content)
+                used += cost
+                continue
+            # Длинная запись: берём только релевантные абзацы
+            if remaining - header_cost >= self.min_part_tokens:
+                trimmed = select_passages(content, terms, remaining - header_cost)
+                if trimmed:
+                    sections.append(header + trimmed)
+            break
+        return "\n\n".join(sections)
+
+
+def usage_from_response(data: Optional[Dict[str, Any]]) -> Dict[str, Optional[int]]:
+    """prompt/completion token counts reported by the provider"""
+    usage = (data or {}).get('usage') or {}
+    return {
+        'prompt_tokens': usage.get('prompt_tokens'),
+        'completion_tokens': usage.get('completion_tokens')
+    }
@@ -0,0 +1,421 @@
+# Векторный индекс фрагментов базы знаний: локальные эмбеддинги и косинусная близость
+# Dense-vector index over knowledge chunks with batched cosine top-k in NumPy
+
+import base64
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from ann_index import IVFIndex
+from config import SearchConfig
+from index_journal import IndexJournal, new_generation
+from intent_classifier import hashed_ngrams
+from knowledge_events import on_knowledge_change
+from text_normalizer import stems
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional: vector search is then unavailable
+    np = None
+
+logger = logging.getLogger(__name__)
+
+INITIAL_TAIL_ROWS = 1024
+
+
+class HashedNgramEmbedder:
+    """CPU-only stand-in for an embedding model: signed hashed char n-grams
+    of the stemmed text, sublinear and L2-normalized.
+
+    Feature hashing is a random projection of the n-gram counts, so cosine
+    similarity approximates shared word pieces across inflected forms."""
+
+    def __init__(self, dim: int = 256, ngram_min: int = 3, ngram_max: int = 5):
+        self.dim = dim
+        self.ngram_min = ngram_min
+        self.ngram_max = ngram_max
+        self.name = f"hashed-ngrams-{dim}-{ngram_min}-{ngram_max}"
+
+    def embed(self, texts: Sequence[str]):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            counts = hashed_ngrams(' '.join(stems(text or '')), self.dim, self.ngram_min, self.ngram_max)
+            if counts:
+                values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+                matrix[row, np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))] = (
+                    np.sign(values) * np.log1p(np.abs(values)))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+def load_embedder(spec: str, dim: int):
+    """'hashed' or 'package.module:factory'; the factory gets dim and returns an
+    object with name, dim and embed(texts) -> unit float32 rows"""
+    if spec == 'hashed':
+        return HashedNgramEmbedder(dim)
+    module_name, _, attribute = spec.partition(':')
+    return getattr(importlib.import_module(module_name), attribute)(dim)
+
+
+class VectorIndex:
+    """Unit vectors of knowledge chunks in row-major matrices with parallel id arrays.
+
+    The saved matrix is memory-mapped read-only, so workers share its pages;
+    vectors added afterwards go to an in-memory tail that doubles when full.
+    Deleted rows are masked until the next save. Memory is rows x dim x
+    itemsize plus one block of float32 scores per search."""
+
+    def __init__(self, dim: int, dtype: str = 'float32', embedder_name: str = '',
+                 base=None, base_ids=None):
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.embedder_name = embedder_name
+        self.watermark: Optional[datetime] = None
+        self.generation: Optional[str] = None  # Of the saved files this index was loaded from
+        if base is None:
+            base, base_ids = np.zeros((0, dim), dtype=self.dtype), np.zeros(0, dtype=np.int64)
+        # Segments are (matrix, ids, alive, size) and replaced, never resized, under readers
+        self._base = (base, base_ids, np.ones(len(base_ids), dtype=bool), len(base_ids))
+        self._tail = (np.zeros((0, dim), dtype=self.dtype), np.zeros(0, dtype=np.int64),
+                      np.zeros(0, dtype=bool), 0)
+        self._rows: Dict[int, Tuple[int, int]] = {int(row_id): (0, position)
+                                                  for position, row_id in enumerate(base_ids)}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def ids(self) -> Set[int]:
+        return self._rows.keys()
+
+    def _segment(self, number: int):
+        return self._base if number == 0 else self._tail
+
+    def remove(self, row_ids: Iterable[int]):
+        for row_id in row_ids:
+            location = self._rows.pop(row_id, None)
+            if location is not None:
+                self._segment(location[0])[2][location[1]] = False
+
+    def add(self, row_ids: Sequence[int], vectors):
+        """Insert or replace rows; vectors are unit float32 rows"""
+        if not len(row_ids):
+            return
+        self.remove(row_ids)
+        matrix, ids, alive, size = self._tail
+        needed = size + len(row_ids)
+        if needed > len(ids):
+            capacity = max(INITIAL_TAIL_ROWS, len(ids) * 2, needed)
+            grown = np.zeros((capacity, self.dim), dtype=self.dtype)
+            grown_ids = np.zeros(capacity, dtype=np.int64)
+            grown_alive = np.zeros(capacity, dtype=bool)
+            grown[:size], grown_ids[:size], grown_alive[:size] = matrix[:size], ids[:size], alive[:size]
+            matrix, ids, alive = grown, grown_ids, grown_alive
+        matrix[size:needed] = vectors
+        ids[size:needed] = row_ids
+        alive[size:needed] = True
+        self._tail = (matrix, ids, alive, needed)
+        for position, row_id in enumerate(row_ids, start=size):
+            self._rows[int(row_id)] = (1, position)
+
+    def search(self, queries, k: int = 5, block_rows: int = 16384) -> List[List[Tuple[int, float]]]:
+        """Top-k (row id, cosine) for each unit query vector of a (b, dim) batch"""
+        queries = np.asarray(queries, dtype=np.float32)
+        batch = len(queries)
+        scores_parts: List[Any] = []
+        ids_parts: List[Any] = []
+        for matrix, ids, alive, size in (self._base, self._tail):
+            for start in range(0, size, block_rows):
+                end = min(start + block_rows, size)
+                # One float32 block at a time keeps the working set bounded
+                block = np.asarray(matrix[start:end], dtype=np.float32)
+                scores = block @ queries.T
+                scores[~alive[start:end]] = -np.inf
+                take = min(k, end - start)
+                top = np.argpartition(-scores, take - 1, axis=0)[:take]
+                scores_parts.append(np.take_along_axis(scores, top, axis=0))
+                ids_parts.append(ids[start:end][top])
+        if not scores_parts:
+            return [[] for _ in range(batch)]
+
+        scores = np.concatenate(scores_parts)
+        ids = np.concatenate(ids_parts)
+        results = []
+        for column in range(batch):
+            order = np.argsort(-scores[:, column], kind='stable')[:k]
+            results.append([(int(ids[row, column]), float(scores[row, column]))
+                            for row in order if np.isfinite(scores[row, column])])
+        return results
+
+    def save(self, prefix: str):
+        """Write live rows as {prefix}.vectors.npy / .ids.npy, then the metadata"""
+        matrices, id_arrays = [], []
+        for matrix, ids, alive, size in (self._base, self._tail):
+            mask = alive[:size]
+            matrices.append(np.asarray(matrix[:size][mask], dtype=self.dtype))
+            id_arrays.append(ids[:size][mask])
+        vectors = np.concatenate(matrices)
+        ids = np.concatenate(id_arrays)
+
+        for suffix, values in (('vectors', vectors), ('ids', ids)):
+            tmp_path = f'{prefix}.{suffix}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, values)
+            os.replace(tmp_path, f'{prefix}.{suffix}.npy')
+        # Written last: a reader checks the row count against the arrays
+        tmp_path = f'{prefix}.meta.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'embedder': self.embedder_name, 'dim': self.dim, 'dtype': self.dtype.name,
+                       'rows': len(ids),
+                       'watermark': self.watermark.isoformat() if self.watermark else None,
+                       'generation': self.generation}, f)
+        os.replace(tmp_path, f'{prefix}.meta.json')
+
+    @classmethod
+    def load(cls, prefix: str) -> 'VectorIndex':
+        with open(f'{prefix}.meta.json', encoding='utf-8') as f:
+            meta = json.load(f)
+        vectors = np.load(f'{prefix}.vectors.npy', mmap_mode='r', allow_pickle=False)
+        ids = np.load(f'{prefix}.ids.npy', allow_pickle=False)
+        if vectors.shape != (meta['rows'], meta['dim']) or len(ids) != meta['rows']:
+            raise ValueError(f"{prefix}: arrays do not match the metadata")
+        index = cls(meta['dim'], meta['dtype'], meta['embedder'], vectors, ids)
+        index.watermark = datetime.fromisoformat(meta['watermark']) if meta['watermark'] else None
+        index.generation = meta.get('generation')
+        return index
+
+    def get_stats(self) -> Dict[str, Any]:
+        base, tail = self._base, self._tail
+        return {
+            'rows': len(self._rows),
+            'mapped_rows': base[3],
+            'tail_rows': tail[3],
+            'tail_capacity': len(tail[1]),
+            'dim': self.dim,
+            'dtype': self.dtype.name,
+            'bytes': int(base[0].nbytes + tail[0].nbytes)
+        }
+
+
+class VectorStore:
+    """Owns this process's vector index; same lifecycle as the BM25 store:
+    load the saved matrix, replay the journal of embedded changes, catch up
+    through updated_at deltas, apply ingestion in place. Chunks are embedded
+    once, when they are indexed; the matrix is rewritten (and IVF centroids
+    possibly retrained) only after checkpoint_rows journaled changes.
+
+    index_type 'ivf' keeps the vectors in an ann_index.IVFIndex instead of
+    scanning all of them."""
+
+    def __init__(self, prefix: Optional[str] = None, embedder_spec: str = 'hashed', dim: int = 256,
+                 dtype: str = 'float32', refresh_interval: float = 30, block_rows: int = 16384,
+                 index_type: str = 'flat', ivf_lists: int = 0, ivf_nprobe: int = 8,
+                 checkpoint_rows: int = 2000):
+        self.prefix = prefix
+        self.checkpoint_rows = checkpoint_rows
+        self.journal = IndexJournal(f'{prefix}.journal') if prefix else None
+        self.embedder_spec = embedder_spec
+        self.dim = dim
+        self.dtype = dtype
+        self.index_type = index_type
+        self.ivf_lists = ivf_lists
+        self.ivf_nprobe = ivf_nprobe
+        self.refresh_interval = refresh_interval
+        self.block_rows = block_rows
+        self._embedder = None
+        self._index: Optional[VectorIndex] = None
+        self._version = 0
+        self._synced_version = -1
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'builds': 0, 'loads': 0, 'syncs': 0, 'rows_embedded': 0, 'saves': 0,
+                      'journal_replayed': 0}
+
+    @property
+    def available(self) -> bool:
+        return np is not None
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            self._embedder = load_embedder(self.embedder_spec, self.dim)
+        return self._embedder
+
+    def invalidate(self):
+        self._version += 1
+
+    def index(self) -> VectorIndex:
+        """Current index; must be called inside an app context"""
+        index = self._index
+        now = time.monotonic()
+        if (index is not None and self._synced_version == self._version
+                and now - self._checked_at < self.refresh_interval):
+            return index
+
+        # Only the first load waits; later syncs never block readers
+        if not self._lock.acquire(blocking=index is None):
+            return index
+        try:
+            version = self._version
+            if self._index is None:
+                self._index = self._open()
+            elif self._sync(self._index):
+                self._checkpoint()
+            self._synced_version = version
+            self._checked_at = now
+            return self._index
+        finally:
+            self._lock.release()
+
+    def _new_index(self) -> VectorIndex:
+        if self.index_type == 'ivf':
+            return IVFIndex(self.embedder.dim, self.dtype, self.embedder.name,
+                            lists=self.ivf_lists, nprobe=self.ivf_nprobe)
+        return VectorIndex(self.embedder.dim, self.dtype, self.embedder.name)
+
+    def _load(self) -> VectorIndex:
+        if self.index_type == 'ivf':
+            return IVFIndex.load(self.prefix, lists=self.ivf_lists, nprobe=self.ivf_nprobe)
+        return VectorIndex.load(self.prefix)
+
+    def _open(self) -> VectorIndex:
+        if self.prefix and os.path.exists(f'{self.prefix}.meta.json'):
+            try:
+                index = self._load()
+                if index.embedder_name == self.embedder.name:
+                    self.stats['loads'] += 1
+                    self._replay(index)
+                    self._sync(index)
+                    if self.journal.rows >= self.checkpoint_rows:
+                        index = self._save(index)
+                    logger.info(f"Vector index loaded from {self.prefix}: {len(index)} chunks")
+                    return index
+                logger.info(f"Vector index {self.prefix} was built by another embedder, rebuilding")
+            except Exception as e:
+                logger.error(f"Error loading vector index from {self.prefix}, rebuilding: {str(e)}")
+        index = self._new_index()
+        self._sync(index)
+        self.stats['builds'] += 1
+        index = self._save(index)
+        logger.info(f"Vector index built: {len(index)} chunks")
+        return index
+
+    def _checkpoint(self):
+        """Rewrite the files once the journal has grown past checkpoint_rows"""
+        if self.journal is not None and self.journal.rows >= self.checkpoint_rows:
+            self._index = self._save(self._index)
+
+    def _save(self, index: VectorIndex) -> VectorIndex:
+        """Persist as a new generation, truncate the journal and switch to the
+        memory-mapped copy, releasing the tail"""
+        if not self.prefix:
+            return index
+        previous, index.generation = index.generation, new_generation()
+        try:
+            index.save(self.prefix)
+            self.stats['saves'] += 1
+            self.journal.reset()
+            return self._load()
+        except OSError as e:
+            index.generation = previous
+            logger.error(f"Error saving vector index to {self.prefix}: {str(e)}")
+            return index
+
+    def _journal(self, index: VectorIndex, removed: Sequence[int] = (), ids: Sequence[int] = (),
+                 vectors=None, watermark: bool = False):
+        if self.journal is None or not (len(removed) or len(ids) or watermark):
+            return
+        record: Dict[str, Any] = {'removed': [int(row_id) for row_id in removed],
+                                  'ids': [int(row_id) for row_id in ids]}
+        if vectors is not None:
+            record['vectors'] = base64.b64encode(np.asarray(vectors, dtype='<f4').tobytes()).decode('ascii')
+        if watermark:
+            record['watermark'] = index.watermark.isoformat() if index.watermark else None
+        self.journal.append(index.generation, record, len(removed) + len(ids))
+
+    def _replay(self, index: VectorIndex):
+        """Apply the journaled changes, with their embeddings, made after the files were saved"""
+        replayed = 0
+        for record in self.journal.replay(index.generation):
+            index.remove(record['removed'])
+            if record['ids']:
+                vectors = np.frombuffer(base64.b64decode(record['vectors']), dtype='<f4')
+                index.add(record['ids'], vectors.reshape(len(record['ids']), index.dim))
+            if 'watermark' in record:
+                index.watermark = datetime.fromisoformat(record['watermark']) if record['watermark'] else None
+            replayed += record['rows']
+        self.stats['journal_replayed'] += replayed
+
+    def _put(self, index: VectorIndex, rows: List[Tuple[int, Optional[str]]]):
+        if rows:
+            ids = [row_id for row_id, _ in rows]
+            vectors = self.embedder.embed([text for _, text in rows])
+            index.add(ids, vectors)
+            self._journal(index, ids=ids, vectors=vectors)
+            self.stats['rows_embedded'] += len(rows)
+
+    def _remove(self, index: VectorIndex, row_ids: Sequence[int]):
+        index.remove(row_ids)
+        self._journal(index, removed=row_ids)
+
+    def _sync(self, index: VectorIndex) -> int:
+        from database_utils import sync_changed_rows
+        from models import KnowledgeBase
+
+        index.watermark, touched = sync_changed_rows(
+            KnowledgeBase, ('content_chunk',), index.watermark, index.ids,
+            lambda rows: self._put(index, [(row.id, row.content_chunk) for row in rows]),
+            lambda row_ids: self._remove(index, row_ids))
+        if touched:
+            self._journal(index, watermark=True)
+        self.stats['syncs'] += 1
+        return touched
+
+    def apply(self, removed: Iterable[int] = (), added: Iterable[Tuple[int, str]] = ()):
+        """Embed and index chunks at ingestion time in this process, journaled at once"""
+        if self._index is None:
+            return  # Not in use in this process
+        with self._lock:
+            self._remove(self._index, list(removed))
+            self._put(self._index, list(added))
+            self._checkpoint()
+
+    def search(self, texts: Sequence[str], k: int = 5) -> List[List[Tuple[int, float]]]:
+        """Batched top-k (chunk id, cosine) for query texts"""
+        index = self.index()
+        return index.search(self.embedder.embed(texts), k, self.block_rows)
+
+    def get_stats(self) -> Dict[str, Any]:
+        index = self._index
+        return dict(self.stats, loaded=index is not None, index_type=self.index_type,
+                    journal_rows=self.journal.rows if self.journal else 0,
+                    **(index.get_stats() if index else {}))
+
+
+_vector_store = VectorStore(prefix=SearchConfig.VECTOR_INDEX_PATH,
+                            embedder_spec=SearchConfig.VECTOR_EMBEDDER,
+                            dim=SearchConfig.VECTOR_DIM,
+                            dtype=SearchConfig.VECTOR_DTYPE,
+                            refresh_interval=SearchConfig.SEARCH_INDEX_REFRESH_INTERVAL,
+                            block_rows=SearchConfig.VECTOR_BLOCK_ROWS,
+                            index_type=SearchConfig.VECTOR_INDEX_TYPE,
+                            ivf_lists=SearchConfig.VECTOR_IVF_LISTS,
+                            ivf_nprobe=SearchConfig.VECTOR_IVF_NPROBE,
+                            checkpoint_rows=SearchConfig.SEARCH_INDEX_CHECKPOINT_ROWS)
+
+
+def get_vector_store() -> VectorStore:
+    return _vector_store
+
+
+def _invalidate_on_knowledge_change(tables: Set[str]):
+    if 'knowledge_base' in tables:
+        _vector_store.invalidate()
+
+
+on_knowledge_change(_invalidate_on_knowledge_change)
@@ -1,13 +1,19 @@
 # Импорт необходимых модулей
+import os
+import threading
 import time
 import logging
+import uuid
 from datetime import datetime
-from flask import Blueprint, render_template, request, jsonify, session, Response
+from flask import Blueprint, render_template, request, jsonify, session, Response, stream_with_context
+import json
 import requests
 import base64
 from sqlalchemy import func, desc
 from datetime import datetime, timedelta
 
+from conversation_memory import get_conversation_memory
+
 
 # Настройка логирования
 logger = logging.getLogger(__name__)
@@ -17,14 +23,26 @@ main_bp = Blueprint('views', __name__)
 
 # Инициализация роутера агентов (выполним позже, чтобы избежать circular import)
 agent_router = None
+_agent_router_pid = None
+_agent_router_lock = threading.Lock()
 
 def initialize_agent_router():
-    """Initialize agent router after app context is available"""
-    global agent_router
-    if agent_router is None:
-        from agents import AgentRouter
-        agent_router = AgentRouter()
-    return agent_router
+    """Process-wide agent router, created once even under concurrent first requests.
+
+    A router built before fork (preloaded app) is kept by the workers, so
+    they do not construct the agents again."""
+    global agent_router, _agent_router_pid
+    router = agent_router
+    if router is not None and _agent_router_pid == os.getpid():
+        return router
+    with _agent_router_lock:
+        if agent_router is None:
+            from agents import AgentRouter
+            agent_router = AgentRouter()
+        elif _agent_router_pid != os.getpid():
+            agent_router.registry.after_fork()
+        _agent_router_pid = os.getpid()
+        return agent_router
 
 
 @main_bp.route('/')
@@ -62,6 +80,17 @@ def widget_demo():
     return render_template('widget-demo.html')
 
 
+def _chat_session_id() -> str:
+    """Conversation id from the signed cookie session, else a new one.
+
+    An id sent in the request body is ignored: it would let a client read
+    and extend another user's conversation."""
+    session_id = session.get('session_id')
+    if not session_id:
+        session_id = session['session_id'] = uuid.uuid4().hex
+    return session_id
+
+
 @main_bp.route('/api/chat', methods=['POST'])
 @main_bp.route('/chat', methods=['POST'])
 def chat():
@@ -83,6 +112,11 @@ def chat():
 
         start_time = time.time()
 
+        # Earlier turns of this conversation
+        session_id = _chat_session_id()
+        memory = get_conversation_memory()
+        history = memory.context(session_id)
+
         # Initialize router within app context
         router = initialize_agent_router()
 
@@ -90,19 +124,21 @@ def chat():
             # Find agent with required type
             for agent in router.agents:
                 if getattr(agent, "agent_type", None) and (agent.agent_type == agent_type):
-                    result = agent.process_message(user_message, language)
+                    # Agent chosen by the user: no routing needed
+                    result = agent.process_message(user_message, language, confidence=1.0, history=history)
                     result['agent_type'] = agent.agent_type
                     result['agent_name'] = agent.name
-                    result['confidence'] = 1.0
                     break
             else:
                 # Если не найден — fallback на авто-выбор
-                result = router.route_message(user_message, language)
+                result = router.route_message(user_message, language, history)
         else:
             # Автоматический выбор агента
-            result = router.route_message(user_message, language)
+            result = router.route_message(user_message, language, history)
 
         response_time = time.time() - start_time
+        if not result.get('fallback'):
+            memory.record(session_id, user_message, result['response'], result.get('agent_type'))
 
         # Create UserQuery within app context
         user_query = UserQuery(
@@ -114,14 +150,24 @@ def chat():
             agent_name=result.get('agent_name'),
             agent_confidence=result.get('confidence', 0.0),
             context_used=result.get('context_used', False),
-            session_id=session.get('session_id', ''),
+            cache_hit=result.get('cache_hit', False),
+            fallback=bool(result.get('fallback')),
+            semantic_source_id=result.get('semantic_source_id'),
+            prompt_tokens=result.get('prompt_tokens'),
+            completion_tokens=result.get('completion_tokens'),
+            session_id=session_id,
             ip_address=request.remote_addr,
             user_agent=request.headers.get('User-Agent', '')
         )
 
+        query_id = None
         try:
             db.session.add(user_query)
+            # The id is known after the INSERT; reading it after commit would reload the row
+            db.session.flush()
+            saved_id = user_query.id
             db.session.commit()
+            query_id = saved_id
         except Exception as db_error:
             logger.warning(f"Database error (continuing without saving): {str(db_error)}")
             # Continue without saving to database
@@ -140,7 +186,9 @@ def chat():
             'agent_name': result.get('agent_name'),
             'agent_type': result.get('agent_type'),
             'confidence': result.get('confidence', 0.0),
-            'query_id': getattr(user_query, 'id', None)  # Include query ID for rating functionality
+            'cache_hit': result.get('cache_hit', False),
+            'session_id': session_id,
+            'query_id': query_id  # Include query ID for rating functionality
         })
 
     except Exception as e:
@@ -150,10 +198,165 @@ def chat():
         error_message = "Извините, произошла ошибка. Попробуйте еще раз." if lang == 'ru' else "Кешіріңіз, қате орын алды. Қайталап көріңіз."
         return jsonify({'success': False, 'error': error_message}), 500
 
+def _sse_event(data: dict, event: str = None) -> str:
+    """Format a Server-Sent Events message"""
+    payload = json.dumps(data, ensure_ascii=False)
+    if event:
+        return f"event: {event}\ndata: {payload}\n\n"
+    return f"data: {payload}\n\n"
+
+
+@main_bp.route('/api/chat/stream', methods=['POST'])
+def chat_stream():
+    """Chat endpoint that relays response tokens as Server-Sent Events"""
+    from models import UserQuery
+    from app import db
+
+    data = request.get_json(silent=True)
+    if not data or 'message' not in data:
+        return jsonify({'success': False, 'error': 'Сообщение не найдено'}), 400
+
+    user_message = data['message'].strip()
+    language = data.get('language', 'ru')
+    agent_type = data.get('agent') or data.get('agent_type')
+
+    if not user_message:
+        return jsonify({'success': False, 'error': 'Пустое сообщение'}), 400
+
+    start_time = time.time()
+    session_id = _chat_session_id()
+    memory = get_conversation_memory()
+    history = memory.context(session_id)
+    router = initialize_agent_router()
+
+    agent = router.get_agent(agent_type) if agent_type and agent_type != 'auto' else None
+    if agent:
+        result = agent.stream_message(user_message, language, confidence=1.0, history=history)
+    else:
+        result = router.route_message_stream(user_message, language, history)
+
+    def generate():
+        tokens = []
+        yield _sse_event({
+            'agent_name': result.get('agent_name'),
+            'agent_type': result.get('agent_type'),
+            'confidence': result.get('confidence', 0.0),
+            'session_id': session_id
+        }, event='meta')
+
+        try:
+            for token in result.get('stream', []):
+                tokens.append(token)
+                yield _sse_event({'token': token})
+        except Exception as e:
+            logger.error(f"Error while streaming chat response: {str(e)}")
+            error_message = "Извините, произошла ошибка. Попробуйте еще раз." if language == 'ru' else "Кешіріңіз, қате орын алды. Қайталап көріңіз."
+            yield _sse_event({'error': error_message}, event='error')
+            return
+
+        response_text = "".join(tokens).strip()
+        response_time = time.time() - start_time
+        usage = result.get('usage') or {}
+        # The provider stream reports canned text and broken streams through usage
+        fallback = bool(result.get('fallback') or usage.get('fallback'))
+        if not fallback:
+            memory.record(session_id, user_message, response_text, result.get('agent_type'))
+
+        # The query is logged once the whole answer has been streamed
+        user_query = UserQuery(
+            user_message=user_message,
+            bot_response=response_text,
+            language=language,
+            response_time=response_time,
+            agent_type=result.get('agent_type'),
+            agent_name=result.get('agent_name'),
+            agent_confidence=result.get('confidence', 0.0),
+            context_used=result.get('context_used', False),
+            cache_hit=result.get('cache_hit', False),
+            fallback=fallback,
+            semantic_source_id=result.get('semantic_source_id'),
+            prompt_tokens=usage.get('prompt_tokens'),
+            completion_tokens=usage.get('completion_tokens'),
+            session_id=session_id,
+            ip_address=request.remote_addr,
+            user_agent=request.headers.get('User-Agent', '')
+        )
+
+        query_id = None
+        try:
+            db.session.add(user_query)
+            db.session.flush()
+            saved_id = user_query.id
+            db.session.commit()
+            query_id = saved_id
+        except Exception as db_error:
+            logger.warning(f"Database error (continuing without saving): {str(db_error)}")
+            db.session.rollback()
+
+        logger.info(
+            f"Chat stream finished in {response_time:.2f}s "
+            f"by {result.get('agent_name', 'Unknown')} agent "
+            f"for language: {language}"
+        )
+
+        yield _sse_event({
+            'response_time': response_time,
+            'query_id': query_id
+        }, event='done')
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Disable proxy buffering (nginx)
+        }
+    )
+
+
 @main_bp.route('/api/health')
 def health_check():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'timestamp': time.time()})
+    from mistral_client import get_provider_health
+
+    # Открытый circuit breaker не делает сервис недоступным: отвечаем fallback-ом
+    llm = get_provider_health()
+    status = 'healthy' if llm['circuit']['state'] == 'closed' else 'degraded'
+    return jsonify({'status': status, 'timestamp': time.time(), 'llm': llm})
+
+
+@main_bp.route('/api/metrics')
+def metrics():
+    """Runtime metrics of the LLM call path (queue, caches, provider)"""
+    from mistral_client import get_coalescing_stats, get_limiter, get_provider_health
+    from completion_cache import get_completion_cache
+    from semantic_cache import get_semantic_cache
+    from knowledge_snapshot import get_knowledge_store
+    from bulkhead import get_bulkhead_group
+    from bm25_index import get_bm25_store
+    from search_backend import get_search_backend
+    from vector_index import get_vector_store
+    from retrieval import get_retriever
+    import db_round_trips
+
+    return jsonify({
+        'timestamp': time.time(),
+        'llm_queue': get_limiter().get_stats(),
+        'llm_provider': get_provider_health(),
+        'coalescing': get_coalescing_stats(),
+        'completion_cache': get_completion_cache().get_stats(),
+        'semantic_cache': get_semantic_cache().get_stats(),
+        'knowledge_snapshot': get_knowledge_store().get_stats(),
+        'conversation_memory': get_conversation_memory().get_stats(),
+        'agents': {agent.agent_type: agent.bulkhead.get_stats()
+                   for agent in initialize_agent_router().agents},
+        'agent_load': get_bulkhead_group().get_stats(),
+        'agent_registry': initialize_agent_router().registry.get_stats(),
+        'search': {'backend': get_search_backend().name, 'bm25': get_bm25_store().get_stats(),
+                   'vectors': get_vector_store().get_stats()},
+        'retrieval': get_retriever().get_stats(),
+        'db_round_trips': db_round_trips.get_stats()
+    })
 
 
 @main_bp.route('/api/agents')
@@ -198,6 +401,20 @@ def rate_response(query_id):
         try:
             db.session.commit()
             logger.info(f"Query {query_id} rated as {rating}")
+
+            # Liked answers are reused for paraphrased questions, disliked ones never
+            from semantic_cache import get_semantic_cache
+            semantic_cache = get_semantic_cache()
+            if rating == 'like':
+                semantic_cache.add(query.id, query.agent_type, query.language,
+                                   query.user_message, query.bot_response,
+                                   fallback=bool(query.fallback))
+            else:
+                semantic_cache.evict(query.id)
+                # The disliked answer may be a reuse of another liked answer
+                if query.semantic_source_id:
+                    semantic_cache.evict(query.semantic_source_id)
+
             return jsonify({
                 'success': True,
                 'rating': rating,
@@ -262,7 +479,10 @@ def process_voice_message():
 
         # Process through existing chat system
         router = initialize_agent_router()
-        result = router.route_message(text_message, language)
+        memory = get_conversation_memory()
+        result = router.route_message(text_message, language, memory.context(session_id))
+        if not result.get('fallback'):
+            memory.record(session_id, text_message, result['response'], result.get('agent_type'))
 
         # Log the voice interaction
         from models import UserQuery
@@ -275,6 +495,11 @@ def process_voice_message():
             agent_type=result.get('agent_type'),
             agent_name=result.get('agent_name'),
             agent_confidence=result.get('confidence', 0.0),
+            cache_hit=result.get('cache_hit', False),
+            fallback=bool(result.get('fallback')),
+            semantic_source_id=result.get('semantic_source_id'),
+            prompt_tokens=result.get('prompt_tokens'),
+            completion_tokens=result.get('completion_tokens'),
             session_id=session_id,
             ip_address=request.remote_addr,
             user_agent='Voice Chat API'